@@ -0,0 +1,251 @@
+"""
+Admission control by request cost class.
+
+A gthread worker has a fixed number of threads.  If every one of them is
+drawing an 18x9-inch comparison plot, memory spikes and a pixel lookup
+that takes a millisecond waits behind seconds of rendering.  Endpoints
+are therefore grouped into cost classes (see ``ENDPOINT_COSTS`` in
+app/main.py), and each limited class gets:
+
+* ``limit``    -- requests of the class that may run at once,
+* ``queue``    -- further requests that may wait for a slot,
+* ``deadline`` -- seconds a request may wait before it is shed.
+
+A request beyond the queue, or one whose deadline passes, is rejected
+with :class:`Overloaded`, which the Flask app turns into ``503`` with
+``Retry-After``.  Unlimited classes (cheap lookups) are never queued, so
+the threads the heavy classes cannot take stay free for them.  Limits
+are per gunicorn worker.
+
+The Flask app only makes the request's class current (:func:`use`); the
+slot is taken by :func:`admitted` around the real computation, so
+precomputed artifacts, cache hits and requests that share an identical
+in-flight render never queue or get shed.
+"""
+
+import contextlib
+import contextvars
+import os
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+from app import metrics
+
+
+# Limited classes and their "limit,queue,deadline", overridden per class by
+# DIP_ADMISSION_<CLASS>.  Together they hold at most 6 of the 8 threads of
+# a gunicorn.conf.py worker.
+DEFAULT_LIMITS = {
+    'render': '2,1,10',      # matplotlib figures and batch runs
+    'compute': '2,1,5',      # full-image numpy pipelines
+}
+
+
+_current = contextvars.ContextVar('cost_class', default=None)
+
+
+class Overloaded(Exception):
+    """Raised when a request is not admitted; carries a Retry-After hint."""
+
+    def __init__(self, cost_class, retry_after):
+        super().__init__(f"{cost_class} requests are over capacity, "
+                         f"retry after {retry_after}s")
+        self.cost_class = cost_class
+        self.retry_after = retry_after
+
+
+def parse_limits(text):
+    """
+    Parse ``"limit,queue,deadline"`` (e.g. ``"2,1,10"``) into a tuple.
+
+    ``"off"`` (or an empty string) returns None: the class is unlimited.
+    """
+    if text.strip().lower() in ('', 'off'):
+        return None
+    limit, queue, deadline = text.split(',')
+    limit, queue, deadline = int(limit), int(queue), float(deadline)
+    if limit < 1 or queue < 0 or deadline < 0:
+        raise ValueError(f"bad admission limits {text!r}: "
+                         "need limit >= 1, queue >= 0, deadline >= 0")
+    return limit, queue, deadline
+
+
+def classes_from_env():
+    """The limited :class:`CostClass` objects configured for this process."""
+    classes = []
+    for name, default in DEFAULT_LIMITS.items():
+        limits = parse_limits(os.environ.get(f'DIP_ADMISSION_{name.upper()}', default))
+        if limits is not None:
+            classes.append(CostClass(name, *limits))
+    return classes
+
+
+def check_workers(classes, worker_class, threads):
+    """
+    Return a warning if the limits cannot protect cheap requests, else None.
+
+    Only threaded (gthread) workers run several requests at once, and
+    they keep a thread free for cheap requests only while the limited
+    classes' slots and queues add up to fewer than ``threads``.
+    """
+    if not classes:
+        return None
+    if worker_class != 'gthread' or threads <= 1:
+        return (f"admission control needs gthread workers with several threads "
+                f"(have {worker_class}, threads={threads})")
+    held = sum(cost.limit + cost.max_queue for cost in classes)
+    if held >= threads:
+        return (f"admission limits and queues hold {held} threads of {threads}: "
+                "none are left for cheap requests")
+    return None
+
+
+def use(cost):
+    """Make *cost* (a :class:`CostClass` or None) current; returns a token."""
+    return _current.set(cost)
+
+
+def reset(token):
+    _current.reset(token)
+
+
+@contextlib.contextmanager
+def admitted():
+    """
+    Hold a slot of the current cost class while the block runs.
+
+    Raises :class:`Overloaded` if none can be had.  Without a current
+    class the block just runs; work nested in the block runs under the
+    slot already held.
+    """
+    cost = _current.get()
+    if cost is None:
+        yield
+        return
+    waited = cost.acquire()
+    metrics.record_stages([('admission', waited)])
+    token = _current.set(None)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        _current.reset(token)
+        cost.release(time.perf_counter() - started)
+
+
+class CostClass:
+    """
+    Concurrency limit and bounded wait queue for one class of requests.
+
+    Parameters
+    ----------
+    name : str
+        Class name, reported in errors and statistics.
+    limit : int
+        Requests allowed to run at once.
+    max_queue : int
+        Requests allowed to wait for a slot.
+    deadline : float
+        Seconds a request may wait before it is rejected.
+    """
+
+    def __init__(self, name, limit, max_queue, deadline):
+        self.name = name
+        self.limit = limit
+        self.max_queue = max_queue
+        self.deadline = deadline
+        self._slots = threading.BoundedSemaphore(limit)
+        self._lock = threading.Lock()
+        self._waiting = 0
+        self._running = 0
+        self.admitted = 0
+        self.rejected = 0
+        self._waits = deque(maxlen=1024)        # seconds spent queued
+        self._service = deque(maxlen=256)       # seconds holding a slot
+
+    def _retry_after(self):
+        """Estimate when a slot frees up, in whole seconds."""
+        service = np.mean(self._service) if self._service else 1.0
+        backlog = (self._waiting + self._running) / self.limit
+        return max(1, int(np.ceil(service * max(backlog, 1))))
+
+    def _reject(self):
+        with self._lock:
+            self.rejected += 1
+            retry_after = self._retry_after()
+        raise Overloaded(self.name, retry_after)
+
+    def acquire(self):
+        """
+        Wait for a slot; return the seconds spent waiting.
+
+        Raises :class:`Overloaded` when the queue is full or the deadline
+        passes.  Every successful call must be paired with :meth:`release`.
+        """
+        queued_at = time.perf_counter()
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                admitted = self._waiting < self.max_queue
+                if admitted:
+                    self._waiting += 1
+            if not admitted:
+                self._reject()
+            try:
+                acquired = self._slots.acquire(timeout=self.deadline)
+            finally:
+                with self._lock:
+                    self._waiting -= 1
+            if not acquired:
+                self._reject()
+        waited = time.perf_counter() - queued_at
+        with self._lock:
+            self._running += 1
+            self.admitted += 1
+            self._waits.append(waited)
+        return waited
+
+    def release(self, held):
+        """Free the slot taken by :meth:`acquire`, which was held *held* seconds."""
+        with self._lock:
+            self._running -= 1
+            self._service.append(held)
+        self._slots.release()
+
+    def stats(self):
+        """Return limits, occupancy, counters and wait-time figures."""
+        with self._lock:
+            waits = np.array(self._waits) * 1000 if self._waits else np.zeros(1)
+            return {
+                "limit": self.limit,
+                "max_queue": self.max_queue,
+                "deadline_s": self.deadline,
+                "running": self._running,
+                "queued": self._waiting,
+                "admitted": self.admitted,
+                "rejected": self.rejected,
+                "wait_ms": {
+                    "p50": round(float(np.percentile(waits, 50)), 2),
+                    "p95": round(float(np.percentile(waits, 95)), 2),
+                    "max": round(float(waits.max()), 2),
+                },
+                "service_ms_mean": round(float(np.mean(self._service)) * 1000, 2)
+                if self._service else 0.0,
+            }
+
+
+class AdmissionController:
+    """The limited cost classes of one worker, by name."""
+
+    def __init__(self, classes):
+        self.classes = {cost.name: cost for cost in classes}
+
+    def get(self, name):
+        """The :class:`CostClass` called *name*, or None if it is unlimited."""
+        return self.classes.get(name)
+
+    def stats(self):
+        """Per-class statistics, as returned by :meth:`CostClass.stats`."""
+        return {name: cost.stats() for name, cost in self.classes.items()}
@@ -0,0 +1,330 @@
+"""
+Benchmark suite for the public functions of ``app.image_processor``.
+
+Every function is timed on every dataset image or on every entry of
+RECOMMENDED_PAIRS, and on synthetic square images (2k, 4k and 8k by
+default) to show how the cost scales with image size::
+
+    python -m app.benchmark [--out FILE] [--baseline FILE [--update-baseline]]
+
+Each case reports wall-time percentiles over ``--repeat`` runs (after
+``--warmup`` discarded runs), the peak of Python/NumPy allocations during
+one extra run under ``tracemalloc`` and the size of the output (array
+bytes, or the length of the JSON body the endpoint would send).
+
+The suite measures computation, not caching: the result caches are
+disabled, renders run inline instead of in the render pool, and
+``load_image`` is timed with the image caches cleared before every run.
+The other functions see images that are already decoded, as a warm
+worker does.
+
+With ``--baseline`` the results are compared against a previous run and
+the exit status is 1 if any case got slower (median), allocated more or
+produced a larger output than the thresholds allow.
+"""
+
+import argparse
+import json
+import os
+import platform
+import re
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+
+RESULTS_VERSION = 1
+SYNTHETIC_SIDES = (2048, 4096, 8192)
+DATASET_DIR = (Path(__file__).parent.parent / "DIP3E_CH02_Original_Images"
+               / "DIP3E_Original_Images_CH02")
+
+# Settings forced on image_processor before it is imported (see docstring)
+BENCHMARK_ENV = {
+    'DIP_RESULT_CACHE_MB': '0',
+    'DIP_RESULT_DISK_CACHE_MB': '0',
+    'DIP_RENDER_PROCESSES': '0',
+    'DIP_SHM_STORE': '0',
+    'DIP_IMAGE_CACHE_MB': '2048',
+}
+
+# name -> "image" or "pair" (what one case of the function takes)
+FUNCTIONS = {
+    "load_image": "image",
+    "compute_spatial_difference": "pair",
+    "generate_histogram": "image",
+    "generate_comparison_plot": "pair",
+    "get_step_by_step_pipeline": "pair",
+    "generate_surface_plot": "image",
+    "generate_bit_depth_comparison": "image",
+    "get_pixel_region": "image",
+}
+
+
+def _side_label(side):
+    return f"{side // 1024}k" if side % 1024 == 0 else str(side)
+
+
+def write_synthetic_pair(images_dir, side):
+    """
+    Write a deterministic ``side`` x ``side`` image pair as TIFF files.
+
+    The first image is smooth structure plus sensor-like noise; the
+    second adds a bright disc and fresh noise, like a mask/live pair.
+    Returns the two filenames.
+    """
+    rng = np.random.default_rng(side)
+    pattern = cv2.GaussianBlur(rng.integers(0, 256, (64, 64), dtype=np.uint8), (0, 0), 4)
+    base = cv2.normalize(cv2.resize(pattern, (side, side), interpolation=cv2.INTER_CUBIC),
+                         None, 16, 224, cv2.NORM_MINMAX)
+    first = cv2.add(base, rng.integers(0, 24, (side, side), dtype=np.uint8))
+    second = base.copy()
+    cv2.circle(second, (side // 2, side // 2), side // 6, 240, -1)
+    second = cv2.add(second, rng.integers(0, 24, (side, side), dtype=np.uint8))
+
+    names = []
+    for suffix, img in (("a", first), ("b", second)):
+        name = f"synthetic_{_side_label(side)}_{suffix}.tif"
+        cv2.imwrite(str(images_dir / name), img)
+        names.append(name)
+    return names
+
+
+def prepare_images(work_dir, dataset, sides):
+    """
+    Build the benchmark image directory: dataset links plus synthetic pairs.
+
+    Returns ``(images_dir, images, pairs)``; the synthetic inputs are
+    listed as ``[(label, filename)]`` and ``[(label, filename1, filename2)]``.
+    """
+    images_dir = work_dir / "images"
+    images_dir.mkdir()
+    images, pairs = [], []
+    if dataset:
+        for path in sorted(DATASET_DIR.glob("*.tif")):
+            (images_dir / path.name).symlink_to(path)
+    for side in sides:
+        label = f"synthetic-{_side_label(side)}"
+        first, second = write_synthetic_pair(images_dir, side)
+        images.append((label, first))
+        pairs.append((label, first, second))
+    return images_dir, images, pairs
+
+
+def _output_bytes(result):
+    if result is None:
+        return None
+    if isinstance(result, np.ndarray):
+        return int(result.nbytes)
+    return len(json.dumps(result, separators=(',', ':')))
+
+
+def measure(fn, args, repeat, warmup, setup=None):
+    """
+    Time ``fn(*args)`` and measure its peak allocations and output size.
+
+    *setup* runs untimed before every call.  Returns the case's result
+    dict; ``"error"`` is set when the function returned None.
+    """
+    times = []
+    result = None
+    for i in range(warmup + repeat):
+        if setup:
+            setup()
+        started = time.perf_counter()
+        result = fn(*args)
+        elapsed = time.perf_counter() - started
+        if i >= warmup:
+            times.append(elapsed * 1000)
+
+    if setup:
+        setup()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        fn(*args)
+        peak = tracemalloc.get_traced_memory()[1] - before
+    finally:
+        tracemalloc.stop()
+
+    ms = np.array(times)
+    case = {
+        "runs": repeat,
+        "ms": {
+            "min": round(float(ms.min()), 3),
+            "p50": round(float(np.percentile(ms, 50)), 3),
+            "p95": round(float(np.percentile(ms, 95)), 3),
+            "p99": round(float(np.percentile(ms, 99)), 3),
+            "mean": round(float(ms.mean()), 3),
+        },
+        "peak_mb": round(peak / 2 ** 20, 3),
+        "output_bytes": _output_bytes(result),
+    }
+    if result is None:
+        case["error"] = "returned None"
+    return case
+
+
+def build_cases(ip, images, pairs):
+    """
+    Return ``[(case_id, fn, args, setup)]`` for every function and input.
+
+    *ip* is the imported ``app.image_processor``.
+    """
+    def image_args(name, filename):
+        if name not in ("generate_surface_plot", "get_pixel_region"):
+            return (filename,)
+        img = ip.load_image(filename)
+        if img is None:
+            return (filename, 0, 0)
+        height, width = img.shape
+        if name == "get_pixel_region":
+            return (filename, width // 2, height // 2)
+        # The whole image: the plot decimates it to its mesh resolution
+        return (filename, 0, 0, min(width, height))
+
+    cases = []
+    for name, arity in FUNCTIONS.items():
+        fn = getattr(ip, name)
+        setup = ip.clear_caches if name == "load_image" else None
+        if arity == "image":
+            for label, filename in images:
+                cases.append((f"{name}[{label}]", fn, image_args(name, filename), setup))
+        else:
+            for label, filename1, filename2 in pairs:
+                cases.append((f"{name}[{label}]", fn, (filename1, filename2), setup))
+    return cases
+
+
+def compare(results, baseline, threshold, min_ms, memory_threshold):
+    """
+    Compare two result sets; return a list of regression descriptions.
+
+    A case regresses when its median time exceeds the baseline's by more
+    than *threshold* (a fraction) and *min_ms*, when its peak allocations
+    grow by more than *memory_threshold* and 1 MiB, or when its output
+    grows by more than *threshold*.  Cases missing from either side are
+    ignored.
+    """
+    regressions = []
+    for case_id, case in results["cases"].items():
+        base = baseline.get("cases", {}).get(case_id)
+        if base is None or "error" in base:
+            continue
+        if "error" in case:
+            regressions.append(f"{case_id}: {case['error']}")
+            continue
+        now, then = case["ms"]["p50"], base["ms"]["p50"]
+        if now > then * (1 + threshold) and now - then > min_ms:
+            regressions.append(f"{case_id}: p50 {then:.1f} -> {now:.1f} ms")
+        now, then = case["peak_mb"], base["peak_mb"]
+        if now > then * (1 + memory_threshold) and now - then > 1:
+            regressions.append(f"{case_id}: peak {then:.1f} -> {now:.1f} MiB")
+        now, then = case["output_bytes"], base["output_bytes"]
+        if then and now > then * (1 + threshold):
+            regressions.append(f"{case_id}: output {then} -> {now} bytes")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m app.benchmark",
+        description="Time every image_processor function on the dataset "
+                    "and on synthetic images.")
+    parser.add_argument("--out", type=Path,
+                        help="write the results JSON here (default: stdout)")
+    parser.add_argument("--baseline", type=Path,
+                        help="compare against this results file; exit 1 on regressions")
+    parser.add_argument("--update-baseline", action="store_true",
+                        help="write the results to --baseline after comparing")
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="timed runs per case (default: 5)")
+    parser.add_argument("--warmup", type=int, default=1,
+                        help="untimed runs before timing (default: 1)")
+    parser.add_argument("--sizes", default=",".join(map(str, SYNTHETIC_SIDES)),
+                        help="synthetic image sides in pixels, comma-separated "
+                             "(default: %(default)s; empty for none)")
+    parser.add_argument("--no-dataset", action="store_true",
+                        help="benchmark only the synthetic images")
+    parser.add_argument("--only", type=re.compile, metavar="REGEX",
+                        help="run only the cases whose id matches")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="allowed slowdown / output growth as a fraction (default: 0.25)")
+    parser.add_argument("--min-ms", type=float, default=5.0,
+                        help="ignore slowdowns smaller than this (default: 5)")
+    parser.add_argument("--memory-threshold", type=float, default=0.25,
+                        help="allowed peak-memory growth as a fraction (default: 0.25)")
+    args = parser.parse_args(argv)
+    sides = [int(s) for s in args.sizes.split(",") if s]
+
+    with tempfile.TemporaryDirectory(prefix="dip-bench-") as tmp:
+        work_dir = Path(tmp)
+        images_dir, images, pairs = prepare_images(work_dir, not args.no_dataset, sides)
+        os.environ.update(BENCHMARK_ENV, DIP_IMAGES_DIR=str(images_dir),
+                          DIP_CACHE_DIR=str(work_dir / "cache"))
+        from app import image_processor as ip
+        # BENCHMARK_ENV has no effect if image_processor was imported
+        # already; never leave a render pool behind the CLI either way
+        ip.render_pool.disable()
+
+        if not args.no_dataset:
+            images = [(img["filename"], img["filename"])
+                      for img in ip.get_available_images()
+                      if not img["filename"].startswith("synthetic_")] + images
+            pairs = [(p["id"], p["image1"], p["image2"])
+                     for p in ip.RECOMMENDED_PAIRS] + pairs
+
+        cases = build_cases(ip, images, pairs)
+        if args.only:
+            cases = [case for case in cases if args.only.search(case[0])]
+        print(f"Benchmarking {len(cases)} cases, {args.repeat} runs each "
+              f"(renderer: {ip.PLOT_RENDERER})", file=sys.stderr)
+
+        results = {
+            "version": RESULTS_VERSION,
+            "generated_at": int(time.time()),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "opencv": cv2.__version__,
+            "cpu_count": os.cpu_count(),
+            "renderer": ip.PLOT_RENDERER,
+            "repeat": args.repeat,
+            "cases": {},
+        }
+        started = time.perf_counter()
+        for case_id, fn, fn_args, setup in cases:
+            case = measure(fn, fn_args, args.repeat, args.warmup, setup)
+            results["cases"][case_id] = case
+            print(f"  {case_id:<72} p50 {case['ms']['p50']:>9.2f} ms"
+                  f"  p95 {case['ms']['p95']:>9.2f} ms  peak {case['peak_mb']:>8.1f} MiB"
+                  f"  out {case['output_bytes'] or 0:>10}", file=sys.stderr)
+        print(f"Done in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+
+    text = json.dumps(results, indent=1, sort_keys=True)
+    if args.out:
+        args.out.write_text(text + "\n")
+    else:
+        print(text)
+
+    status = 1 if any("error" in case for case in results["cases"].values()) else 0
+    if args.baseline:
+        if args.baseline.exists():
+            baseline = json.loads(args.baseline.read_text())
+            regressions = compare(results, baseline, args.threshold, args.min_ms,
+                                  args.memory_threshold)
+            for line in regressions:
+                print(f"  REGRESSION {line}", file=sys.stderr)
+            print(f"{len(regressions)} regressions against {args.baseline}", file=sys.stderr)
+            status = 1 if regressions else status
+        if args.update_baseline or not args.baseline.exists():
+            args.baseline.write_text(text + "\n")
+            print(f"Baseline written to {args.baseline}", file=sys.stderr)
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
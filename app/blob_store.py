@@ -0,0 +1,146 @@
+"""
+Content-addressed store of encoded images, served by URL.
+
+JSON responses normally carry their images inline as base64 strings, so
+an original is re-sent inside every response that shows it.  With blob
+references the client gets ``/api/blob/<sha256>.<ext>`` URLs instead:
+each distinct image is written once, under the hash of its bytes, and
+served with immutable cache headers, so browsers and nginx cache and
+deduplicate images independently of the JSON that points to them.
+
+Blobs live in a directory shared by all workers on the host; the oldest
+are pruned once the store exceeds its budget.
+"""
+
+import base64
+import binascii
+import hashlib
+import os
+import re
+import threading
+from pathlib import Path
+
+from app.cache import LRUCache
+
+
+URL_PREFIX = '/api/blob/'
+NAME_RE = re.compile(r'^[0-9a-f]{64}\.(png|webp|jpg)$')
+MIMETYPES = {'png': 'image/png', 'webp': 'image/webp', 'jpg': 'image/jpeg'}
+
+# Base64 strings shorter than this are never treated as images
+_MIN_IMAGE_B64 = 64
+
+
+def sniff_extension(b64):
+    """Return the blob extension of a base64-encoded image, or None."""
+    if len(b64) < _MIN_IMAGE_B64:
+        return None
+    try:
+        head = base64.b64decode(b64[:16], validate=True)
+    except (binascii.Error, ValueError):
+        return None
+    if head.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'png'
+    if head.startswith(b'\xff\xd8\xff'):
+        return 'jpg'
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'webp'
+    return None
+
+
+class BlobStore:
+    """
+    Directory of immutable ``<sha256>.<ext>`` files.
+
+    Parameters
+    ----------
+    blob_dir : Path
+        Directory shared by all workers.
+    max_bytes : int
+        Disk budget; the least recently written blobs are pruned beyond it.
+    memo_bytes : int
+        Per-worker budget for remembering which base64 strings are
+        already stored, so a cached result is hashed only once.
+    """
+
+    PRUNE_EVERY = 64    # writes between disk-usage scans
+
+    def __init__(self, blob_dir, max_bytes, memo_bytes=64 * 1024 * 1024):
+        self.blob_dir = Path(blob_dir)
+        self.max_bytes = max_bytes
+        self._memo = LRUCache(memo_bytes)       # base64 string -> blob name
+        self._lock = threading.Lock()
+        self._writes = 0
+
+    def path(self, name):
+        """Filesystem path of blob *name*, or None if the name is invalid."""
+        if not NAME_RE.match(name):
+            return None
+        return self.blob_dir / name[:2] / name
+
+    def put(self, data, ext):
+        """Store *data* (if new) and return its blob name, or None on error."""
+        name = f"{hashlib.sha256(data).hexdigest()}.{ext}"
+        path = self.path(name)
+        if path.exists():
+            return name
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_name(f".{name}.{os.getpid()}.{threading.get_ident()}")
+            tmp.write_bytes(data)
+            os.replace(tmp, path)
+        except OSError:
+            return None
+        with self._lock:
+            self._writes += 1
+            prune = self._writes % self.PRUNE_EVERY == 0
+        if prune:
+            self._prune()
+        return name
+
+    def ref(self, b64):
+        """Return the ``/api/blob/...`` URL for a base64 image, or None."""
+        name = self._memo.get(b64)
+        if name is None or not self.path(name).exists():
+            ext = sniff_extension(b64)
+            if ext is None:
+                return None
+            name = self.put(base64.b64decode(b64), ext)
+            if name is None:
+                return None
+            self._memo.put(b64, name, len(b64))
+        return URL_PREFIX + name
+
+    def to_refs(self, value):
+        """
+        Return a copy of a JSON value with base64 images replaced by URLs.
+
+        Other strings, numbers and structure are kept as they are.
+        """
+        if isinstance(value, dict):
+            return {k: self.to_refs(v) for k, v in value.items()}
+        if isinstance(value, list):
+            return [self.to_refs(v) for v in value]
+        if isinstance(value, str) and len(value) >= _MIN_IMAGE_B64:
+            return self.ref(value) or value
+        return value
+
+    def _prune(self):
+        """Delete the oldest blobs until the store is within budget."""
+        files = []
+        total = 0
+        for path in self.blob_dir.glob("*/*"):
+            if path.name.startswith('.'):
+                continue
+            try:
+                st = path.stat()
+            except OSError:
+                continue
+            files.append((st.st_mtime, st.st_size, path))
+            total += st.st_size
+        files.sort()
+        for _, size, path in files:
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
@@ -0,0 +1,172 @@
+"""
+In-process caches shared by the request threads of a worker.
+"""
+
+import threading
+from collections import OrderedDict
+
+
+def _default_sizeof(value):
+    """Best-effort size in bytes of a cached value."""
+    nbytes = getattr(value, 'nbytes', None)
+    if nbytes is not None:
+        return int(nbytes)
+    try:
+        return len(value)
+    except TypeError:
+        return 0
+
+
+class LRUCache:
+    """
+    Thread-safe least-recently-used cache bounded by a byte budget.
+
+    Parameters
+    ----------
+    max_bytes : int
+        Total size the cached values may occupy.  Inserting beyond the
+        budget evicts the least recently used entries first.  Values
+        larger than the whole budget are never stored.
+    sizeof : callable, optional
+        Returns the size in bytes of a value.  Defaults to ``value.nbytes``
+        for arrays and ``len(value)`` for bytes/str.
+    """
+
+    def __init__(self, max_bytes, sizeof=None):
+        self.max_bytes = int(max_bytes)
+        self._sizeof = sizeof or _default_sizeof
+        self._entries = OrderedDict()   # key -> (value, nbytes)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        """Return the cached value for *key* and mark it recently used."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, nbytes=None):
+        """Store *value* under *key*, evicting old entries to stay in budget."""
+        if nbytes is None:
+            nbytes = self._sizeof(value)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            if nbytes > self.max_bytes:
+                return
+            self._entries[key] = (value, nbytes)
+            self._bytes += nbytes
+            while self._bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._bytes -= evicted
+                self.evictions += 1
+
+    def pop(self, key, default=None):
+        """Remove *key* and return its value."""
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return default
+            self._bytes -= entry[1]
+            return entry[0]
+
+    def clear(self):
+        """Drop every entry (counters are kept)."""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def stats(self):
+        """Return a dict of hit/miss/eviction counters and current usage."""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+class _Call:
+    """One in-flight computation and the callers waiting on it."""
+
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls that compute the same thing.
+
+    The first caller for a key runs the computation; callers arriving
+    while it is in flight wait for it and share its result (or its
+    exception) instead of computing it again.  Nothing is kept once the
+    call returns, so this complements a cache rather than replacing one.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.leaders = {}       # label -> calls that ran the computation
+        self.absorbed = {}      # label -> calls that shared another's result
+
+    def do(self, key, fn, label='default'):
+        """Return ``fn()``, shared with any concurrent call for *key*."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.leaders[label] = self.leaders.get(label, 0) + 1
+            else:
+                self.absorbed[label] = self.absorbed.get(label, 0) + 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except BaseException as exc:
+            call.error = exc
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    def stats(self):
+        """Return per-label leader/absorbed counters and in-flight calls."""
+        with self._lock:
+            return {
+                "in_flight": len(self._calls),
+                "computed": dict(self.leaders),
+                "absorbed": dict(self.absorbed),
+                "absorbed_total": sum(self.absorbed.values()),
+            }
@@ -0,0 +1,240 @@
+"""
+Image catalog built from TIFF headers.
+
+Listing the dataset must not decode any pixels.  Each entry records the
+dimensions, bit depth and compression read straight from the TIFF IFD,
+the file size, and a SHA-256 of the file contents.  The catalog is
+persisted as a JSON manifest and only entries whose file changed (by
+mtime or size) are re-read, so a cold worker lists the dataset from the
+manifest without touching the images at all.
+"""
+
+import hashlib
+import json
+import os
+import struct
+import threading
+import time
+from pathlib import Path
+
+
+MANIFEST_VERSION = 1
+
+# TIFF tag ids used by the catalog
+_TAG_WIDTH = 256
+_TAG_HEIGHT = 257
+_TAG_BITS_PER_SAMPLE = 258
+_TAG_COMPRESSION = 259
+_TAG_SAMPLES_PER_PIXEL = 277
+
+# (struct code, byte size) for the TIFF field types we may need to read
+_FIELD_TYPES = {
+    1: ('B', 1),    # BYTE
+    3: ('H', 2),    # SHORT
+    4: ('I', 4),    # LONG
+    16: ('Q', 8),   # LONG8 (BigTIFF)
+}
+
+COMPRESSION_NAMES = {
+    1: "none",
+    2: "ccitt_rle",
+    3: "ccitt_g3",
+    4: "ccitt_g4",
+    5: "lzw",
+    6: "ojpeg",
+    7: "jpeg",
+    8: "deflate",
+    32773: "packbits",
+    32946: "deflate",
+}
+
+
+def read_tiff_header(path):
+    """
+    Read image geometry from the first IFD of a TIFF file.
+
+    Returns
+    -------
+    dict with width, height, bit_depth, samples_per_pixel and compression,
+    or None if the file is not a readable TIFF.
+    """
+    try:
+        with open(path, 'rb') as f:
+            head = f.read(16)
+            if head[:2] == b'II':
+                bo = '<'
+            elif head[:2] == b'MM':
+                bo = '>'
+            else:
+                return None
+            magic = struct.unpack(bo + 'H', head[2:4])[0]
+            if magic == 42:
+                ifd_offset = struct.unpack(bo + 'I', head[4:8])[0]
+                n_fmt, count_fmt, entry_size, value_size = 'H', 'I', 12, 4
+            elif magic == 43:   # BigTIFF
+                ifd_offset = struct.unpack(bo + 'Q', head[8:16])[0]
+                n_fmt, count_fmt, entry_size, value_size = 'Q', 'Q', 20, 8
+            else:
+                return None
+
+            f.seek(ifd_offset)
+            n_entries = struct.unpack(bo + n_fmt, f.read(struct.calcsize(n_fmt)))[0]
+            count_size = struct.calcsize(count_fmt)
+            raw = f.read(n_entries * entry_size)
+
+            tags = {}
+            for i in range(n_entries):
+                entry = raw[i * entry_size:(i + 1) * entry_size]
+                tag, ftype = struct.unpack(bo + 'HH', entry[:4])
+                if ftype not in _FIELD_TYPES:
+                    continue
+                count = struct.unpack(bo + count_fmt, entry[4:4 + count_size])[0]
+                code, size = _FIELD_TYPES[ftype]
+                payload = entry[4 + count_size:]
+                if count * size > value_size:
+                    # Values live elsewhere; only the first one is needed
+                    pointer = struct.unpack(bo + ('I' if value_size == 4 else 'Q'),
+                                            payload)[0]
+                    pos = f.tell()
+                    f.seek(pointer)
+                    payload = f.read(size)
+                    f.seek(pos)
+                tags[tag] = struct.unpack(bo + code, payload[:size])[0]
+    except (OSError, struct.error):
+        return None
+
+    if _TAG_WIDTH not in tags or _TAG_HEIGHT not in tags:
+        return None
+    compression = tags.get(_TAG_COMPRESSION, 1)
+    return {
+        "width": int(tags[_TAG_WIDTH]),
+        "height": int(tags[_TAG_HEIGHT]),
+        "bit_depth": int(tags.get(_TAG_BITS_PER_SAMPLE, 1)),
+        "samples_per_pixel": int(tags.get(_TAG_SAMPLES_PER_PIXEL, 1)),
+        "compression": COMPRESSION_NAMES.get(compression, str(compression)),
+    }
+
+
+def file_sha256(path, chunk_size=1 << 20):
+    """Return the hex SHA-256 of a file's contents."""
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class ImageCatalog:
+    """
+    Header-only catalog of the TIF files in a directory.
+
+    Parameters
+    ----------
+    images_dir : Path
+        Directory holding the dataset.
+    manifest_path : Path
+        JSON file the catalog is persisted to (shared by all workers).
+    refresh_interval : float
+        Seconds between checks of the directory for changed files.  In
+        between, lookups are served from memory.
+    """
+
+    def __init__(self, images_dir, manifest_path, refresh_interval=2.0):
+        self.images_dir = Path(images_dir)
+        self.manifest_path = Path(manifest_path)
+        self.refresh_interval = refresh_interval
+        self._lock = threading.Lock()
+        self._entries = None      # filename -> entry dict
+        self._checked_at = 0.0
+
+    def _load_manifest(self):
+        try:
+            with open(self.manifest_path) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if manifest.get("version") != MANIFEST_VERSION:
+            return {}
+        return manifest.get("entries", {})
+
+    def _save_manifest(self, entries):
+        try:
+            self.manifest_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.manifest_path.with_name(
+                f".{self.manifest_path.name}.{os.getpid()}")
+            with open(tmp, 'w') as f:
+                json.dump({"version": MANIFEST_VERSION, "entries": entries}, f,
+                          indent=1, sort_keys=True)
+            os.replace(tmp, self.manifest_path)
+        except OSError:
+            pass    # a read-only cache dir only costs us the warm start
+
+    def _refresh(self):
+        """Re-read headers for new or changed files and drop removed ones."""
+        known = self._entries if self._entries is not None else self._load_manifest()
+        entries = {}
+        changed = self._entries is None and not known
+        if self.images_dir.exists():
+            for f in self.images_dir.iterdir():
+                if f.suffix.lower() != '.tif':
+                    continue
+                st = f.stat()
+                old = known.get(f.name)
+                if old and old["mtime_ns"] == st.st_mtime_ns and old["size"] == st.st_size:
+                    entries[f.name] = old
+                    continue
+                header = read_tiff_header(f)
+                changed = True
+                if header is None:
+                    continue
+                entries[f.name] = dict(header, filename=f.name,
+                                       size=st.st_size,
+                                       mtime_ns=st.st_mtime_ns,
+                                       sha256=file_sha256(f))
+        if set(entries) != set(known):
+            changed = True
+        if changed:
+            self._save_manifest(entries)
+        # An unchanged directory keeps the same dict, so callers caching
+        # by its identity (e.g. the image listing) stay valid
+        if entries != self._entries:
+            self._entries = entries
+        self._checked_at = time.monotonic()
+
+    def entries(self):
+        """Return ``{filename: entry}`` for every readable TIF."""
+        with self._lock:
+            if (self._entries is None
+                    or time.monotonic() - self._checked_at >= self.refresh_interval):
+                self._refresh()
+            return self._entries
+
+    def get(self, filename):
+        """
+        Return the catalog entry for *filename*, or None.
+
+        Unlike :meth:`entries`, a known file is always re-stat'ed so a
+        replaced image never yields a stale hash.  Unknown names do not
+        trigger a scan of their own: new files appear at the next
+        periodic refresh.
+        """
+        entries = self._entries
+        if entries is None or time.monotonic() - self._checked_at >= self.refresh_interval:
+            entries = self.entries()
+        entry = entries.get(filename)
+        if entry is None:
+            return None
+        try:
+            st = (self.images_dir / filename).stat()
+        except OSError:
+            return None
+        if entry["mtime_ns"] != st.st_mtime_ns or entry["size"] != st.st_size:
+            with self._lock:
+                self._refresh()
+                entry = self._entries.get(filename)
+        return entry
+
+    def content_hash(self, filename):
+        """Return the SHA-256 of *filename*'s contents, or None if unknown."""
+        entry = self.get(filename)
+        return entry["sha256"] if entry else None
@@ -0,0 +1,247 @@
+"""
+Output-format negotiation for rendered images.
+
+Every image the app produces (dataset images, pyramid tiles, difference
+images, raster charts and matplotlib figures) is encoded through
+:func:`encode_array` or :func:`encode_figure`, which use the *current*
+:class:`Encoding`.  The Flask layer sets it once per request, from an
+explicit ``format``/``quality`` parameter or, for endpoints that return
+image bytes, from the ``Accept`` header:
+
+* ``png``  -- lossless; ``quality`` is the zlib compression level 0-9.
+* ``webp`` -- lossless without ``quality``, lossy with ``quality`` 1-100.
+* ``jpeg`` -- lossy, ``quality`` 1-100 (default 90).
+
+Lossy qualities may also be given as a tier name (QUALITY_TIERS).
+
+Each encode is timed and recorded both in the per-request log (reported
+in ``X-Encode-*`` response headers) and in per-format totals
+(:func:`stats`), so defaults can be chosen from measured sizes and times.
+The encoding is part of every result-cache key (see
+``image_processor.result_key``), except for the default PNG, whose keys
+are unchanged.
+"""
+
+import contextvars
+import io
+import threading
+import time
+from collections import namedtuple
+
+import cv2
+
+from app import metrics
+
+
+MIMETYPES = {'png': 'image/png', 'webp': 'image/webp', 'jpeg': 'image/jpeg'}
+QUALITY_TIERS = {'high': 90, 'preview': 75, 'thumbnail': 50}
+DEFAULT_JPEG_QUALITY = 90
+
+
+class Encoding(namedtuple('Encoding', 'format quality')):
+    """An output format and its quality (None: the format's default)."""
+
+    __slots__ = ()
+
+    @property
+    def mimetype(self):
+        return MIMETYPES[self.format]
+
+    @property
+    def lossless(self):
+        return self.format == 'png' or (self.format == 'webp' and self.quality is None)
+
+    @property
+    def token(self):
+        """Short stable name, used in cache keys and ETags."""
+        if self.quality is None:
+            return self.format
+        return f"{self.format}-q{self.quality}"
+
+
+PNG = Encoding('png', None)
+
+_current = contextvars.ContextVar('encoding', default=PNG)
+_log = contextvars.ContextVar('encode_log', default=None)
+
+
+def parse(fmt, quality=None):
+    """
+    Validate an explicit *fmt*/*quality* pair and return an :class:`Encoding`.
+
+    Raises ValueError with a user-facing message on bad input.
+    """
+    fmt = str(fmt).lower()
+    if fmt == 'jpg':
+        fmt = 'jpeg'
+    if fmt not in MIMETYPES:
+        raise ValueError("'format' must be one of: " + ", ".join(MIMETYPES))
+    if quality is None or quality == '':
+        return Encoding(fmt, DEFAULT_JPEG_QUALITY if fmt == 'jpeg' else None)
+
+    if isinstance(quality, str) and not quality.isdigit():
+        if quality == 'lossless' and fmt in ('png', 'webp'):
+            return Encoding(fmt, None)
+        if quality in QUALITY_TIERS and fmt != 'png':
+            return Encoding(fmt, QUALITY_TIERS[quality])
+        raise ValueError(f"Unknown quality {quality!r} for {fmt}")
+    try:
+        quality = int(quality)
+    except (TypeError, ValueError):
+        raise ValueError("'quality' must be an integer or a tier name") from None
+    low, high = (0, 9) if fmt == 'png' else (1, 100)
+    if not low <= quality <= high:
+        raise ValueError(f"'quality' for {fmt} must be in {low}-{high}")
+    return Encoding(fmt, quality)
+
+
+def negotiate(accept_mimetypes, formats):
+    """
+    Pick an encoding from an ``Accept`` header (werkzeug MIMEAccept).
+
+    Only the formats in *formats* are offered besides PNG, and a format
+    is chosen only when the client names it explicitly (``*/*`` gets
+    PNG).  Negotiated WebP is lossless, so it is a drop-in for PNG.
+    """
+    for fmt in formats:
+        if fmt in MIMETYPES and MIMETYPES[fmt] in accept_mimetypes.values():
+            return parse(fmt)
+    return PNG
+
+
+def current():
+    """The encoding in effect for this request (PNG by default)."""
+    return _current.get()
+
+
+def use(encoding):
+    """Make *encoding* current; returns a token for :func:`reset`."""
+    return _current.set(encoding)
+
+
+def reset(token):
+    _current.reset(token)
+
+
+def start_log():
+    """Begin collecting this request's encodes; returns the log list."""
+    entries = []
+    _log.set(entries)
+    return entries
+
+
+class EncodeStats:
+    """Per-encoding totals of encode count, bytes and time."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._totals = {}       # token -> [count, bytes, seconds]
+
+    def add(self, token, size, seconds):
+        with self._lock:
+            totals = self._totals.setdefault(token, [0, 0, 0.0])
+            totals[0] += 1
+            totals[1] += size
+            totals[2] += seconds
+
+    def stats(self):
+        with self._lock:
+            return {
+                token: {
+                    "count": count,
+                    "mean_bytes": round(size / count),
+                    "mean_ms": round(seconds / count * 1000, 3),
+                }
+                for token, (count, size, seconds) in sorted(self._totals.items())
+            }
+
+
+_stats = EncodeStats()
+
+
+def record(entries):
+    """Add ``(token, bytes, seconds)`` entries to the request log and totals."""
+    log = _log.get()
+    for token, size, seconds in entries:
+        _stats.add(token, size, seconds)
+        if log is not None:
+            log.append((token, size, seconds))
+
+
+def stats():
+    """Encode totals of this process, per encoding token."""
+    return _stats.stats()
+
+
+def _imencode_args(encoding, png_level):
+    if encoding.format == 'png':
+        level = encoding.quality if encoding.quality is not None else png_level
+        return '.png', [] if level is None else [cv2.IMWRITE_PNG_COMPRESSION, level]
+    if encoding.format == 'webp':
+        # OpenCV encodes lossless WebP for qualities above 100
+        return '.webp', [cv2.IMWRITE_WEBP_QUALITY,
+                         101 if encoding.quality is None else encoding.quality]
+    return '.jpg', [cv2.IMWRITE_JPEG_QUALITY, encoding.quality]
+
+
+def encode_array(img, png_level=None, encoding=None):
+    """
+    Encode an OpenCV image (grayscale or BGR) in the current encoding.
+
+    *png_level* is the call site's default PNG compression level, used
+    when the encoding is PNG without an explicit level.  Returns bytes,
+    or None if OpenCV cannot encode the image.
+    """
+    encoding = encoding or current()
+    ext, params = _imencode_args(encoding, png_level)
+    started = time.perf_counter()
+    with metrics.stage('encode'):
+        success, buffer = cv2.imencode(ext, img, params)
+    if not success:
+        return None
+    data = buffer.tobytes()
+    record([(encoding.token, len(data), time.perf_counter() - started)])
+    return data
+
+
+def encode_figure(fig, encoding=None, **savefig_kwargs):
+    """
+    ``fig.savefig`` in the current encoding; returns the bytes.
+
+    *savefig_kwargs* are the call site's usual arguments (dpi,
+    bbox_inches, facecolor, ...), minus ``format``.
+    """
+    encoding = encoding or current()
+    pil_kwargs = {}
+    if encoding.format == 'png':
+        if encoding.quality is not None:
+            pil_kwargs['compress_level'] = encoding.quality
+    elif encoding.quality is None:
+        pil_kwargs['lossless'] = True
+    else:
+        pil_kwargs['quality'] = encoding.quality
+    if pil_kwargs:
+        savefig_kwargs['pil_kwargs'] = pil_kwargs
+
+    started = time.perf_counter()
+    buf = io.BytesIO()
+    with metrics.stage('savefig'):
+        fig.savefig(buf, format=encoding.format, **savefig_kwargs)
+    data = buf.getvalue()
+    record([(encoding.token, len(data), time.perf_counter() - started)])
+    return data
+
+
+def call_logged(encoding, fn, *args, **kwargs):
+    """
+    Run ``fn(*args, **kwargs)`` under *encoding* and collect its encodes.
+
+    Returns ``(result, entries)``; used to run renders in another process
+    and replay their encode log with :func:`record` in the caller.
+    """
+    token = use(encoding)
+    entries = start_log()
+    try:
+        return fn(*args, **kwargs), entries
+    finally:
+        reset(token)
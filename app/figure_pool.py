@@ -0,0 +1,244 @@
+"""
+Per-thread pool of pre-laid-out matplotlib figures.
+
+Building a figure, laying it out with ``tight_layout`` and closing it
+again costs more than drawing it.  For layouts that every request draws
+the same way, a template builds the figure once per thread with
+``matplotlib.figure.Figure`` and ``FigureCanvasAgg`` (no pyplot global
+state) and afterwards only swaps image data, histogram values and
+titles into the existing artists before saving.
+
+The layout still depends on the data: the image aspect ratio sets the
+size of the image axes, and the histogram peaks the width of the tick
+labels.  Each template lays itself out again when those change, and
+remembers the result per shape, so its output matches a figure drawn
+from scratch.
+
+Templates are thread-local, so no locking is needed around a render.
+matplotlib itself is imported when the first template is built, so
+importing this module stays cheap (see app/plotting.py).
+"""
+
+import threading
+
+import numpy as np
+
+from app import encoding
+
+
+_BINS = np.arange(256)
+
+
+def _fill_verts(counts):
+    """Polygon vertices of ``fill_between(range(256), counts)``."""
+    top = np.column_stack([_BINS, counts])
+    base = np.column_stack([_BINS[::-1], np.zeros(256)])
+    return np.vstack([top, base])
+
+
+def _set_image(im, img, clim=None):
+    """Swap *img* into an AxesImage, resizing the axes to fit."""
+    h, w = img.shape[:2]
+    im.set_data(img)
+    im.set_extent((-0.5, w - 0.5, h - 0.5, -0.5))
+    im.axes.set_xlim(-0.5, w - 0.5)
+    im.axes.set_ylim(h - 0.5, -0.5)
+    if clim is None:
+        clim = (float(img.min()), float(img.max()))
+    im.set_clim(*clim)
+
+
+def _set_ylim(ax, peak):
+    """Mimic matplotlib's default 5% autoscale margins for counts >= 0."""
+    peak = float(peak) or 1.0
+    ax.set_ylim(-0.05 * peak, 1.05 * peak)
+
+
+def _layout_key(img, *peaks):
+    """What a layout depends on: image aspect and tick-label digits."""
+    h, w = img.shape[:2]
+    return round(h / w, 3), tuple(len(str(int(1.05 * float(p)))) for p in peaks)
+
+
+class FigureTemplate:
+    """A figure built once whose artists are updated for every render."""
+
+    figsize = (6.4, 4.8)
+    dpi = 120
+    facecolor = 'white'
+
+    def __init__(self):
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.figure import Figure
+
+        self.fig = Figure(figsize=self.figsize)
+        self.canvas = FigureCanvasAgg(self.fig)
+        self._layout = None
+        self.build()
+        # tight_layout's result depends on the layout it starts from, so
+        # every new layout starts from the fresh figure's
+        self._layouts = {None: self._subplot_params()}   # key -> parameters
+
+    def build(self):
+        """Create the axes and artists (called once per thread)."""
+        raise NotImplementedError
+
+    def fit_layout(self, key):
+        """
+        Lay the figure out for the current data, identified by *key*.
+
+        ``tight_layout`` runs once per distinct key; afterwards the
+        subplot parameters it chose are restored.
+        """
+        if key == self._layout:
+            return
+        params = self._layouts.get(key)
+        if params is None:
+            self.fig.subplots_adjust(**self._layouts[None])
+            self.fig.tight_layout()
+            self._layouts[key] = self._subplot_params()
+        else:
+            self.fig.subplots_adjust(**params)
+        self._layout = key
+
+    def _subplot_params(self):
+        sp = self.fig.subplotpars
+        return {name: getattr(sp, name)
+                for name in ('left', 'right', 'bottom', 'top', 'wspace', 'hspace')}
+
+    def render(self):
+        """Draw the current state and return it encoded (PNG by default)."""
+        return encoding.encode_figure(self.fig, dpi=self.dpi, bbox_inches='tight',
+                                      facecolor=self.facecolor, edgecolor='none')
+
+    def render_array(self):
+        """Draw the current state at the template dpi; return an RGB array."""
+        dpi = self.fig.dpi
+        self.fig.set_dpi(self.dpi)
+        try:
+            self.canvas.draw()
+            return np.asarray(self.canvas.buffer_rgba())[..., :3].copy()
+        finally:
+            self.fig.set_dpi(dpi)
+
+
+class ComparisonTemplate(FigureTemplate):
+    """2x4 grid: two images, difference, heatmap; four histograms."""
+
+    figsize = (18, 9)
+
+    def build(self):
+        fig = self.fig
+        axes = fig.subplots(2, 4)
+        fig.suptitle('Spatial Difference Analysis', fontsize=14,
+                     fontweight='bold', y=0.98)
+        placeholder = np.zeros((256, 256), np.uint8)
+        zeros = np.zeros(256)
+
+        self.images = []
+        for ax, title in zip(axes[0, :3], ('Image 1\n', 'Image 2\n',
+                                           'Absolute Difference\n|Image1 - Image2|')):
+            self.images.append(ax.imshow(placeholder, cmap='gray'))
+            ax.set_title(title, fontsize=9)
+            ax.axis('off')
+        self.heatmap = axes[0, 3].imshow(placeholder, cmap='hot')
+        axes[0, 3].set_title('Enhanced Difference\n(Heatmap)', fontsize=9)
+        axes[0, 3].axis('off')
+        fig.colorbar(self.heatmap, ax=axes[0, 3], fraction=0.046, pad=0.04)
+        self.title1 = axes[0, 0].title
+        self.title2 = axes[0, 1].title
+
+        self.hist_axes = list(axes[1, :3])
+        self.hist_lines = []
+        self.hist_fills = []
+        for ax, color, title in zip(self.hist_axes,
+                                    ('#3498db', '#e74c3c', '#2ecc71'),
+                                    ('Histogram - Image 1', 'Histogram - Image 2',
+                                     'Histogram - Difference')):
+            self.hist_lines.append(ax.plot(zeros, color='#2c3e50', linewidth=1)[0])
+            self.hist_fills.append(ax.fill_between(_BINS, zeros, alpha=0.3, color=color))
+            ax.set_title(title, fontsize=9)
+            ax.set_xlim([0, 256])
+            ax.grid(True, alpha=0.3)
+
+        self.overlay_ax = axes[1, 3]
+        self.overlay_lines = [
+            self.overlay_ax.plot(zeros, color=c, linewidth=1, label=label, alpha=0.7)[0]
+            for c, label in (('#3498db', 'Image 1'), ('#e74c3c', 'Image 2'),
+                             ('#2ecc71', 'Difference'))
+        ]
+        self.overlay_ax.set_title('Overlay Comparison', fontsize=9)
+        self.overlay_ax.set_xlim([0, 256])
+        self.overlay_ax.legend(fontsize=8)
+        self.overlay_ax.grid(True, alpha=0.3)
+
+    def update(self, title1, title2, img1, img2, diff, diff_enhanced,
+               hist1, hist2, hist_diff):
+        self.title1.set_text(f'Image 1\n{title1}')
+        self.title2.set_text(f'Image 2\n{title2}')
+        for im, img in zip(self.images, (img1, img2, diff)):
+            _set_image(im, img)
+        _set_image(self.heatmap, diff_enhanced)
+
+        hists = [np.asarray(h, dtype=np.float64).reshape(-1) for h in (hist1, hist2, hist_diff)]
+        for ax, line, fill, h in zip(self.hist_axes, self.hist_lines, self.hist_fills, hists):
+            line.set_ydata(h)
+            fill.set_verts([_fill_verts(h)])
+            _set_ylim(ax, h.max())
+        for line, h in zip(self.overlay_lines, hists):
+            line.set_ydata(h)
+        _set_ylim(self.overlay_ax, max(h.max() for h in hists))
+        self.fit_layout(_layout_key(img1, *(h.max() for h in hists)))
+
+
+class BitDepthTemplate(FigureTemplate):
+    """1x2 figure: quantised image and its 256-bar histogram."""
+
+    figsize = (10, 4)
+
+    def build(self):
+        axes = self.fig.subplots(1, 2)
+        self.image = axes[0].imshow(np.zeros((256, 256), np.uint8), cmap='gray',
+                                    vmin=0, vmax=255)
+        self.image_title = axes[0].set_title('8-bit  (256 levels)', fontsize=11,
+                                             fontweight='bold')
+        axes[0].axis('off')
+
+        self.hist_ax = axes[1]
+        self.bars = axes[1].bar(_BINS, np.zeros(256), color='#3498db', width=1.0,
+                                edgecolor='none')
+        axes[1].set_xlim([0, 256])
+        axes[1].set_xlabel('Pixel Intensity')
+        axes[1].set_ylabel('Frequency')
+        self.hist_title = axes[1].set_title('Histogram  (8-bit)', fontsize=11)
+        axes[1].grid(True, alpha=0.3)
+
+    def update(self, bits, quantised, hist):
+        levels = 2 ** bits
+        _set_image(self.image, quantised, clim=(0, 255))
+        self.image_title.set_text(f'{bits}-bit  ({levels} levels)')
+        self.hist_title.set_text(f'Histogram  ({bits}-bit)')
+        hist = np.asarray(hist, dtype=np.float64).reshape(-1)
+        for rect, h in zip(self.bars.patches, hist):
+            rect.set_height(h)
+        self.hist_ax.set_ylim(0, 1.05 * (float(hist.max()) or 1.0))
+        self.fit_layout(_layout_key(quantised, hist.max()))
+
+
+class FigureTemplatePool:
+    """Hands out one instance of each template class per thread."""
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def get(self, template_cls):
+        templates = getattr(self._local, 'templates', None)
+        if templates is None:
+            templates = self._local.templates = {}
+        template = templates.get(template_cls)
+        if template is None:
+            template = templates[template_cls] = template_cls()
+        return template
+
+
+pool = FigureTemplatePool()
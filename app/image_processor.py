@@ -6,16 +6,83 @@ generating histograms, and matplotlib demonstrations.
 
 import cv2
 import numpy as np
-import matplotlib
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
-import io
 import base64
+import logging
 import os
+from functools import cached_property
 from pathlib import Path
 
-
-IMAGES_DIR = Path(__file__).parent.parent / "DIP3E_CH02_Original_Images" / "DIP3E_Original_Images_CH02"
+from app import admission, encoding, metrics, raster_chart
+from app.cache import LRUCache, SingleFlight
+from app.catalog import ImageCatalog
+from app.pyramid import ImagePyramid, lod_level
+from app.figure_pool import BitDepthTemplate, ComparisonTemplate, pool as figure_pool
+from app.render_pool import RenderPool
+from app.result_cache import ResultCache, make_key
+from app.shm_store import SharedImageStore, build as build_store, default_store_dir
+from app.stats import array_stats, cache_stats as stats_cache_stats
+
+
+log = logging.getLogger(__name__)
+
+IMAGES_DIR = Path(os.environ.get('DIP_IMAGES_DIR') or
+                  Path(__file__).parent.parent / "DIP3E_CH02_Original_Images" / "DIP3E_Original_Images_CH02")
+
+# Persistent, per-host state (catalog manifest, result caches, ...)
+CACHE_DIR = Path(os.environ.get('DIP_CACHE_DIR') or Path(__file__).parent.parent / ".cache")
+
+# Header-only catalog of the dataset (see app/catalog.py)
+_catalog = ImageCatalog(IMAGES_DIR, CACHE_DIR / "catalog.json")
+_catalog_listing = (None, [])
+
+# Decoded grayscale arrays, shared by all threads of a worker.  The budget
+# is configurable because every worker holds its own copy.
+IMAGE_CACHE_MB = int(os.environ.get('DIP_IMAGE_CACHE_MB', '128'))
+_image_cache = LRUCache(IMAGE_CACHE_MB * 1024 * 1024)
+
+# Dataset decoded once by the gunicorn master into shared memory (see
+# gunicorn.conf.py).  Workers map it read-only; set DIP_SHM_STORE=0 to
+# fall back to per-worker decoding.
+SHM_STORE_ENABLED = os.environ.get('DIP_SHM_STORE', '1') != '0'
+SHM_STORE_DIR = Path(os.environ.get('DIP_SHM_DIR') or default_store_dir())
+_shared_store = SharedImageStore(SHM_STORE_DIR)
+
+# Encoded PNG bytes of dataset images, keyed by source content hash
+ENCODED_CACHE_MB = int(os.environ.get('DIP_ENCODED_CACHE_MB', '64'))
+_encoded_cache = LRUCache(ENCODED_CACHE_MB * 1024 * 1024)
+
+# Multi-resolution pyramids (see app/pyramid.py), keyed by content hash.
+# Level 0 is the shared image itself, so only coarser levels use budget.
+PYRAMID_CACHE_MB = int(os.environ.get('DIP_PYRAMID_CACHE_MB', '64'))
+_pyramid_cache = LRUCache(PYRAMID_CACHE_MB * 1024 * 1024)
+
+# Renderer for histogram plots: 'matplotlib', or 'raster' for the much
+# faster NumPy/OpenCV renderer in app/raster_chart.py.  Callers may also
+# choose per call through the ``renderer`` argument.
+PLOT_RENDERERS = ('matplotlib', 'raster')
+PLOT_RENDERER = os.environ.get('DIP_PLOT_RENDERER', 'matplotlib')
+
+# Matplotlib renders run in a bounded pool of worker processes so they do
+# not serialise on the GIL of a gthread worker.  DIP_RENDER_PROCESSES=0
+# renders inline.  See app/render_pool.py.
+render_pool = RenderPool(
+    processes=int(os.environ.get('DIP_RENDER_PROCESSES', os.cpu_count() or 1)),
+    max_queue=int(os.environ.get('DIP_RENDER_QUEUE', '8')),
+    queue_timeout=float(os.environ.get('DIP_RENDER_QUEUE_TIMEOUT', '20')),
+)
+
+# Deterministic results keyed by the content hashes of their inputs.  Bump
+# ALGORITHM_VERSION whenever an algorithm or its output format changes.
+ALGORITHM_VERSION = 3
+RESULT_CACHE_MB = int(os.environ.get('DIP_RESULT_CACHE_MB', '64'))
+RESULT_DISK_CACHE_MB = int(os.environ.get('DIP_RESULT_DISK_CACHE_MB', '512'))
+_result_cache = ResultCache(RESULT_CACHE_MB * 1024 * 1024,
+                            CACHE_DIR / "results",
+                            RESULT_DISK_CACHE_MB * 1024 * 1024)
+
+# Identical renders requested at the same time (a class opening the same
+# pair) are computed once per worker and shared by all waiting requests.
+_in_flight = SingleFlight()
 
 # Curated image pairs that produce meaningful spatial differences
 RECOMMENDED_PAIRS = [
@@ -71,26 +138,39 @@ RECOMMENDED_PAIRS = [
 
 
 def get_available_images():
-    """Return list of available images with metadata."""
+    """
+    Return list of available images with metadata.
+
+    Served from the header-only catalog manifest; no image is decoded.
+    The list is rebuilt only when the catalog itself changes.
+    """
+    global _catalog_listing
+    entries = _catalog.entries()
+    if _catalog_listing[0] is entries:
+        return _catalog_listing[1]
+
     images = []
-    if not IMAGES_DIR.exists():
-        return images
-
-    for f in sorted(IMAGES_DIR.iterdir()):
-        if f.suffix.lower() == '.tif':
-            img = cv2.imread(str(f), cv2.IMREAD_GRAYSCALE)
-            if img is not None:
-                h, w = img.shape
-                images.append({
-                    "filename": f.name,
-                    "width": w,
-                    "height": h,
-                    "size_kb": round(f.stat().st_size / 1024, 1),
-                    "display_name": _parse_image_name(f.name)
-                })
+    for name in sorted(entries):
+        entry = entries[name]
+        images.append({
+            "filename": name,
+            "width": entry["width"],
+            "height": entry["height"],
+            "bit_depth": entry["bit_depth"],
+            "compression": entry["compression"],
+            "size_kb": round(entry["size"] / 1024, 1),
+            "content_hash": entry["sha256"],
+            "display_name": _parse_image_name(name)
+        })
+    _catalog_listing = (entries, images)
     return images
 
 
+def get_content_hash(filename):
+    """Return the SHA-256 of an image file's contents, or None."""
+    return _catalog.content_hash(filename)
+
+
 def _parse_image_name(filename):
     """Extract a human-readable name from the filename."""
     name = filename.replace('.tif', '')
@@ -106,80 +186,318 @@ def _parse_image_name(filename):
 
 
 def load_image(filename):
-    """Load a TIF image as grayscale numpy array."""
+    """
+    Load a TIF image as grayscale numpy array.
+
+    Images published in the shared-memory store are returned as
+    zero-copy views; anything else is decoded and kept in a per-worker
+    LRU cache.  Both are revalidated against the file's mtime and size on
+    every call.  The returned array is shared between callers and
+    therefore read-only; use ``.copy()`` before modifying it in place.
+    """
     path = IMAGES_DIR / filename
-    if not path.exists():
+    try:
+        st = path.stat()
+    except OSError:
         return None
-    img = cv2.imread(str(path), cv2.IMREAD_GRAYSCALE)
+    stamp = (st.st_mtime_ns, st.st_size)
+
+    if SHM_STORE_ENABLED:
+        shared = _shared_store.get(filename, stamp)
+        if shared is not None:
+            return shared
+
+    cached = _image_cache.get(str(path))
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+
+    with metrics.stage('imread'):
+        img = cv2.imread(str(path), cv2.IMREAD_GRAYSCALE)
+    if img is None:
+        return None
+    img.flags.writeable = False
+    _image_cache.put(str(path), (stamp, img), img.nbytes)
     return img
 
 
-def image_to_base64_png(img):
-    """Convert numpy array to base64-encoded PNG string."""
+def build_shared_store(force=False):
+    """
+    Decode the dataset into the shared-memory store (run once per host).
+
+    Returns the store's index, or None if the store is disabled or could
+    not be written (workers then decode images themselves).
+    """
+    if not SHM_STORE_ENABLED or not IMAGES_DIR.exists():
+        return None
+    try:
+        return build_store(IMAGES_DIR, SHM_STORE_DIR, force=force)
+    except OSError as exc:
+        log.warning("Shared image store not built in %s: %s", SHM_STORE_DIR, exc)
+        return None
+
+
+def get_image_bytes(filename):
+    """
+    Return ``(encoded_bytes, etag)`` for a dataset image, or None.
+
+    The image is encoded in the current encoding (PNG by default).  The
+    ETag is derived from the SHA-256 of the source file and the
+    encoding, so it changes exactly when either does.  Encoded bytes are
+    cached per worker.
+    """
+    digest = get_content_hash(filename)
+    if digest is None:
+        return None
+    token = encoding.current().token
+    data = _encoded_cache.get(f"{digest}/{token}")
+    if data is None:
+        img = load_image(filename)
+        if img is None:
+            return None
+        data = encoding.encode_array(img)
+        if data is None:
+            return None
+        _encoded_cache.put(f"{digest}/{token}", data)
+    return data, f"{digest[:32]}-{token}"
+
+
+def get_pyramid(filename):
+    """
+    Return ``(content_hash, ImagePyramid)`` for a dataset image, or None.
+
+    Pyramids are built on first use and cached per worker by content hash.
+    """
+    digest = get_content_hash(filename)
+    if digest is None:
+        return None
+    pyramid = _pyramid_cache.get(digest)
+    if pyramid is None:
+        img = load_image(filename)
+        if img is None:
+            return None
+        pyramid = ImagePyramid(img)
+        _pyramid_cache.put(digest, pyramid, pyramid.nbytes)
+    return digest, pyramid
+
+
+def get_pyramid_bytes(filename, level, tile_x=None, tile_y=None):
+    """
+    Return ``(encoded_bytes, etag)`` for a pyramid level or one of its tiles.
+
+    With *tile_x*/*tile_y* unset the whole level is encoded (for
+    thumbnails).  Returns None if the image, level or tile does not exist.
+    """
+    found = get_pyramid(filename)
+    if found is None:
+        return None
+    digest, pyramid = found
+    whole = tile_x is None
+    name = (f"{digest}/p{level}" + ("" if whole else f"/{tile_x}/{tile_y}")
+            + f"/{encoding.current().token}")
+    data = _encoded_cache.get(name)
+    if data is None:
+        img = pyramid.level(level) if whole else pyramid.tile(level, tile_x, tile_y)
+        if img is None:
+            return None
+        data = encoding.encode_array(img)
+        if data is None:
+            return None
+        _encoded_cache.put(name, data)
+    return data, f"{digest[:32]}-{name[len(digest) + 1:].replace('/', '-')}"
+
+
+def result_key(kind, filenames, params=()):
+    """
+    Return the content-addressed key of a computation, or None.
+
+    The key covers *kind*, ALGORITHM_VERSION, the content hash of every
+    input file, any extra *params* and the current output encoding (the
+    default PNG adds nothing, so its keys are stable).  None means an
+    input is not in the catalog.
+    """
+    hashes = [get_content_hash(f) for f in filenames]
+    if None in hashes:
+        return None
+    if encoding.current() != encoding.PNG:
+        params = (*params, encoding.current().token)
+    return make_key(kind, ALGORITHM_VERSION, *hashes, *params)
+
+
+def _cached_result(kind, filenames, params, compute):
+    """
+    Return ``compute()``, memoised on the content of *filenames*.
+
+    *kind* and *params* complete the key.  Files unknown to the catalog
+    are computed without caching (``compute`` reports the failure).
+    """
+    key = result_key(kind, filenames, params)
+    if key is None:
+        return compute()
+    result = _result_cache.get(key)
+    if result is None:
+        result = _in_flight.do(key, lambda: _compute_and_store(key, compute), kind)
+    return result
+
+
+def _compute_and_store(key, compute):
+    # A concurrent leader may have finished between our miss and now
+    result = _result_cache.get(key)
+    if result is None:
+        with admission.admitted():
+            result = compute()
+        if result is not None:
+            _result_cache.put(key, result)
+    return result
+
+
+def _admitted(compute):
+    """``compute()`` under a slot of the request's cost class."""
+    with admission.admitted():
+        return compute()
+
+
+def _coalesced(kind, filenames, params, compute):
+    """
+    Return ``compute()``, shared with concurrent identical calls.
+
+    The key is the same content-addressed key as :func:`result_key`, so
+    only calls with the same canonical parameters are merged.
+    """
+    key = result_key(kind, filenames, params)
+    if key is None:
+        return compute()
+    return _in_flight.do(key, lambda: _admitted(compute), kind)
+
+
+def get_cache_stats():
+    """Counters of the per-worker caches and request coalescing."""
+    return {
+        "images": _image_cache.stats(),
+        "encoded": _encoded_cache.stats(),
+        "results": _result_cache.stats(),
+        "coalescing": _in_flight.stats(),
+        "array_stats": stats_cache_stats(),
+    }
+
+
+def clear_caches():
+    """Drop the decoded images, encoded bytes and pyramids of this worker."""
+    _image_cache.clear()
+    _encoded_cache.clear()
+    _pyramid_cache.clear()
+
+
+def _to_base64(data):
+    """Base64 text of encoded image bytes (timed as the ``base64`` stage)."""
+    with metrics.stage('base64'):
+        return base64.b64encode(data).decode('utf-8')
+
+
+def image_to_base64(img):
+    """Encode a numpy array as a base64 string in the current encoding."""
     if img is None:
         return None
-    success, buffer = cv2.imencode('.png', img)
-    if not success:
+    data = encoding.encode_array(img)
+    if data is None:
         return None
-    return base64.b64encode(buffer).decode('utf-8')
+    return _to_base64(data)
 
 
 def compute_spatial_difference(filename1, filename2):
     """
     Compute absolute spatial difference between two images.
     Returns dict with original images, difference image, and statistics.
-    """
-    img1 = load_image(filename1)
-    img2 = load_image(filename2)
 
-    if img1 is None or img2 is None:
-        return None
+    Results are cached by the content hashes of both images.
+    """
+    return _cached_result(
+        "spatial-difference", (filename1, filename2), (),
+        lambda: _compute_spatial_difference(filename1, filename2))
 
-    # Resize if dimensions differ
-    resized = False
-    original_shapes = {"img1": img1.shape, "img2": img2.shape}
-    if img1.shape != img2.shape:
-        img2 = cv2.resize(img2, (img1.shape[1], img1.shape[0]),
-                           interpolation=cv2.INTER_AREA)
-        resized = True
 
-    # Compute absolute difference
-    diff = cv2.absdiff(img1, img2)
+def _compute_spatial_difference(filename1, filename2, pair=None):
+    """
+    Uncached implementation of :func:`compute_spatial_difference`.
 
-    # Compute enhanced difference (stretched to full range for visibility)
-    if diff.max() > 0:
-        diff_enhanced = cv2.normalize(diff, None, 0, 255, cv2.NORM_MINMAX)
-    else:
-        diff_enhanced = diff.copy()
+    *pair* is an already loaded :class:`ImagePair` to work on.
+    """
+    if pair is None:
+        pair = ImagePair.load(filename1, filename2)
+    if pair is None:
+        return None
+    diff = pair.difference
 
-    # Statistics
+    # Statistics, all derived from the difference histogram
+    st = array_stats(diff)
     stats = {
-        "mean_difference": float(np.mean(diff)),
-        "max_difference": int(np.max(diff)),
-        "min_difference": int(np.min(diff)),
-        "std_difference": float(np.std(diff)),
-        "nonzero_pixels": int(np.count_nonzero(diff)),
+        "mean_difference": st.mean,
+        "max_difference": st.max,
+        "min_difference": st.min,
+        "std_difference": st.std,
+        "nonzero_pixels": st.nonzero,
         "total_pixels": int(diff.size),
-        "nonzero_percentage": round(float(np.count_nonzero(diff)) / diff.size * 100, 2),
-        "resized": resized,
+        "nonzero_percentage": round(float(st.nonzero) / diff.size * 100, 2),
+        "percentiles": {f"p{q}": st.percentile(q) for q in (50, 95, 99)},
+        "resized": pair.resized,
         "original_shapes": {
-            "image1": list(original_shapes["img1"]),
-            "image2": list(original_shapes["img2"])
+            "image1": list(pair.image1.shape),
+            "image2": list(pair.original2.shape)
         },
-        "final_shape": list(img1.shape)
+        "final_shape": list(pair.image1.shape)
     }
 
     return {
-        "image1": image_to_base64_png(img1),
-        "image2": image_to_base64_png(img2),
-        "difference": image_to_base64_png(diff),
-        "difference_enhanced": image_to_base64_png(diff_enhanced),
+        "image1": pair.encoded_base64('image1'),
+        "image2": pair.encoded_base64('image2'),
+        "difference": pair.encoded_base64('difference'),
+        "difference_enhanced": pair.encoded_base64('difference_enhanced'),
         "stats": stats
     }
 
 
-def generate_histogram(filename):
-    """Generate histogram for an image, returned as base64 PNG."""
+def _canvas_to_base64(canvas):
+    """Encode a raster_chart canvas as a base64 string (fast PNG level)."""
+    data = encoding.encode_array(canvas, png_level=1)
+    if data is None:
+        return None
+    return _to_base64(data)
+
+
+def generate_histogram(filename, renderer=None):
+    """
+    Generate histogram for an image, returned as base64 PNG.
+
+    *renderer* is one of PLOT_RENDERERS (default: PLOT_RENDERER).
+    Matplotlib renders run in the render pool; concurrent identical
+    requests share one render.
+    """
+    renderer = renderer or PLOT_RENDERER
+    if renderer == 'raster':
+        compute = lambda: _raster_histogram(filename)
+    else:
+        compute = lambda: render_pool.run(_matplotlib_histogram, filename)
+    return _coalesced("histogram", (filename,), (renderer,), compute)
+
+
+def _raster_histogram(filename, img=None, hist=None):
+    """Image + histogram drawn with raster_chart (*img*/*hist* if already known)."""
+    if img is None:
+        img = load_image(filename)
+    if img is None:
+        return None
+    if hist is None:
+        hist = array_stats(img).hist
+    return _canvas_to_base64(raster_chart.hstack([
+        raster_chart.image_panel(img, _parse_image_name(filename), height=380),
+        raster_chart.histogram_chart([(hist, '#3498db', '')],
+                                     'Intensity Histogram', width=720, height=380),
+    ]))
+
+
+def _matplotlib_histogram(filename):
+    """Image + histogram drawn with matplotlib (runs in a render process)."""
+    from app.plotting import plt
+
     img = load_image(filename)
     if img is None:
         return None
@@ -192,7 +510,7 @@ def generate_histogram(filename):
     axes[0].axis('off')
 
     # Histogram
-    hist = cv2.calcHist([img], [0], None, [256], [0, 256])
+    hist = array_stats(img).hist
     axes[1].plot(hist, color='#2c3e50', linewidth=1.2)
     axes[1].fill_between(range(256), hist.flatten(), alpha=0.3, color='#3498db')
     axes[1].set_xlim([0, 256])
@@ -201,93 +519,244 @@ def generate_histogram(filename):
     axes[1].set_title('Intensity Histogram', fontsize=10)
     axes[1].grid(True, alpha=0.3)
 
-    fig.tight_layout()
-    buf = io.BytesIO()
-    fig.savefig(buf, format='png', dpi=120, bbox_inches='tight',
-                facecolor='#fafafa', edgecolor='none')
+    with metrics.stage('layout'):
+        fig.tight_layout()
+    data = encoding.encode_figure(fig, dpi=120, bbox_inches='tight',
+                                  facecolor='#fafafa', edgecolor='none')
     plt.close(fig)
-    buf.seek(0)
-    return base64.b64encode(buf.read()).decode('utf-8')
+    return _to_base64(data)
+
+
+class ImagePair:
+    """
+    Working set of two loaded images.
+
+    Holds both originals, image 2 resized to image 1, their absolute
+    difference and its contrast-stretched version.  Derived arrays,
+    histograms and PNG encodings are computed on first use and reused, so
+    several operations on the same pair (see :func:`run_batch`) decode,
+    resize, diff and encode each image only once.
+    """
+
+    def __init__(self, filename1, filename2, img1, img2):
+        self.filename1 = filename1
+        self.filename2 = filename2
+        self.image1 = img1
+        self.original2 = img2
+        self.resized = img1.shape != img2.shape
+        if self.resized:
+            with metrics.stage('resize'):
+                img2 = cv2.resize(img2, (img1.shape[1], img1.shape[0]),
+                                  interpolation=cv2.INTER_AREA)
+            img2.setflags(write=False)
+        self.image2 = img2
+        self._encoded = {}
+
+    @classmethod
+    def load(cls, filename1, filename2):
+        """Load both images; returns None if either cannot be read."""
+        img1 = load_image(filename1)
+        img2 = load_image(filename2)
+        if img1 is None or img2 is None:
+            return None
+        return cls(filename1, filename2, img1, img2)
+
+    @cached_property
+    def difference(self):
+        with metrics.stage('absdiff'):
+            diff = cv2.absdiff(self.image1, self.image2)
+        diff.setflags(write=False)
+        return diff
+
+    @cached_property
+    def difference_enhanced(self):
+        diff = self.difference
+        if array_stats(diff).max > 0:
+            with metrics.stage('normalize'):
+                enhanced = cv2.normalize(diff, None, 0, 255, cv2.NORM_MINMAX)
+        else:
+            enhanced = diff.copy()
+        enhanced.setflags(write=False)
+        return enhanced
+
+    def stats(self, name):
+        """:class:`app.stats.ArrayStats` of the array attribute *name*."""
+        return array_stats(getattr(self, name))
+
+    def hist(self, name):
+        """256-bin ``cv2.calcHist`` of the array attribute *name*."""
+        return self.stats(name).hist
+
+    def encoded_base64(self, name):
+        """Base64 image (current encoding) of the array attribute *name*."""
+        data = self._encoded.get(name)
+        if data is None:
+            data = self._encoded[name] = image_to_base64(getattr(self, name))
+        return data
+
+
+def generate_comparison_plot(filename1, filename2, renderer=None):
+    """
+    Generate a comprehensive comparison plot with originals, difference, and histograms.
+
+    *renderer* is one of PLOT_RENDERERS (default: PLOT_RENDERER).
+    Matplotlib renders run in the render pool; concurrent identical
+    requests share one render.
+    """
+    renderer = renderer or PLOT_RENDERER
+    if renderer == 'raster':
+        compute = lambda: _raster_comparison_plot_for(filename1, filename2)
+    else:
+        compute = lambda: render_pool.run(_matplotlib_comparison_plot,
+                                          filename1, filename2)
+    return _coalesced("comparison-plot", (filename1, filename2),
+                      comparison_plot_params(renderer), compute)
+
 
+def comparison_plot_params(renderer=None):
+    """Key parameters of :func:`generate_comparison_plot` (also its job's)."""
+    return (renderer or PLOT_RENDERER,)
 
-def generate_comparison_plot(filename1, filename2):
-    """Generate a comprehensive comparison plot with originals, difference, and histograms."""
-    img1 = load_image(filename1)
-    img2 = load_image(filename2)
 
-    if img1 is None or img2 is None:
+def _raster_comparison_plot_for(filename1, filename2):
+    """Load and diff a pair, then draw it with :func:`_raster_comparison_plot`."""
+    pair = ImagePair.load(filename1, filename2)
+    if pair is None:
         return None
+    return _raster_comparison_plot(pair)
 
-    if img1.shape != img2.shape:
-        img2 = cv2.resize(img2, (img1.shape[1], img1.shape[0]),
-                           interpolation=cv2.INTER_AREA)
-
-    diff = cv2.absdiff(img1, img2)
-    diff_enhanced = cv2.normalize(diff, None, 0, 255, cv2.NORM_MINMAX) if diff.max() > 0 else diff
-
-    fig, axes = plt.subplots(2, 4, figsize=(18, 9))
-    fig.suptitle('Spatial Difference Analysis', fontsize=14, fontweight='bold', y=0.98)
-
-    # Row 1: Images
-    axes[0, 0].imshow(img1, cmap='gray')
-    axes[0, 0].set_title(f'Image 1\n{_parse_image_name(filename1)}', fontsize=9)
-    axes[0, 0].axis('off')
-
-    axes[0, 1].imshow(img2, cmap='gray')
-    axes[0, 1].set_title(f'Image 2\n{_parse_image_name(filename2)}', fontsize=9)
-    axes[0, 1].axis('off')
-
-    axes[0, 2].imshow(diff, cmap='gray')
-    axes[0, 2].set_title('Absolute Difference\n|Image1 - Image2|', fontsize=9)
-    axes[0, 2].axis('off')
-
-    im = axes[0, 3].imshow(diff_enhanced, cmap='hot')
-    axes[0, 3].set_title('Enhanced Difference\n(Heatmap)', fontsize=9)
-    axes[0, 3].axis('off')
-    fig.colorbar(im, ax=axes[0, 3], fraction=0.046, pad=0.04)
-
-    # Row 2: Histograms
-    hist1 = cv2.calcHist([img1], [0], None, [256], [0, 256])
-    axes[1, 0].plot(hist1, color='#2c3e50', linewidth=1)
-    axes[1, 0].fill_between(range(256), hist1.flatten(), alpha=0.3, color='#3498db')
-    axes[1, 0].set_title('Histogram - Image 1', fontsize=9)
-    axes[1, 0].set_xlim([0, 256])
-    axes[1, 0].grid(True, alpha=0.3)
-
-    hist2 = cv2.calcHist([img2], [0], None, [256], [0, 256])
-    axes[1, 1].plot(hist2, color='#2c3e50', linewidth=1)
-    axes[1, 1].fill_between(range(256), hist2.flatten(), alpha=0.3, color='#e74c3c')
-    axes[1, 1].set_title('Histogram - Image 2', fontsize=9)
-    axes[1, 1].set_xlim([0, 256])
-    axes[1, 1].grid(True, alpha=0.3)
-
-    hist_diff = cv2.calcHist([diff], [0], None, [256], [0, 256])
-    axes[1, 2].plot(hist_diff, color='#2c3e50', linewidth=1)
-    axes[1, 2].fill_between(range(256), hist_diff.flatten(), alpha=0.3, color='#2ecc71')
-    axes[1, 2].set_title('Histogram - Difference', fontsize=9)
-    axes[1, 2].set_xlim([0, 256])
-    axes[1, 2].grid(True, alpha=0.3)
-
-    # Overlay histograms
-    axes[1, 3].plot(hist1, color='#3498db', linewidth=1, label='Image 1', alpha=0.7)
-    axes[1, 3].plot(hist2, color='#e74c3c', linewidth=1, label='Image 2', alpha=0.7)
-    axes[1, 3].plot(hist_diff, color='#2ecc71', linewidth=1, label='Difference', alpha=0.7)
-    axes[1, 3].set_title('Overlay Comparison', fontsize=9)
-    axes[1, 3].set_xlim([0, 256])
-    axes[1, 3].legend(fontsize=8)
-    axes[1, 3].grid(True, alpha=0.3)
 
-    fig.tight_layout()
-    buf = io.BytesIO()
-    fig.savefig(buf, format='png', dpi=120, bbox_inches='tight',
-                facecolor='white', edgecolor='none')
-    plt.close(fig)
-    buf.seek(0)
-    return base64.b64encode(buf.read()).decode('utf-8')
+def _matplotlib_comparison_plot(filename1, filename2):
+    """Comparison plot via the figure template (runs in a render process)."""
+    pair = ImagePair.load(filename1, filename2)
+    if pair is None:
+        return None
+
+    # Swap this request's data into the thread's pre-laid-out figure
+    template = figure_pool.get(ComparisonTemplate)
+    with metrics.stage('draw'):
+        template.update(
+            _parse_image_name(filename1), _parse_image_name(filename2),
+            pair.image1, pair.image2, pair.difference, pair.difference_enhanced,
+            pair.hist('image1'), pair.hist('image2'), pair.hist('difference'),
+        )
+    return _to_base64(template.render())
+
+
+def _raster_comparison_plot(pair):
+    """2x4 comparison layout of an :class:`ImagePair` drawn with raster_chart."""
+    filename1, filename2 = pair.filename1, pair.filename2
+    img1, img2 = pair.image1, pair.image2
+    diff, diff_enhanced = pair.difference, pair.difference_enhanced
+    size = 300
+    heat = raster_chart.image_panel(diff_enhanced, 'Enhanced Difference\n(Heatmap)',
+                                    height=size, max_width=size - 48,
+                                    colormap=cv2.COLORMAP_HOT)
+    images = raster_chart.hstack([
+        raster_chart.image_panel(img1, f'Image 1\n{_parse_image_name(filename1)}',
+                                 height=size, max_width=size),
+        raster_chart.image_panel(img2, f'Image 2\n{_parse_image_name(filename2)}',
+                                 height=size, max_width=size),
+        raster_chart.image_panel(diff, 'Absolute Difference\n|Image1 - Image2|',
+                                 height=size, max_width=size),
+        raster_chart.hstack([heat, raster_chart.colorbar(size, cv2.COLORMAP_HOT)], gap=0),
+    ])
+
+    hist1, hist2, hist_diff = pair.hist('image1'), pair.hist('image2'), pair.hist('difference')
+    chart = dict(width=size, height=240, xlabel='', ylabel='')
+    histograms = raster_chart.hstack([
+        raster_chart.histogram_chart([(hist1, '#3498db', '')], 'Histogram - Image 1', **chart),
+        raster_chart.histogram_chart([(hist2, '#e74c3c', '')], 'Histogram - Image 2', **chart),
+        raster_chart.histogram_chart([(hist_diff, '#2ecc71', '')], 'Histogram - Difference',
+                                     **chart),
+        raster_chart.histogram_chart([(hist1, '#3498db', 'Image 1'),
+                                      (hist2, '#e74c3c', 'Image 2'),
+                                      (hist_diff, '#2ecc71', 'Difference')],
+                                     'Overlay Comparison', style='line', legend=True,
+                                     **chart),
+    ])
+    return _canvas_to_base64(raster_chart.vstack(
+        [images, histograms], title='Spatial Difference Analysis',
+        background='#ffffff'))
+
+
+# Operations accepted by run_batch, named after their endpoints
+BATCH_OPERATIONS = ('spatial-difference', 'comparison-plot', 'step-by-step', 'histogram')
+
+
+def run_batch(filename1, filename2, operations):
+    """
+    Evaluate several operations on one image pair.
+
+    The pair is decoded, resized and diffed at most once (and only if some
+    operation is not already cached); every operation computed here works
+    on that shared :class:`ImagePair`.  Matplotlib renders still run in
+    the render pool, which maps the images from the shared store.
+
+    Parameters
+    ----------
+    filename1, filename2 : str
+        Image filenames inside IMAGES_DIR.
+    operations : list of dict
+        Each has an ``op`` from BATCH_OPERATIONS, optionally a
+        ``renderer`` (comparison-plot, histogram) and, for histogram, the
+        ``image`` to plot ('image1' or 'image2', default 'image1').
+
+    Returns
+    -------
+    list holding, per operation, the response body of the matching
+    endpoint, or None where the operation failed.
+    """
+    loaded = []
+
+    def on_pair(fn):
+        if not loaded:
+            loaded.append(ImagePair.load(filename1, filename2))
+        return None if loaded[0] is None else fn(loaded[0])
+
+    files = (filename1, filename2)
+    results = []
+    for operation in operations:
+        op = operation['op']
+        renderer = operation.get('renderer') or PLOT_RENDERER
+        if op == 'spatial-difference':
+            body = _cached_result(op, files, (), lambda: on_pair(
+                lambda pair: _compute_spatial_difference(filename1, filename2, pair)))
+        elif op == 'step-by-step':
+            body = _coalesced(op, files, (), lambda: on_pair(
+                lambda pair: _step_by_step_pipeline(filename1, filename2, pair)))
+        elif op == 'comparison-plot':
+            if renderer == 'raster':
+                plot = _coalesced(op, files, (renderer,), lambda: on_pair(_raster_comparison_plot))
+            else:
+                plot = generate_comparison_plot(filename1, filename2, renderer)
+            body = None if plot is None else {"plot": plot}
+        elif op == 'histogram':
+            which = operation.get('image', 'image1')
+            filename = filename1 if which == 'image1' else filename2
+            attr = 'image1' if which == 'image1' else 'original2'
+            if renderer == 'raster':
+                plot = _coalesced(op, (filename,), (renderer,), lambda: on_pair(
+                    lambda pair: _raster_histogram(filename, getattr(pair, attr),
+                                                   pair.hist(attr))))
+            else:
+                plot = generate_histogram(filename, renderer)
+            body = None if plot is None else {"histogram": plot}
+        else:
+            raise ValueError(f"Unknown batch operation: {op}")
+        results.append(body)
+    return results
 
 
 def generate_matplotlib_demo():
     """Generate demonstration plots showing various matplotlib capabilities."""
+    return _admitted(lambda: render_pool.run(_render_matplotlib_demo))
+
+
+def _render_matplotlib_demo():
+    """Implementation of :func:`generate_matplotlib_demo` (render process)."""
+    from app.plotting import plt
+
     demos = {}
 
     # Demo 1: Subplot layouts
@@ -310,11 +779,9 @@ def generate_matplotlib_demo():
         ax.grid(True, alpha=0.3)
 
     fig.tight_layout()
-    buf = io.BytesIO()
-    fig.savefig(buf, format='png', dpi=120, bbox_inches='tight', facecolor='white')
+    data = encoding.encode_figure(fig, dpi=120, bbox_inches='tight', facecolor='white')
     plt.close(fig)
-    buf.seek(0)
-    demos['subplot_layouts'] = base64.b64encode(buf.read()).decode('utf-8')
+    demos['subplot_layouts'] = _to_base64(data)
 
     # Demo 2: Colormaps on image data
     img = load_image('Fig0219(rose1024).tif')
@@ -330,11 +797,9 @@ def generate_matplotlib_demo():
             fig.colorbar(im, ax=ax, fraction=0.046, pad=0.04)
 
         fig.tight_layout()
-        buf = io.BytesIO()
-        fig.savefig(buf, format='png', dpi=120, bbox_inches='tight', facecolor='white')
+        data = encoding.encode_figure(fig, dpi=120, bbox_inches='tight', facecolor='white')
         plt.close(fig)
-        buf.seek(0)
-        demos['colormaps'] = base64.b64encode(buf.read()).decode('utf-8')
+        demos['colormaps'] = _to_base64(data)
 
     # Demo 3: Figure customization
     fig = plt.figure(figsize=(12, 5))
@@ -363,11 +828,9 @@ def generate_matplotlib_demo():
     ax2.set_title('Polar Plot: r = 1 + cos(3\u03b8)', pad=20)
 
     fig.tight_layout()
-    buf = io.BytesIO()
-    fig.savefig(buf, format='png', dpi=120, bbox_inches='tight', facecolor='white')
+    data = encoding.encode_figure(fig, dpi=120, bbox_inches='tight', facecolor='white')
     plt.close(fig)
-    buf.seek(0)
-    demos['figure_customization'] = base64.b64encode(buf.read()).decode('utf-8')
+    demos['figure_customization'] = _to_base64(data)
 
     return demos
 
@@ -620,6 +1083,46 @@ def get_pixel_region(filename, x, y, size=10):
     }
 
 
+# Side length of the raw pixel tiles served to the pixel viewer
+PIXEL_TILE_SIZE = 64
+
+
+def get_pixel_tile(filename, tile_x, tile_y):
+    """
+    Return one tile of raw pixel values.
+
+    Tile (tile_x, tile_y) covers PIXEL_TILE_SIZE columns starting at
+    ``tile_x * PIXEL_TILE_SIZE`` and as many rows starting at
+    ``tile_y * PIXEL_TILE_SIZE``; tiles on the right and bottom edges are
+    smaller.
+
+    Returns
+    -------
+    dict with ``data`` (row-major uint8 bytes), the tile's ``width`` and
+    ``height``, ``image_width``, ``image_height`` and an ``etag`` derived
+    from the source file's content hash.  Returns None if the image or
+    the tile does not exist.
+    """
+    digest = get_content_hash(filename)
+    img = load_image(filename) if digest is not None else None
+    if img is None:
+        return None
+
+    h, w = img.shape
+    x0, y0 = tile_x * PIXEL_TILE_SIZE, tile_y * PIXEL_TILE_SIZE
+    if tile_x < 0 or tile_y < 0 or x0 >= w or y0 >= h:
+        return None
+    tile = img[y0:y0 + PIXEL_TILE_SIZE, x0:x0 + PIXEL_TILE_SIZE]
+    return {
+        "data": tile.tobytes(),
+        "width": tile.shape[1],
+        "height": tile.shape[0],
+        "image_width": w,
+        "image_height": h,
+        "etag": f"{digest[:32]}-t{PIXEL_TILE_SIZE}-{tile_x}-{tile_y}",
+    }
+
+
 def get_step_by_step_pipeline(filename1, filename2):
     """
     Return a comprehensive dict showing every step of the spatial
@@ -633,7 +1136,17 @@ def get_step_by_step_pipeline(filename1, filename2):
     Returns
     -------
     dict with a ``steps`` list.  Each step contains *what_happened*,
-    *code*, and *data*.
+    *code*, and *data*.  Concurrent identical requests share one build.
+    """
+    return _coalesced("step-by-step", (filename1, filename2), (),
+                      lambda: _step_by_step_pipeline(filename1, filename2))
+
+
+def _step_by_step_pipeline(filename1, filename2, pair=None):
+    """
+    Implementation of :func:`get_step_by_step_pipeline`.
+
+    *pair* is an already loaded :class:`ImagePair` to work on.
     """
     path1 = IMAGES_DIR / filename1
     path2 = IMAGES_DIR / filename2
@@ -680,10 +1193,11 @@ def get_step_by_step_pipeline(filename1, filename2):
     # ------------------------------------------------------------------
     # Step 2 – After imread
     # ------------------------------------------------------------------
-    img1 = cv2.imread(str(path1), cv2.IMREAD_GRAYSCALE)
-    img2 = cv2.imread(str(path2), cv2.IMREAD_GRAYSCALE)
-    if img1 is None or img2 is None:
+    if pair is None:
+        pair = ImagePair.load(filename1, filename2)
+    if pair is None:
         return None
+    img1, img2 = pair.image1, pair.original2
 
     def _sample_5x5(img):
         """Extract a 5x5 sample from the centre of an image."""
@@ -694,15 +1208,15 @@ def get_step_by_step_pipeline(filename1, filename2):
         "image1": {
             "shape": list(img1.shape),
             "dtype": str(img1.dtype),
-            "min": int(img1.min()),
-            "max": int(img1.max()),
+            "min": array_stats(img1).min,
+            "max": array_stats(img1).max,
             "sample_5x5_center": _sample_5x5(img1),
         },
         "image2": {
             "shape": list(img2.shape),
             "dtype": str(img2.dtype),
-            "min": int(img2.min()),
-            "max": int(img2.max()),
+            "min": array_stats(img2).min,
+            "max": array_stats(img2).max,
             "sample_5x5_center": _sample_5x5(img2),
         },
     }
@@ -727,12 +1241,9 @@ def get_step_by_step_pipeline(filename1, filename2):
     # ------------------------------------------------------------------
     # Step 3 – Resize check
     # ------------------------------------------------------------------
-    resized = False
+    resized = pair.resized
     original_shape2 = list(img2.shape)
-    if img1.shape != img2.shape:
-        img2 = cv2.resize(img2, (img1.shape[1], img1.shape[0]),
-                          interpolation=cv2.INTER_AREA)
-        resized = True
+    img2 = pair.image2
 
     step3_data = {
         "resized": resized,
@@ -761,7 +1272,7 @@ def get_step_by_step_pipeline(filename1, filename2):
     # ------------------------------------------------------------------
     # Step 4 – The subtraction
     # ------------------------------------------------------------------
-    diff = cv2.absdiff(img1, img2)
+    diff = pair.difference
 
     def _sample_region(img, label=""):
         cy, cx = img.shape[0] // 2, img.shape[1] // 2
@@ -797,15 +1308,16 @@ def get_step_by_step_pipeline(filename1, filename2):
     # ------------------------------------------------------------------
     # Step 5 – Statistics
     # ------------------------------------------------------------------
+    diff_stats = pair.stats('difference')
     stats = {
-        "mean_difference": round(float(np.mean(diff)), 4),
-        "max_difference": int(np.max(diff)),
-        "min_difference": int(np.min(diff)),
-        "std_difference": round(float(np.std(diff)), 4),
-        "nonzero_pixels": int(np.count_nonzero(diff)),
+        "mean_difference": round(diff_stats.mean, 4),
+        "max_difference": diff_stats.max,
+        "min_difference": diff_stats.min,
+        "std_difference": round(diff_stats.std, 4),
+        "nonzero_pixels": diff_stats.nonzero,
         "total_pixels": int(diff.size),
         "nonzero_percentage": round(
-            float(np.count_nonzero(diff)) / diff.size * 100, 2
+            float(diff_stats.nonzero) / diff.size * 100, 2
         ),
     }
     steps.append({
@@ -830,16 +1342,14 @@ def get_step_by_step_pipeline(filename1, filename2):
     # ------------------------------------------------------------------
     # Step 6 – Normalization / enhancement
     # ------------------------------------------------------------------
-    if diff.max() > 0:
-        diff_enhanced = cv2.normalize(diff, None, 0, 255, cv2.NORM_MINMAX)
-    else:
-        diff_enhanced = diff.copy()
+    diff_enhanced = pair.difference_enhanced
 
     step6_data = {
-        "original_range": [int(diff.min()), int(diff.max())],
-        "enhanced_range": [int(diff_enhanced.min()), int(diff_enhanced.max())],
-        "diff_image": image_to_base64_png(diff),
-        "enhanced_image": image_to_base64_png(diff_enhanced),
+        "original_range": [diff_stats.min, diff_stats.max],
+        "enhanced_range": [pair.stats('difference_enhanced').min,
+                           pair.stats('difference_enhanced').max],
+        "diff_image": pair.encoded_base64('difference'),
+        "enhanced_image": pair.encoded_base64('difference_enhanced'),
     }
     steps.append({
         "step": 6,
@@ -849,7 +1359,7 @@ def get_step_by_step_pipeline(filename1, filename2):
             "0-255 range, making it look very dark. cv2.normalize stretches "
             "the values to span the full range, making subtle differences "
             "visible. Original range [{0}, {1}] is mapped to [0, 255].".format(
-                int(diff.min()), int(diff.max())
+                diff_stats.min, diff_stats.max
             )
         ),
         "code": (
@@ -862,10 +1372,99 @@ def get_step_by_step_pipeline(filename1, filename2):
     return {"steps": steps}
 
 
+# Heightmaps are decimated to at most this many samples per side; the
+# matplotlib surface plot decimates its mesh to SURFACE_MESH_SIDE.
+HEIGHTMAP_MAX_SIDE = int(os.environ.get('DIP_HEIGHTMAP_MAX_SIDE', '1024'))
+SURFACE_MESH_SIDE = int(os.environ.get('DIP_SURFACE_MESH_SIDE', '128'))
+
+
+def _surface_region(filename, region_x, region_y, region_size, max_side):
+    """
+    Return ``(digest, samples, info)`` for a square region, decimated.
+
+    The region is clamped to the image (a *region_size* of None means the
+    whole image).  Regions wider than *max_side* are read from the finest
+    pyramid level with at most *max_side* samples per side (falling back
+    to an ``INTER_AREA`` resize past the last level), so the samples are
+    averages, not a sparse pick of pixels.
+    """
+    digest = get_content_hash(filename)
+    img = load_image(filename) if digest is not None else None
+    if img is None:
+        return None
+
+    h, w = img.shape
+    if region_size is None:
+        region_size = max(w, h)
+    x0 = max(0, min(region_x, w - 1))
+    y0 = max(0, min(region_y, h - 1))
+    x1 = min(w, x0 + max(region_size, 1))
+    y1 = min(h, y0 + max(region_size, 1))
+
+    level = lod_level(x1 - x0, y1 - y0, max_side)
+    if level == 0:
+        samples = img[y0:y1, x0:x1]
+    else:
+        pyramid = get_pyramid(filename)[1]
+        level = min(level, len(pyramid.levels) - 1)
+        samples = pyramid.region(level, x0, y0, x1, y1)
+        if max(samples.shape) > max_side:
+            scale = max_side / max(samples.shape)
+            size = (max(1, round(samples.shape[1] * scale)),
+                    max(1, round(samples.shape[0] * scale)))
+            samples = cv2.resize(samples, size, interpolation=cv2.INTER_AREA)
+    info = {
+        "x": x0, "y": y0, "region_width": x1 - x0, "region_height": y1 - y0,
+        "width": samples.shape[1], "height": samples.shape[0], "level": level,
+        "image_width": w, "image_height": h,
+    }
+    return digest, samples, info
+
+
+def get_heightmap(filename, region_x=0, region_y=0, region_size=None,
+                  max_side=256):
+    """
+    Return a region's pixel intensities as a compact binary heightmap.
+
+    Parameters
+    ----------
+    filename : str
+        Image filename inside IMAGES_DIR.
+    region_x, region_y : int
+        Top-left corner of the region (column, row).
+    region_size : int or None
+        Side length of the square region; None for the whole image.
+    max_side : int
+        Level of detail: at most this many samples per side (capped at
+        HEIGHTMAP_MAX_SIDE).
+
+    Returns
+    -------
+    dict with ``data`` (row-major uint8 bytes), the sample grid's
+    ``width`` and ``height``, the clamped region (``x``, ``y``,
+    ``region_width``, ``region_height``, in full-resolution pixels), the
+    pyramid ``level`` it came from, ``image_width``, ``image_height`` and
+    an ``etag``.  Returns None if the image does not exist.
+    """
+    max_side = max(2, min(max_side, HEIGHTMAP_MAX_SIDE))
+    found = _surface_region(filename, region_x, region_y, region_size, max_side)
+    if found is None:
+        return None
+    digest, samples, info = found
+    info["data"] = np.ascontiguousarray(samples).tobytes()
+    info["etag"] = (f"{digest[:32]}-h{info['x']}-{info['y']}-"
+                    f"{info['region_width']}x{info['region_height']}-{max_side}")
+    return info
+
+
 def generate_surface_plot(filename, region_x=0, region_y=0, region_size=64):
     """
     Generate a 3-D surface plot of pixel intensities for a region.
 
+    This is the server-rendered fallback to the interactive heightmap
+    view (:func:`get_heightmap`).  Regions of any size are accepted; the
+    mesh is decimated to at most SURFACE_MESH_SIDE points per side.
+
     Parameters
     ----------
     filename : str
@@ -873,39 +1472,51 @@ def generate_surface_plot(filename, region_x=0, region_y=0, region_size=64):
     region_x, region_y : int
         Top-left corner of the region (column, row).
     region_size : int
-        Side length of the square region (capped at 128 for performance).
+        Side length of the square region.
 
     Returns
     -------
-    Base64-encoded PNG string, or None on failure.
+    Base64-encoded PNG string, or None on failure.  Rendered in the
+    render pool.
     """
-    from mpl_toolkits.mplot3d import Axes3D  # noqa: F401 -- registers '3d' projection
+    return _coalesced(
+        "surface-plot", (filename,),
+        surface_plot_params(region_x, region_y, region_size),
+        lambda: render_pool.run(_render_surface_plot, filename, region_x,
+                                region_y, region_size))
 
-    img = load_image(filename)
-    if img is None:
-        return None
 
-    h, w = img.shape
-    region_size = min(region_size, 128)  # cap for performance
+def surface_plot_params(region_x, region_y, region_size):
+    """Key parameters of :func:`generate_surface_plot` (also its job's)."""
+    return region_x, region_y, region_size, SURFACE_MESH_SIDE
+
 
-    # Clamp region to image bounds
-    x_start = max(0, min(region_x, w - 1))
-    y_start = max(0, min(region_y, h - 1))
-    x_end = min(w, x_start + region_size)
-    y_end = min(h, y_start + region_size)
+def _render_surface_plot(filename, region_x, region_y, region_size):
+    """Implementation of :func:`generate_surface_plot` (render process)."""
+    from app.plotting import plt  # also registers the '3d' projection
 
-    region = img[y_start:y_end, x_start:x_end].astype(np.float64)
+    found = _surface_region(filename, region_x, region_y, region_size,
+                            SURFACE_MESH_SIDE)
+    if found is None:
+        return None
+    samples, info = found[1:]
+
+    x_start, y_start = info["x"], info["y"]
+    x_end = x_start + info["region_width"]
+    y_end = y_start + info["region_height"]
+    region = samples.astype(np.float64)
 
-    # Build coordinate grids
-    X = np.arange(x_start, x_end)
-    Y = np.arange(y_start, y_end)
+    # Build coordinate grids (in full-resolution pixels, also when decimated)
+    X = x_start + np.arange(info["width"]) * (info["region_width"] / info["width"])
+    Y = y_start + np.arange(info["height"]) * (info["region_height"] / info["height"])
     X, Y = np.meshgrid(X, Y)
 
     fig = plt.figure(figsize=(10, 7))
     ax = fig.add_subplot(111, projection='3d')
 
-    ax.plot_surface(X, Y, region, cmap='viridis', edgecolor='none',
-                    alpha=0.9, rstride=1, cstride=1)
+    with metrics.stage('draw'):
+        ax.plot_surface(X, Y, region, cmap='viridis', edgecolor='none',
+                        alpha=0.9, rstride=1, cstride=1)
 
     ax.set_xlabel('X (column)')
     ax.set_ylabel('Y (row)')
@@ -917,12 +1528,10 @@ def generate_surface_plot(filename, region_x=0, region_y=0, region_size=64):
     )
     ax.view_init(elev=35, azim=225)
 
-    buf = io.BytesIO()
-    fig.savefig(buf, format='png', dpi=120, bbox_inches='tight',
-                facecolor='white', edgecolor='none')
+    data = encoding.encode_figure(fig, dpi=120, bbox_inches='tight',
+                                  facecolor='white', edgecolor='none')
     plt.close(fig)
-    buf.seek(0)
-    return base64.b64encode(buf.read()).decode('utf-8')
+    return _to_base64(data)
 
 
 def compute_pixel_arithmetic(val1, val2):
@@ -1021,63 +1630,127 @@ def compute_pixel_arithmetic(val1, val2):
     }
 
 
-def generate_bit_depth_comparison(filename):
+# Bit depths shown by default, and the base quantisation LUT of each depth
+BIT_DEPTHS = (8, 4, 2, 1)
+_QUANTISE_LUTS = {
+    bits: (np.arange(256) // (256 >> bits) * (256 >> bits)).astype(np.uint8)
+    for bits in range(1, 9)
+}
+
+
+def bit_depth_lut(bits, hist):
+    """
+    Return the 256-entry LUT that quantises to ``2 ** bits`` levels.
+
+    The quantised levels are stretched to 0-255 over the range actually
+    present in the image (*hist* is its 256-bin histogram), exactly like
+    ``cv2.normalize(..., NORM_MINMAX)`` on the quantised image.  8 bits is
+    the identity.
+    """
+    lut = _QUANTISE_LUTS[bits]
+    if bits == 8:
+        return lut
+    present = (np.asarray(hist).reshape(-1) > 0).astype(np.uint8)
+    return cv2.normalize(lut, np.zeros_like(lut), 0, 255, cv2.NORM_MINMAX,
+                         mask=present).reshape(-1)
+
+
+def generate_bit_depth_comparison(filename, renderer=None, bit_depths=BIT_DEPTHS,
+                                  composite=False):
     """
-    Show the same image quantised to 8, 4, 2, and 1 bit depths,
-    each accompanied by its histogram.
+    Show the same image quantised to several bit depths, each
+    accompanied by its histogram.
 
     Parameters
     ----------
     filename : str
         Image filename inside IMAGES_DIR.
+    renderer : str, optional
+        One of PLOT_RENDERERS (default: PLOT_RENDERER).
+    bit_depths : sequence of int
+        Bit depths (1-8) to show, in order (default: 8, 4, 2, 1).
+    composite : bool
+        Return every panel stacked in one PNG instead of one PNG each.
 
     Returns
     -------
-    dict mapping bit-depth labels to base64 PNG strings (image + histogram).
-    Returns None on failure.
+    dict mapping bit-depth labels (``"4_bit"``) to base64 PNG strings
+    (image + histogram), or ``{"composite": png}``.  Returns None on
+    failure.  Results are cached by the content hash of the image.
+    """
+    renderer = renderer or PLOT_RENDERER
+    bit_depths = tuple(int(b) for b in bit_depths)
+    params = (renderer, ",".join(map(str, bit_depths)), int(bool(composite)))
+    if renderer == 'raster':
+        compute = lambda: _bit_depth_comparison(filename, bit_depths, renderer, composite)
+    else:
+        compute = lambda: render_pool.run(_bit_depth_comparison, filename, bit_depths,
+                                          renderer, composite)
+    return _cached_result("bit-depth", (filename,), params, compute)
+
+
+def _raster_bit_depth_canvas(bits, quantised, hist):
+    """One quantised image + bar histogram drawn with raster_chart."""
+    return raster_chart.hstack([
+        raster_chart.image_panel(quantised, f'{bits}-bit  ({2 ** bits} levels)',
+                                 height=340, background='#ffffff'),
+        raster_chart.histogram_chart([(hist, '#3498db', '')],
+                                     f'Histogram  ({bits}-bit)', style='bar',
+                                     width=520, height=340,
+                                     background='#ffffff'),
+    ], background='#ffffff')
+
+
+def _matplotlib_bit_depth_canvas(bits, quantised, hist):
+    """One panel via the thread's pre-laid-out bit-depth figure, as BGR."""
+    template = figure_pool.get(BitDepthTemplate)
+    with metrics.stage('draw'):
+        template.update(bits, quantised, hist)
+        rgb = template.render_array()
+    return cv2.cvtColor(rgb, cv2.COLOR_RGB2BGR)
+
+
+def _matplotlib_bit_depth_panel(bits, quantised, hist):
+    """One panel via the thread's pre-laid-out bit-depth figure, as PNG."""
+    template = figure_pool.get(BitDepthTemplate)
+    with metrics.stage('draw'):
+        template.update(bits, quantised, hist)
+    return _to_base64(template.render())
+
+
+def _bit_depth_comparison(filename, bit_depths, renderer, composite):
+    """
+    Quantise *filename* to each bit depth and render the panels.
+
+    The source histogram is computed once; every depth is one ``cv2.LUT``
+    pass, and its histogram is the source histogram pushed through the
+    same LUT.  Runs in a render process for matplotlib.
     """
     img = load_image(filename)
     if img is None:
         return None
+    src_hist = array_stats(img).counts
 
-    results = {}
-    bit_depths = [8, 4, 2, 1]
+    if renderer == 'raster':
+        render_canvas = _raster_bit_depth_canvas
+        render_panel = lambda *a: _canvas_to_base64(_raster_bit_depth_canvas(*a))
+    else:
+        render_canvas = _matplotlib_bit_depth_canvas
+        render_panel = _matplotlib_bit_depth_panel
 
+    results = {}
+    canvases = []
     for bits in bit_depths:
-        levels = 2 ** bits  # number of quantisation levels
-        if bits == 8:
-            quantised = img.copy()
+        lut = bit_depth_lut(bits, src_hist)
+        quantised = cv2.LUT(img, lut)
+        hist = np.bincount(lut, weights=src_hist, minlength=256)
+        if composite:
+            canvases.append(render_canvas(bits, quantised, hist))
         else:
-            # Quantise: divide into `levels` bins, then scale back to 0-255
-            step = 256 // levels
-            quantised = (img // step) * step
-            # Map to full 0-255 for display
-            quantised = cv2.normalize(quantised, None, 0, 255,
-                                      cv2.NORM_MINMAX).astype(np.uint8)
-
-        # Build a figure with the image and its histogram side by side
-        fig, axes = plt.subplots(1, 2, figsize=(10, 4))
-
-        axes[0].imshow(quantised, cmap='gray', vmin=0, vmax=255)
-        axes[0].set_title(f'{bits}-bit  ({levels} levels)', fontsize=11,
-                          fontweight='bold')
-        axes[0].axis('off')
-
-        hist = cv2.calcHist([quantised], [0], None, [256], [0, 256])
-        axes[1].bar(range(256), hist.flatten(), color='#3498db', width=1.0,
-                    edgecolor='none')
-        axes[1].set_xlim([0, 256])
-        axes[1].set_xlabel('Pixel Intensity')
-        axes[1].set_ylabel('Frequency')
-        axes[1].set_title(f'Histogram  ({bits}-bit)', fontsize=11)
-        axes[1].grid(True, alpha=0.3)
-
-        fig.tight_layout()
-        buf = io.BytesIO()
-        fig.savefig(buf, format='png', dpi=120, bbox_inches='tight',
-                    facecolor='white', edgecolor='none')
-        plt.close(fig)
-        buf.seek(0)
-        results[f"{bits}_bit"] = base64.b64encode(buf.read()).decode('utf-8')
+            results[f"{bits}_bit"] = render_panel(bits, quantised, hist)
 
+    if composite:
+        return {"composite": _canvas_to_base64(
+            raster_chart.vstack(canvases, gap=0, background='#ffffff'))}
     return results
+
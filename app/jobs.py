@@ -0,0 +1,190 @@
+"""
+Asynchronous render jobs.
+
+Slow renders (the 3-D surface plot, the full comparison plot) can be
+submitted as jobs instead of holding a request thread and an nginx
+connection for seconds.  Submitting returns a job id at once; the client
+polls the job's status and fetches the result when it is done.
+
+Job ids are the content-addressed result key of the render, so identical
+parameters map to the same job, on any worker.  Job state and results are
+plain JSON files in a directory shared by all workers on the host, so a
+status poll may land on a different worker than the one that runs the
+job.  Finished jobs are kept for ``ttl`` seconds.
+
+A worker refreshes the status of the jobs it holds (queued or running)
+every ``stale_after / 4`` seconds, so only the jobs of a worker that went
+away go stale and are started again.
+"""
+
+import contextvars
+import fcntl
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+
+class JobQueue:
+    """
+    File-backed job table with a small per-worker executor.
+
+    Parameters
+    ----------
+    job_dir : Path
+        Directory holding ``<id>.json`` (status) and ``<id>.result.json``.
+    ttl : float
+        Seconds a finished or failed job (and its result) is kept.
+    threads : int
+        Jobs run concurrently by this worker.  The renders themselves go
+        through the render pool, so this only bounds how many queue there.
+    stale_after : float
+        A queued/running job whose heartbeat is this old is assumed lost
+        (its worker was recycled) and is started again on the next submit.
+    """
+
+    PRUNE_EVERY = 64    # submits between expired-job scans
+
+    def __init__(self, job_dir, ttl, threads, stale_after):
+        self.job_dir = Path(job_dir)
+        self.ttl = ttl
+        self.stale_after = stale_after
+        self.threads = threads
+        self._executor = None
+        self._lock = threading.Lock()
+        self._submits = 0
+        self._held = {}         # id -> status of this worker's unfinished jobs
+
+    def _status_path(self, job_id):
+        return self.job_dir / f"{job_id}.json"
+
+    def _result_path(self, job_id):
+        return self.job_dir / f"{job_id}.result.json"
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(self.threads,
+                                                    thread_name_prefix="job")
+                threading.Thread(target=self._heartbeat, name="job-heartbeat",
+                                 daemon=True).start()
+            return self._executor
+
+    def _heartbeat(self):
+        """Keep the held jobs' ``updated_at`` fresh while they queue and run."""
+        while True:
+            time.sleep(self.stale_after / 4)
+            with self._lock:
+                for job_id, job in list(self._held.items()):
+                    try:
+                        self._held[job_id] = self._store(dict(job, updated_at=time.time()))
+                    except OSError:
+                        pass
+
+    def _write(self, path, data):
+        tmp = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}")
+        tmp.write_bytes(data)
+        os.replace(tmp, path)
+
+    def _store(self, job):
+        self._write(self._status_path(job["id"]), json.dumps(job).encode())
+        return job
+
+    def _set_state(self, job, state, error=None):
+        job = dict(job, state=state, updated_at=time.time())
+        if error is not None:
+            job["error"] = error
+        finished = state in ("done", "failed")
+        if finished:
+            job["expires_at"] = job["updated_at"] + self.ttl
+        # Under the lock: a heartbeat must not rewrite an older state
+        with self._lock:
+            if finished:
+                self._held.pop(job["id"], None)
+            else:
+                self._held[job["id"]] = job
+            return self._store(job)
+
+    def _is_live(self, job):
+        """False for expired jobs and for unfinished jobs nobody is running."""
+        now = time.time()
+        if job["state"] in ("done", "failed"):
+            return job.get("expires_at", 0) > now
+        return now - job["updated_at"] < self.stale_after
+
+    def status(self, job_id):
+        """Return the status dict of a live job, or None."""
+        try:
+            job = json.loads(self._status_path(job_id).read_bytes())
+        except (OSError, ValueError):
+            return None
+        return job if self._is_live(job) else None
+
+    def result(self, job_id):
+        """Return the raw JSON result bytes of a finished job, or None."""
+        job = self.status(job_id)
+        if job is None or job["state"] != "done":
+            return None
+        try:
+            return self._result_path(job_id).read_bytes()
+        except OSError:
+            return None
+
+    def submit(self, job_id, kind, compute):
+        """
+        Start job *job_id* unless a live job with that id exists.
+
+        *compute* is called on a job thread and returns a JSON-serialisable
+        result, or None on failure.  Returns the job's status dict.
+        """
+        self.job_dir.mkdir(parents=True, exist_ok=True)
+        self._maybe_prune()
+
+        job = self.status(job_id)
+        if job is not None and job["state"] != "failed":
+            return job
+
+        # Check again and take the job over under a host-wide lock: when
+        # workers race (or a lost job is replaced), exactly one starts it
+        with open(self.job_dir / ".submit.lock", "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            job = self.status(job_id)
+            if job is not None and job["state"] != "failed":
+                return job
+            now = time.time()
+            job = self._set_state({"id": job_id, "kind": kind, "created_at": now},
+                                  "queued")
+
+        # Run under the submitting request's context (its output encoding)
+        self._get_executor().submit(contextvars.copy_context().run,
+                                    self._run, job, compute)
+        return job
+
+    def _run(self, job, compute):
+        job = self._set_state(job, "running")
+        try:
+            result = compute()
+        except Exception as exc:  # reported through the job status
+            self._set_state(job, "failed", error=str(exc) or type(exc).__name__)
+            return
+        if result is None:
+            self._set_state(job, "failed", error="Render failed. Check the parameters.")
+            return
+        self._write(self._result_path(job["id"]),
+                    json.dumps(result, separators=(',', ':')).encode())
+        self._set_state(job, "done")
+
+    def _maybe_prune(self):
+        with self._lock:
+            self._submits += 1
+            if self._submits % self.PRUNE_EVERY:
+                return
+        for path in self.job_dir.glob("*.json"):
+            if path.name.endswith(".result.json"):
+                continue
+            job_id = path.name[:-len(".json")]
+            if self.status(job_id) is None:
+                path.unlink(missing_ok=True)
+                self._result_path(job_id).unlink(missing_ok=True)
@@ -0,0 +1,556 @@
+"""
+Load-test harness for the real gunicorn/Flask stack.
+
+For each worker configuration the harness starts gunicorn (with
+``gunicorn.conf.py``, overriding workers, threads and worker class),
+drives it with simulated users for a fixed time, and reports throughput,
+latency percentiles, error rates and worker memory::
+
+    python -m app.loadtest --configs 2x8:gthread,4x1:sync --users 50 --duration 60
+
+Each user keeps one keep-alive connection, like a browser tab, and runs
+actions picked at random by weight (``--mix``).  The actions mirror what
+``app.js`` sends:
+
+* ``images``             -- GET /api/images (every page load)
+* ``thumbnail``          -- GET /api/pyramid/<level>/<file> (gallery thumbnails)
+* ``tile``               -- GET /api/tile/<tx>/<ty>/<file> (pixel explorer)
+* ``pixel-view``         -- POST /api/pixel-view
+* ``spatial-difference`` -- POST /api/spatial-difference on a recommended pair
+* ``batch``              -- POST /api/batch, difference + step-by-step
+* ``histogram``          -- POST /api/histogram
+* ``comparison-plot``    -- POST /api/comparison-plot as a job, polled to completion
+* ``surface-plot``       -- POST /api/surface-plot as a job, random region
+* ``heightmap``          -- GET /api/heightmap/<file>, random region
+
+Latency is end to end per action, so a job's latency includes its polling.
+A response is an error if it has a 4xx/5xx status, times out or fails to
+connect; 503s from load shedding are counted separately.  Worker memory
+is sampled every second from ``/proc``.  RSS counts the shared image
+store in every worker, while PSS splits shared pages between processes,
+so summed PSS is the real footprint.
+
+Every configuration starts with an empty DIP_CACHE_DIR.  Results go to
+``--out`` (or stdout) as JSON, with a summary table on stderr.
+"""
+
+import argparse
+import http.client
+import json
+import os
+import random
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from urllib.parse import quote
+
+import numpy as np
+
+from app.pyramid import lod_level
+
+
+REPO_DIR = Path(__file__).parent.parent
+THUMBNAIL_SIDE = 280        # gallery thumbnail box, in device pixels
+
+DEFAULT_MIX = {
+    "images": 1,
+    "thumbnail": 6,
+    "tile": 3,
+    "pixel-view": 1,
+    "spatial-difference": 1,
+    "batch": 1,
+    "histogram": 0.5,
+    "comparison-plot": 0.5,
+    "surface-plot": 0.25,
+    "heightmap": 0.5,
+}
+
+
+class Client:
+    """One keep-alive HTTP connection, reopened after errors."""
+
+    def __init__(self, port, timeout):
+        self.port = port
+        self.timeout = timeout
+        self._conn = None
+
+    def request(self, method, path, payload=None):
+        """Return ``(status, body)``; raises OSError/HTTPException on failure."""
+        headers = {'Accept': 'image/webp,*/*'}
+        body = None
+        if payload is not None:
+            body = json.dumps(payload)
+            headers['Content-Type'] = 'application/json'
+        reused = self._conn is not None
+        try:
+            return self._send(method, path, body, headers)
+        except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+            if not reused:
+                raise
+        # The server closed the idle keep-alive connection; browsers retry too
+        return self._send(method, path, body, headers)
+
+    def _send(self, method, path, body, headers):
+        if self._conn is None:
+            self._conn = http.client.HTTPConnection('127.0.0.1', self.port,
+                                                    timeout=self.timeout)
+        try:
+            self._conn.request(method, path, body=body, headers=headers)
+            resp = self._conn.getresponse()
+            return resp.status, resp.read()
+        except (OSError, http.client.HTTPException):
+            self._conn.close()
+            self._conn = None
+            raise
+
+    def json(self, method, path, payload=None):
+        status, body = self.request(method, path, payload)
+        try:
+            return status, json.loads(body)
+        except ValueError:
+            return status, None
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+
+
+class Dataset:
+    """Image listing and recommended pairs, fetched once per run."""
+
+    def __init__(self, listing):
+        self.images = listing["images"]
+        self.pairs = listing["recommended_pairs"]
+
+    def image(self, rng):
+        return rng.choice(self.images)
+
+    def pair(self, rng):
+        return rng.choice(self.pairs)
+
+
+def _path(filename):
+    return quote(filename)
+
+
+def _region(img, rng, size):
+    size = min(size, img["width"], img["height"])
+    return (rng.randrange(img["width"] - size + 1),
+            rng.randrange(img["height"] - size + 1), size)
+
+
+def _job(client, url, payload):
+    """Submit an async render like app.js and poll it to completion."""
+    payload = dict(payload, refs=True, **{"async": True})
+    status, data = client.json('POST', url, payload)
+    if status >= 400 or not isinstance(data, dict) or 'status_url' not in data:
+        return status
+    delay = 0.25
+    while data.get('state') in ('queued', 'running'):
+        time.sleep(delay)
+        delay = min(delay * 1.5, 1.5)
+        status, data = client.json('GET', data['status_url'])
+        if status >= 400 or not isinstance(data, dict):
+            return status
+    if data.get('state') != 'done':
+        return 500
+    status, _ = client.request('GET', data['result_url'] + '?refs=1')
+    return status
+
+
+def action_images(client, dataset, rng):
+    return client.request('GET', '/api/images')[0]
+
+
+def action_thumbnail(client, dataset, rng):
+    img = dataset.image(rng)
+    level = lod_level(img["width"], img["height"], THUMBNAIL_SIDE)
+    return client.request('GET', f"/api/pyramid/{level}/{_path(img['filename'])}"
+                                 f"?v={img['content_hash'][:12]}")[0]
+
+
+def action_tile(client, dataset, rng):
+    img = dataset.image(rng)
+    tx = rng.randrange(-(-img["width"] // 64))
+    ty = rng.randrange(-(-img["height"] // 64))
+    return client.request('GET', f"/api/tile/{tx}/{ty}/{_path(img['filename'])}"
+                                 f"?v={img['content_hash'][:12]}")[0]
+
+
+def action_pixel_view(client, dataset, rng):
+    img = dataset.image(rng)
+    return client.request('POST', '/api/pixel-view', {
+        "filename": img["filename"], "x": rng.randrange(img["width"]),
+        "y": rng.randrange(img["height"]), "size": 10})[0]
+
+
+def action_spatial_difference(client, dataset, rng):
+    pair = dataset.pair(rng)
+    return client.request('POST', '/api/spatial-difference', {
+        "image1": pair["image1"], "image2": pair["image2"], "refs": True})[0]
+
+
+def action_batch(client, dataset, rng):
+    pair = dataset.pair(rng)
+    return client.request('POST', '/api/batch', {
+        "image1": pair["image1"], "image2": pair["image2"],
+        "operations": [{"op": "spatial-difference"}, {"op": "step-by-step"}],
+        "refs": True})[0]
+
+
+def action_histogram(client, dataset, rng):
+    img = dataset.image(rng)
+    return client.request('POST', '/api/histogram',
+                          {"filename": img["filename"], "refs": True})[0]
+
+
+def action_comparison_plot(client, dataset, rng):
+    pair = dataset.pair(rng)
+    return _job(client, '/api/comparison-plot',
+                {"image1": pair["image1"], "image2": pair["image2"]})
+
+
+def action_surface_plot(client, dataset, rng):
+    img = dataset.image(rng)
+    x, y, size = _region(img, rng, rng.choice((32, 64, 128)))
+    return _job(client, '/api/surface-plot',
+                {"filename": img["filename"], "x": x, "y": y, "size": size})
+
+
+def action_heightmap(client, dataset, rng):
+    img = dataset.image(rng)
+    x, y, size = _region(img, rng, rng.choice((64, 256, 1024)))
+    return client.request('GET', f"/api/heightmap/{_path(img['filename'])}"
+                                 f"?x={x}&y={y}&size={size}&max_side=256"
+                                 f"&v={img['content_hash'][:12]}")[0]
+
+
+ACTIONS = {
+    "images": action_images,
+    "thumbnail": action_thumbnail,
+    "tile": action_tile,
+    "pixel-view": action_pixel_view,
+    "spatial-difference": action_spatial_difference,
+    "batch": action_batch,
+    "histogram": action_histogram,
+    "comparison-plot": action_comparison_plot,
+    "surface-plot": action_surface_plot,
+    "heightmap": action_heightmap,
+}
+
+
+def parse_mix(text):
+    """Parse ``name=weight,...``; names not given keep weight 0."""
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in ACTIONS:
+            raise ValueError(f"unknown action {name!r}; choose from {', '.join(ACTIONS)}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def parse_config(text):
+    """Parse ``<workers>x<threads>[:<worker_class>]`` into a dict."""
+    size, _, worker_class = text.partition(':')
+    workers, _, threads = size.partition('x')
+    threads = int(threads or 1)
+    return {"name": text, "workers": int(workers), "threads": threads,
+            "worker_class": worker_class or ('gthread' if threads > 1 else 'sync')}
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _process_tree(pid):
+    """Return ``(children, descendants)`` PIDs of *pid*, by parent pid from /proc."""
+    parents = {}
+    for entry in Path('/proc').iterdir():
+        if not entry.name.isdigit():
+            continue
+        try:
+            stat = (entry / 'stat').read_text()
+        except OSError:
+            continue
+        # The command name may contain spaces; fields resume after ')'
+        parents.setdefault(int(stat.rsplit(')', 1)[1].split()[1]), []).append(int(entry.name))
+    found, frontier = [], [pid]
+    while frontier:
+        children = parents.get(frontier.pop(), [])
+        found.extend(children)
+        frontier.extend(children)
+    return parents.get(pid, []), found
+
+
+def _memory(pid):
+    """Return ``(rss_bytes, pss_bytes)`` of a process (PSS None if unreadable)."""
+    rss = pss = None
+    try:
+        for line in Path(f'/proc/{pid}/status').read_text().splitlines():
+            if line.startswith('VmRSS:'):
+                rss = int(line.split()[1]) * 1024
+    except OSError:
+        return None, None
+    try:
+        for line in Path(f'/proc/{pid}/smaps_rollup').read_text().splitlines():
+            if line.startswith('Pss:'):
+                pss = int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return rss, pss
+
+
+class MemorySampler:
+    """Peak RSS/PSS of the gunicorn workers and of the whole process tree."""
+
+    def __init__(self, master_pid, interval=1.0):
+        self.master_pid = master_pid
+        self.interval = interval
+        self.peak = {"worker_rss_max": 0, "workers_rss_total": 0,
+                     "tree_rss_total": 0, "tree_pss_total": 0}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def sample(self):
+        workers, descendants = _process_tree(self.master_pid)
+        tree = [self.master_pid] + descendants
+        worker_rss = [_memory(pid)[0] or 0 for pid in workers]
+        tree_mem = [_memory(pid) for pid in tree]
+        current = {
+            "worker_rss_max": max(worker_rss, default=0),
+            "workers_rss_total": sum(worker_rss),
+            "tree_rss_total": sum(rss or 0 for rss, _ in tree_mem),
+            "tree_pss_total": sum(pss or 0 for _, pss in tree_mem),
+        }
+        for key, value in current.items():
+            self.peak[key] = max(self.peak[key], value)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        return {key: round(value / 2 ** 20, 1) for key, value in self.peak.items()}
+
+
+def _render_processes(config):
+    """Render processes per worker: DIP_RENDER_PROCESSES, else cores / workers."""
+    return int(os.environ.get('DIP_RENDER_PROCESSES')
+               or max(1, (os.cpu_count() or 1) // config["workers"]))
+
+
+def start_server(config, port, cache_dir, log_path):
+    """Start gunicorn for *config*; returns the Popen once /health answers."""
+    env = dict(os.environ, DIP_CACHE_DIR=str(cache_dir),
+               DIP_RENDER_PROCESSES=str(_render_processes(config)))
+    cmd = [sys.executable, '-m', 'gunicorn', '-c', str(REPO_DIR / 'gunicorn.conf.py'),
+           '--bind', f'127.0.0.1:{port}',
+           '--workers', str(config["workers"]), '--threads', str(config["threads"]),
+           '--worker-class', config["worker_class"],
+           '--access-logfile', os.devnull, '--error-logfile', str(log_path),
+           'app.main:app']
+    proc = subprocess.Popen(cmd, cwd=REPO_DIR, env=env, start_new_session=True)
+    deadline = time.monotonic() + 120
+    client = Client(port, timeout=5)
+    try:
+        while time.monotonic() < deadline:
+            if proc.poll() is not None:
+                raise RuntimeError(f"gunicorn exited with {proc.returncode}; see {log_path}")
+            try:
+                if client.request('GET', '/health')[0] == 200:
+                    client.close()
+                    return proc
+            except (OSError, http.client.HTTPException):
+                pass
+            time.sleep(0.25)
+        raise RuntimeError(f"gunicorn did not become healthy; see {log_path}")
+    except BaseException:
+        stop_server(proc)
+        raise
+
+
+def stop_server(proc):
+    """Stop gunicorn, then kill what is left of its session (render processes)."""
+    try:
+        os.killpg(proc.pid, signal.SIGTERM)
+        proc.wait(timeout=40)
+    except subprocess.TimeoutExpired:
+        pass
+    except ProcessLookupError:
+        return
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+    proc.wait()
+
+
+def _user(port, dataset, mix, deadline, seed, timeout, think, samples):
+    rng = random.Random(seed)
+    names, weights = list(mix), list(mix.values())
+    client = Client(port, timeout)
+    while time.monotonic() < deadline:
+        name = rng.choices(names, weights)[0]
+        started = time.monotonic()
+        try:
+            status = ACTIONS[name](client, dataset, rng)
+        except socket.timeout:
+            status = 'timeout'
+        except (OSError, http.client.HTTPException):
+            status = 'connection'
+        samples.append((name, started, time.monotonic() - started, status))
+        if think:
+            time.sleep(rng.expovariate(1 / think))
+    client.close()
+
+
+def _latency(seconds):
+    ms = np.array(seconds) * 1000 if seconds else np.zeros(1)
+    return {
+        "p50": round(float(np.percentile(ms, 50)), 1),
+        "p95": round(float(np.percentile(ms, 95)), 1),
+        "p99": round(float(np.percentile(ms, 99)), 1),
+        "max": round(float(ms.max()), 1),
+    }
+
+
+def summarise(samples, window):
+    """Throughput, latency and errors of ``(action, start, seconds, status)`` samples."""
+    def stats(rows):
+        statuses = {}
+        for _, _, _, status in rows:
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+        errors = sum(n for status, n in statuses.items()
+                     if not status.isdigit() or int(status) >= 400)
+        return {
+            "requests": len(rows),
+            "throughput_rps": round(len(rows) / window, 2),
+            "errors": errors,
+            "error_rate": round(errors / len(rows), 4) if rows else 0.0,
+            "shed_503": statuses.get("503", 0),
+            "latency_ms": _latency([seconds for _, _, seconds, _ in rows]),
+            "statuses": statuses,
+        }
+
+    by_action = {}
+    for row in samples:
+        by_action.setdefault(row[0], []).append(row)
+    return stats(samples), {name: stats(rows) for name, rows in sorted(by_action.items())}
+
+
+def run_config(config, args, mix):
+    """Start gunicorn with *config*, drive it and return its report."""
+    port = _free_port()
+    with tempfile.TemporaryDirectory(prefix="dip-load-") as tmp:
+        log_path = Path(tmp) / "error.log"
+        proc = start_server(config, port, Path(tmp) / "cache", log_path)
+        try:
+            _, listing = Client(port, args.timeout).json('GET', '/api/images')
+            dataset = Dataset(listing)
+            memory = MemorySampler(proc.pid)
+            memory.sample()
+            idle_pss = memory.peak["tree_pss_total"]
+            memory.start()
+
+            samples = []
+            started = time.monotonic()
+            measure_from = started + args.warmup
+            deadline = measure_from + args.duration
+            users = [threading.Thread(target=_user, daemon=True, args=(
+                port, dataset, mix, deadline, args.seed + i, args.timeout,
+                args.think, samples)) for i in range(args.users)]
+            for user in users:
+                user.start()
+                time.sleep(args.ramp / max(args.users, 1))
+            for user in users:
+                user.join()
+            peak = memory.stop()
+        finally:
+            stop_server(proc)
+
+    measured = [row for row in samples if row[1] >= measure_from]
+    overall, by_action = summarise(measured, args.duration)
+    return dict(config, users=args.users, duration_s=args.duration,
+                render_processes=_render_processes(config),
+                **overall,
+                memory_mb=dict(peak, idle_tree_pss_total=round(idle_pss / 2 ** 20, 1)),
+                by_action=by_action)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m app.loadtest",
+        description="Drive gunicorn with a classroom traffic mix and report "
+                    "throughput, latency, errors and memory per configuration.")
+    parser.add_argument("--configs", default="2x8:gthread,4x1:sync",
+                        help="worker configurations, <workers>x<threads>[:<class>], "
+                             "comma-separated (default: %(default)s)")
+    parser.add_argument("--users", type=int, default=50,
+                        help="concurrent simulated users (default: 50)")
+    parser.add_argument("--duration", type=float, default=60,
+                        help="measured seconds per configuration (default: 60)")
+    parser.add_argument("--warmup", type=float, default=10,
+                        help="unmeasured seconds at the start (default: 10)")
+    parser.add_argument("--ramp", type=float, default=5,
+                        help="seconds over which users start (default: 5)")
+    parser.add_argument("--think", type=float, default=1.0,
+                        help="mean pause between a user's actions in seconds, "
+                             "0 for a closed loop (default: 1)")
+    parser.add_argument("--mix", type=parse_mix,
+                        default=DEFAULT_MIX,
+                        help="action weights, name=weight,... (default: "
+                             + ",".join(f"{k}={v:g}" for k, v in DEFAULT_MIX.items()) + ")")
+    parser.add_argument("--timeout", type=float, default=60,
+                        help="per-request timeout in seconds (default: 60)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", type=Path,
+                        help="write the report JSON here (default: stdout)")
+    args = parser.parse_args(argv)
+    mix = {name: weight for name, weight in args.mix.items() if weight > 0}
+
+    reports = []
+    for text in args.configs.split(','):
+        config = parse_config(text)
+        print(f"{config['name']}: {config['workers']} x {config['worker_class']} worker(s), "
+              f"{config['threads']} thread(s); {args.users} users for "
+              f"{args.warmup:g}+{args.duration:g}s", file=sys.stderr)
+        report = run_config(config, args, mix)
+        reports.append(report)
+        lat = report["latency_ms"]
+        print(f"  {report['throughput_rps']:8.1f} req/s  p50 {lat['p50']:8.1f}  "
+              f"p95 {lat['p95']:8.1f}  p99 {lat['p99']:8.1f} ms  "
+              f"errors {report['error_rate']:.2%} (503: {report['shed_503']})  "
+              f"PSS {report['memory_mb']['tree_pss_total']:.0f} MiB  "
+              f"worker RSS {report['memory_mb']['worker_rss_max']:.0f} MiB", file=sys.stderr)
+        for name, stats in report["by_action"].items():
+            lat = stats["latency_ms"]
+            print(f"    {name:<20} {stats['requests']:6d}  p50 {lat['p50']:8.1f}  "
+                  f"p95 {lat['p95']:8.1f}  p99 {lat['p99']:8.1f} ms  "
+                  f"errors {stats['errors']}", file=sys.stderr)
+
+    text = json.dumps({"generated_at": int(time.time()), "cpu_count": os.cpu_count(),
+                       "users": args.users, "think_s": args.think, "mix": mix,
+                       "configs": reports}, indent=1)
+    if args.out:
+        args.out.write_text(text + "\n")
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -4,28 +4,367 @@ Course: CSU2543 | Faculty: Ishani Sharma | Shoolini University
 Student: Divya Mohan | BTech CSE Cybersecurity | Semester 8
 """
 
-from flask import Flask, render_template, jsonify, request, send_from_directory
+import base64
+import json
+import os
+import time
+
+from flask import (Flask, Response, g, render_template, jsonify, request,
+                   send_file, send_from_directory)
+from app import admission, encoding, metrics, profiling
 from app.image_processor import (
     get_available_images,
     compute_spatial_difference,
     generate_histogram,
     generate_comparison_plot,
+    comparison_plot_params,
     generate_matplotlib_demo,
     RECOMMENDED_PAIRS,
+    BIT_DEPTHS,
+    BATCH_OPERATIONS,
+    PLOT_RENDERERS,
     MATPLOTLIB_REFERENCE,
-    load_image,
-    image_to_base64_png,
+    get_cache_stats,
+    get_image_bytes,
+    get_pyramid,
+    get_pyramid_bytes,
     get_pixel_region,
+    get_pixel_tile,
+    PIXEL_TILE_SIZE,
     get_step_by_step_pipeline,
     generate_surface_plot,
+    surface_plot_params,
+    get_heightmap,
     compute_pixel_arithmetic,
     generate_bit_depth_comparison,
+    render_pool,
+    result_key,
+    run_batch,
+    CACHE_DIR,
 )
+from app.blob_store import BlobStore, MIMETYPES as BLOB_MIMETYPES
+from app.jobs import JobQueue
+from app.render_pool import RenderQueueFull
+from app.precompute import PrecomputedStore
 
 app = Flask(__name__,
             template_folder='templates',
             static_folder='static')
 
+# Curated plots rendered offline by `python -m app.precompute`.  When nginx
+# fronts the app, set DIP_PRECOMPUTED_ACCEL to its internal location (e.g.
+# /_precomputed/) and the files are sent by nginx via X-Accel-Redirect.
+precomputed = PrecomputedStore()
+PRECOMPUTED_ACCEL = os.environ.get('DIP_PRECOMPUTED_ACCEL', '')
+
+
+# Rendered images can be returned as /api/blob/<sha256>.<ext> URLs instead
+# of inline base64 ("refs": true in the body, or ?refs=1).  Blobs live in
+# DIP_CACHE_DIR/blobs, shared by the workers, and never change.
+blobs = BlobStore(CACHE_DIR / "blobs",
+                  int(os.environ.get('DIP_BLOB_DISK_MB', '1024')) * 1024 * 1024)
+
+
+# Opt-in profiling: requests carrying DIP_PROFILE_TOKEN (X-Profile header
+# or ?profile=) and a DIP_PROFILE_SAMPLE_RATE fraction of all requests are
+# profiled into DIP_CACHE_DIR/profiles.  With neither set, nothing is wrapped.
+PROFILE_TOKEN = os.environ.get('DIP_PROFILE_TOKEN') or None
+PROFILE_SAMPLE_RATE = float(os.environ.get('DIP_PROFILE_SAMPLE_RATE', '0'))
+profiles = profiling.ProfileStore(CACHE_DIR / "profiles",
+                                  int(os.environ.get('DIP_PROFILE_KEEP', '50')))
+profiler = None
+if PROFILE_TOKEN or PROFILE_SAMPLE_RATE > 0:
+    profiler = profiling.ProfilingMiddleware(app.wsgi_app, profiles,
+                                             PROFILE_TOKEN, PROFILE_SAMPLE_RATE,
+                                             skip_paths=('/api/profiles', '/metrics'))
+    app.wsgi_app = profiler
+
+
+def wants_refs():
+    """True if the client asked for blob URLs instead of inline images."""
+    if request.args.get('refs') in ('1', 'true'):
+        return True
+    data = request.get_json(silent=True) if request.is_json else None
+    return isinstance(data, dict) and data.get('refs') is True
+
+
+def wants_async(data):
+    """True if a JSON body asks for the render to run as a job ("async": true)."""
+    return isinstance(data, dict) and data.get('async') is True
+
+
+def image_json(body):
+    """
+    JSON response for a body holding base64 images (or their blob URLs).
+
+    Images in another encoding than PNG are announced by a top-level
+    ``"format"``, as in job results.
+    """
+    enc = encoding.current()
+    if enc != encoding.PNG and 'format' not in body:
+        body = dict(body, format=enc.format)
+    return jsonify(blobs.to_refs(body) if wants_refs() else body)
+
+
+def precomputed_response(kind, filenames):
+    """Return the precomputed response body for a request, or None."""
+    if encoding.current() != encoding.PNG:      # artifacts hold PNG images
+        return None
+    if wants_refs():
+        body = precomputed.load(kind, filenames)
+        return None if body is None else image_json(body)
+    rel = precomputed.lookup(kind, filenames)
+    if rel is None:
+        return None
+    if PRECOMPUTED_ACCEL:
+        resp = Response(mimetype='application/json')
+        resp.headers['X-Accel-Redirect'] = PRECOMPUTED_ACCEL + rel
+        return resp
+
+    path = precomputed.out_dir / rel
+    gz = path.with_name(path.name + '.gz')
+    if 'gzip' in request.accept_encodings and gz.exists():
+        resp = send_file(gz, mimetype='application/json')
+        resp.headers['Content-Encoding'] = 'gzip'
+    else:
+        resp = send_file(path, mimetype='application/json')
+    resp.vary.add('Accept-Encoding')
+    return resp
+
+
+# Slow renders can run as jobs: POST with "async": true returns 202 and a
+# job id (the render's content-addressed key) to poll.  Job files live in
+# DIP_CACHE_DIR/jobs so any worker can answer a poll.
+jobs = JobQueue(CACHE_DIR / "jobs",
+                ttl=float(os.environ.get('DIP_JOB_TTL', '3600')),
+                threads=int(os.environ.get('DIP_JOB_THREADS', '2')),
+                stale_after=float(os.environ.get('DIP_JOB_STALE', '300')))
+
+
+def job_status(job):
+    """Public view of a job's status dict."""
+    body = {k: job[k] for k in ('id', 'kind', 'state', 'created_at', 'updated_at')}
+    if 'error' in job:
+        body['error'] = job['error']
+    if 'expires_at' in job:
+        body['expires_at'] = job['expires_at']
+    body['status_url'] = f"/api/jobs/{job['id']}"
+    body['result_url'] = f"/api/jobs/{job['id']}/result"
+    return body
+
+
+def submit_job(kind, filenames, params, compute):
+    """Start (or join) the job for a render and answer 202, or None."""
+    job_id = result_key(kind, filenames, params)
+    if job_id is None:
+        return None
+    job = jobs.submit(job_id, kind, compute)
+    resp = jsonify(job_status(job))
+    resp.status_code = 200 if job['state'] == 'done' else 202
+    resp.headers['Location'] = f"/api/jobs/{job_id}"
+    return resp
+
+
+def image_response(encoded):
+    """Cacheable image response for ``(bytes, etag)`` from the processor."""
+    data, etag = encoded
+    resp = Response(data, mimetype=encoding.current().mimetype)
+    resp.set_etag(etag)
+    resp.cache_control.public = True
+    resp.cache_control.max_age = 7 * 24 * 3600
+    return resp.make_conditional(request)
+
+
+def invalid_renderer(data):
+    """Return a 400 response if the request names an unknown plot renderer."""
+    renderer = data.get('renderer')
+    if renderer is not None and renderer not in PLOT_RENDERERS:
+        return jsonify({"error": "'renderer' must be one of: "
+                                 + ", ".join(PLOT_RENDERERS)}), 400
+    return None
+
+
+# Per-request metrics: stage timings go out as Server-Timing; counters and
+# histograms are exported at /metrics, summed over the gunicorn workers.
+metrics_exporter = metrics.MultiProcessExporter(metrics.metrics_dir(CACHE_DIR))
+
+
+def _cache_counters():
+    """Cache hit/miss and coalescing counters for the metrics snapshot."""
+    stats = get_cache_stats()
+    counters = {("dip_coalesced_requests_total", ()): stats["coalescing"]["absorbed_total"]}
+    for cache in ("images", "encoded", "results", "array_stats"):
+        counters[("dip_cache_hits_total", (("cache", cache),))] = stats[cache]["hits"]
+        counters[("dip_cache_misses_total", (("cache", cache),))] = stats[cache]["misses"]
+    return counters
+
+
+metrics.registry.add_collector(_cache_counters)
+
+
+@app.before_request
+def start_metrics():
+    """Start the request clock, the stage log and the in-flight gauge."""
+    g.started = time.perf_counter()
+    g.stage_log = metrics.start_log()
+    g.endpoint_label = request.endpoint or 'unmatched'
+    metrics.registry.add_gauge('dip_http_requests_in_flight',
+                               {'endpoint': g.endpoint_label}, 1)
+
+
+@app.after_request
+def record_metrics(resp):
+    """Emit Server-Timing and record latency, size and status."""
+    elapsed = time.perf_counter() - g.started
+    resp.headers['Server-Timing'] = metrics.server_timing(g.stage_log, elapsed)
+    labels = {'endpoint': g.endpoint_label}
+    metrics.registry.inc('dip_http_requests_total',
+                         dict(labels, method=request.method, status=resp.status_code))
+    metrics.registry.observe('dip_http_request_duration_seconds', labels, elapsed)
+    metrics.registry.observe('dip_http_response_bytes', labels,
+                             resp.content_length or 0, buckets=metrics.SIZE_BUCKETS)
+    return resp
+
+
+@app.teardown_request
+def finish_metrics(exc):
+    if 'endpoint_label' in g:
+        metrics.registry.add_gauge('dip_http_requests_in_flight',
+                                   {'endpoint': g.endpoint_label}, -1)
+    metrics_exporter.write()
+
+
+# Output encoding: every endpoint takes an explicit `format` / `quality`
+# (query string or JSON body).  Endpoints that answer with image bytes also
+# negotiate from Accept, offering the formats in DIP_ACCEPT_FORMATS.
+ACCEPT_FORMATS = [f for f in os.environ.get('DIP_ACCEPT_FORMATS', 'webp').split(',') if f]
+NEGOTIATED_ENDPOINTS = {'api_image_bin', 'api_pyramid_level', 'api_pyramid_tile'}
+
+
+@app.before_request
+def select_encoding():
+    """Make the request's output encoding current; 400 on a bad choice."""
+    g.encode_log = encoding.start_log()
+    if request.endpoint == 'api_job_result':     # fixed when the job was submitted
+        return None
+    fmt, quality = request.args.get('format'), request.args.get('quality')
+    if fmt is None and request.is_json:
+        data = request.get_json(silent=True)
+        if isinstance(data, dict):
+            fmt, quality = data.get('format'), data.get('quality')
+    try:
+        if fmt is not None:
+            enc = encoding.parse(fmt, quality)
+        elif quality is not None:
+            raise ValueError("'quality' requires 'format'")
+        elif request.endpoint in NEGOTIATED_ENDPOINTS:
+            enc = encoding.negotiate(request.accept_mimetypes, ACCEPT_FORMATS)
+        else:
+            return None
+    except ValueError as exc:
+        return jsonify({"error": str(exc)}), 400
+    g.encoding_token = encoding.use(enc)
+    return None
+
+
+@app.after_request
+def report_encoding(resp):
+    """Report this request's encodes: format(s), total bytes and time."""
+    if request.endpoint in NEGOTIATED_ENDPOINTS:
+        resp.vary.add('Accept')
+    entries = getattr(g, 'encode_log', None)
+    if entries:
+        resp.headers['X-Encode-Format'] = ','.join(
+            dict.fromkeys(token for token, _, _ in entries))
+        resp.headers['X-Encode-Bytes'] = str(sum(size for _, size, _ in entries))
+        resp.headers['X-Encode-Ms'] = f"{sum(t for _, _, t in entries) * 1000:.2f}"
+    return resp
+
+
+@app.teardown_request
+def reset_encoding(exc):
+    token = g.pop('encoding_token', None)
+    if token is not None:
+        encoding.reset(token)
+
+
+@app.errorhandler(RenderQueueFull)
+def render_queue_full(exc):
+    """Shed load quickly instead of queueing renders until the timeout."""
+    resp = jsonify({"error": "Server busy rendering, please retry shortly.",
+                    "retry_after": exc.retry_after})
+    resp.status_code = 503
+    resp.headers['Retry-After'] = str(exc.retry_after)
+    return resp
+
+
+# Admission control: each endpoint has a cost class.  Limited classes run
+# at most `limit` requests per worker at once, queue `queue` more for up to
+# `deadline` seconds, and shed the rest with 503 + Retry-After, so heavy
+# renders cannot take every gthread thread from the cheap lookups.  The
+# slot is taken around the actual render or computation (image_processor),
+# so precomputed, cached and coalesced responses never queue.  Set
+# DIP_ADMISSION_<CLASS> to "limit,queue,deadline", or "off" (defaults in
+# app/admission.py).
+ENDPOINT_COSTS = {
+    'api_comparison_plot': 'render',
+    'api_surface_plot': 'render',
+    'api_histogram': 'render',
+    'api_bit_depth': 'render',
+    'api_matplotlib_demos': 'render',
+    'api_batch': 'render',
+    'api_spatial_difference': 'compute',
+    'api_step_by_step': 'compute',
+}                            # every other endpoint is 'cheap' (unlimited)
+
+
+admission_control = admission.AdmissionController(admission.classes_from_env())
+
+
+def request_cost():
+    """Cost class of the current request; async job submissions are cheap."""
+    cost = ENDPOINT_COSTS.get(request.endpoint, 'cheap')
+    if cost != 'cheap' and request.is_json and wants_async(request.get_json(silent=True)):
+        return 'cheap'
+    return cost
+
+
+@app.before_request
+def select_cost_class():
+    """Make the request's cost class current for admission.admitted()."""
+    g.cost_token = admission.use(admission_control.get(request_cost()))
+
+
+@app.teardown_request
+def reset_cost_class(exc):
+    token = g.pop('cost_token', None)
+    if token is not None:
+        admission.reset(token)
+
+
+@app.errorhandler(admission.Overloaded)
+def overloaded(exc):
+    """Shed requests that found their cost class's queue full or waited too long."""
+    resp = jsonify({"error": "Server busy, please retry shortly.",
+                    "cost_class": exc.cost_class,
+                    "retry_after": exc.retry_after})
+    resp.status_code = 503
+    resp.headers['Retry-After'] = str(exc.retry_after)
+    return resp
+
+
+def _admission_counters():
+    """Admitted and rejected counts per cost class for the metrics snapshot."""
+    counters = {}
+    for name, stats in admission_control.stats().items():
+        labels = (("class", name),)
+        counters[("dip_admission_admitted_total", labels)] = stats["admitted"]
+        counters[("dip_admission_rejected_total", labels)] = stats["rejected"]
+    return counters
+
+
+metrics.registry.add_collector(_admission_counters)
+
 
 @app.route('/')
 def index():
@@ -47,11 +386,69 @@ def api_images():
 @app.route('/api/image/<path:filename>')
 def api_image(filename):
     """Serve a specific image as base64 PNG."""
-    img = load_image(filename)
-    if img is None:
+    encoded = get_image_bytes(filename)
+    if encoded is None:
+        return jsonify({"error": f"Image not found: {filename}"}), 404
+    b64 = base64.b64encode(encoded[0]).decode('utf-8')
+    return image_json({"image": b64, "filename": filename})
+
+
+@app.route('/api/image-bin/<path:filename>')
+def api_image_bin(filename):
+    """Serve a specific image as raw PNG bytes, cacheable by ETag."""
+    encoded = get_image_bytes(filename)
+    if encoded is None:
         return jsonify({"error": f"Image not found: {filename}"}), 404
-    b64 = image_to_base64_png(img)
-    return jsonify({"image": b64, "filename": filename})
+    return image_response(encoded)
+
+
+@app.route('/api/pyramid-info/<path:filename>')
+def api_pyramid_info(filename):
+    """Describe the levels and tile grid of an image's pyramid."""
+    found = get_pyramid(filename)
+    if found is None:
+        return jsonify({"error": f"Image not found: {filename}"}), 404
+    digest, pyramid = found
+    info = pyramid.info()
+    info["filename"] = filename
+    info["content_hash"] = digest
+    return jsonify(info)
+
+
+@app.route('/api/pyramid/<int:level>/<path:filename>')
+def api_pyramid_level(level, filename):
+    """Serve a whole pyramid level as PNG (level 0 is full resolution)."""
+    encoded = get_pyramid_bytes(filename, level)
+    if encoded is None:
+        return jsonify({"error": f"Level not found: {filename} ({level})"}), 404
+    return image_response(encoded)
+
+
+@app.route('/api/pyramid/<int:level>/<int:tile_x>/<int:tile_y>/<path:filename>')
+def api_pyramid_tile(level, tile_x, tile_y, filename):
+    """Serve one tile of a pyramid level as PNG."""
+    encoded = get_pyramid_bytes(filename, level, tile_x, tile_y)
+    if encoded is None:
+        return jsonify({"error": f"Tile not found: {filename} "
+                                 f"({level}, {tile_x}, {tile_y})"}), 404
+    return image_response(encoded)
+
+
+@app.route('/api/blob/<name>')
+def api_blob(name):
+    """Serve a stored image by content hash; the bytes never change."""
+    path = blobs.path(name)
+    try:
+        if path is None:
+            raise FileNotFoundError(name)
+        resp = send_file(path, mimetype=BLOB_MIMETYPES[name.rsplit('.', 1)[1]],
+                         max_age=365 * 24 * 3600, etag=False, conditional=False)
+    except OSError:
+        return jsonify({"error": f"Blob not found: {name}"}), 404
+    resp.set_etag(name.split('.', 1)[0])
+    resp.cache_control.public = True
+    resp.cache_control.immutable = True
+    return resp.make_conditional(request)
 
 
 @app.route('/api/spatial-difference', methods=['POST'])
@@ -65,7 +462,7 @@ def api_spatial_difference():
     if result is None:
         return jsonify({"error": "Failed to process images. Check filenames."}), 400
 
-    return jsonify(result)
+    return image_json(result)
 
 
 @app.route('/api/histogram', methods=['POST'])
@@ -74,12 +471,21 @@ def api_histogram():
     data = request.get_json()
     if not data or 'filename' not in data:
         return jsonify({"error": "Provide 'filename'"}), 400
+    error = invalid_renderer(data)
+    if error is not None:
+        return error
+
+    # Precomputed artifacts are rendered with the default renderer
+    if 'renderer' not in data:
+        cached = precomputed_response('histogram', (data['filename'],))
+        if cached is not None:
+            return cached
 
-    result = generate_histogram(data['filename'])
+    result = generate_histogram(data['filename'], renderer=data.get('renderer'))
     if result is None:
         return jsonify({"error": "Failed to generate histogram"}), 400
 
-    return jsonify({"histogram": result})
+    return image_json({"histogram": result})
 
 
 @app.route('/api/comparison-plot', methods=['POST'])
@@ -89,11 +495,144 @@ def api_comparison_plot():
     if not data or 'image1' not in data or 'image2' not in data:
         return jsonify({"error": "Provide 'image1' and 'image2' filenames"}), 400
 
-    result = generate_comparison_plot(data['image1'], data['image2'])
+    error = invalid_renderer(data)
+    if error is not None:
+        return error
+
+    if 'renderer' not in data:
+        cached = precomputed_response('comparison-plot', (data['image1'], data['image2']))
+        if cached is not None:
+            return cached
+
+    if wants_async(data):
+        renderer = data.get('renderer')
+        resp = submit_job(
+            'comparison-plot', (data['image1'], data['image2']),
+            comparison_plot_params(renderer),
+            lambda: _plot_body(generate_comparison_plot(
+                data['image1'], data['image2'], renderer=renderer)))
+        if resp is None:
+            return jsonify({"error": "Failed to generate comparison plot"}), 400
+        return resp
+
+    result = generate_comparison_plot(data['image1'], data['image2'],
+                                      renderer=data.get('renderer'))
     if result is None:
         return jsonify({"error": "Failed to generate comparison plot"}), 400
 
-    return jsonify({"plot": result})
+    return image_json({"plot": result})
+
+
+def _plot_body(plot):
+    """Response body of the plot endpoints, as stored for a job."""
+    if plot is None:
+        return None
+    body = {"plot": plot}
+    if encoding.current() != encoding.PNG:
+        body["format"] = encoding.current().format
+    return body
+
+
+@app.route('/api/jobs/<job_id>')
+def api_job_status(job_id):
+    """Poll an asynchronous render job."""
+    job = jobs.status(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown or expired job"}), 404
+    resp = jsonify(job_status(job))
+    resp.cache_control.no_store = True
+    return resp
+
+
+@app.route('/api/jobs/<job_id>/result')
+def api_job_result(job_id):
+    """
+    Return a finished job's result: the JSON body of the synchronous
+    endpoint, or with ``?format=image`` (or ``png``) the plot as raw image
+    bytes, in the format the job was submitted with.
+    """
+    job = jobs.status(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown or expired job"}), 404
+    if job['state'] != 'done':
+        resp = jsonify(job_status(job))
+        resp.status_code = 400 if job['state'] == 'failed' else 409
+        return resp
+    raw = jobs.result(job_id)
+    if raw is None:
+        return jsonify({"error": "Unknown or expired job"}), 404
+
+    variant = request.args.get('format', 'json')
+    if variant in ('image', 'png'):
+        body = json.loads(raw)
+        resp = Response(base64.b64decode(body['plot']),
+                        mimetype=encoding.MIMETYPES[body.get('format', 'png')])
+    elif wants_refs():
+        resp = image_json(json.loads(raw))
+        variant += '-refs'
+    else:
+        resp = Response(raw, mimetype='application/json')
+    # Job ids are content-addressed: a given id always has the same result
+    resp.set_etag(f"{job_id[:32]}-{variant}")
+    resp.cache_control.public = True
+    resp.cache_control.max_age = int(max(0, job['expires_at'] - time.time()))
+    return resp.make_conditional(request)
+
+
+MAX_BATCH_OPERATIONS = 16
+
+
+@app.route('/api/batch', methods=['POST'])
+def api_batch():
+    """
+    Run several operations on one image pair and return all results.
+
+    Body: ``{"image1", "image2", "operations": [{"op": ..., ...}, ...]}``
+    with ops from BATCH_OPERATIONS.  Each result is ``{"op", "result"}``
+    holding the body the single endpoint would return, or ``{"op",
+    "error"}``.
+    """
+    data = request.get_json()
+    if not data or 'image1' not in data or 'image2' not in data:
+        return jsonify({"error": "Provide 'image1' and 'image2' filenames"}), 400
+    operations = data.get('operations')
+    if not isinstance(operations, list) or not operations:
+        return jsonify({"error": "Provide a non-empty 'operations' list"}), 400
+    if len(operations) > MAX_BATCH_OPERATIONS:
+        return jsonify({"error": f"At most {MAX_BATCH_OPERATIONS} operations per batch"}), 400
+    for operation in operations:
+        if not isinstance(operation, dict) or operation.get('op') not in BATCH_OPERATIONS:
+            return jsonify({"error": "Each operation needs an 'op' from: "
+                                     + ", ".join(BATCH_OPERATIONS)}), 400
+        if operation.get('image', 'image1') not in ('image1', 'image2'):
+            return jsonify({"error": "'image' must be 'image1' or 'image2'"}), 400
+        error = invalid_renderer(operation)
+        if error is not None:
+            return error
+
+    files = (data['image1'], data['image2'])
+    results = [None] * len(operations)
+    pending = []
+    for i, operation in enumerate(operations):
+        # Precomputed artifacts are rendered with the default renderer
+        if 'renderer' not in operation:
+            target = (files if operation['op'] != 'histogram'
+                      else (files[operation.get('image') == 'image2'],))
+            results[i] = precomputed.load(operation['op'], target)
+        if results[i] is None:
+            pending.append(i)
+
+    if pending:
+        computed = run_batch(data['image1'], data['image2'],
+                             [operations[i] for i in pending])
+        for i, body in zip(pending, computed):
+            results[i] = body
+
+    return image_json({"results": [
+        {"op": operation['op'], "result": body} if body is not None
+        else {"op": operation['op'], "error": "Operation failed. Check filenames."}
+        for operation, body in zip(operations, results)
+    ]})
 
 
 @app.route('/api/matplotlib-reference')
@@ -106,7 +645,72 @@ def api_matplotlib_reference():
 def api_matplotlib_demos():
     """Generate and return matplotlib demonstration plots."""
     demos = generate_matplotlib_demo()
-    return jsonify({"demos": demos})
+    return image_json({"demos": demos})
+
+
+@app.route('/api/render-pool')
+def api_render_pool():
+    """Render pool queue depth and wait times (per gunicorn worker)."""
+    return jsonify(render_pool.stats())
+
+
+@app.route('/api/admission')
+def api_admission():
+    """Admission limits, occupancy and wait times per cost class (per worker)."""
+    return jsonify({"classes": admission_control.stats(),
+                    "endpoints": ENDPOINT_COSTS})
+
+
+@app.route('/api/cache-stats')
+def api_cache_stats():
+    """Cache and request-coalescing counters (per gunicorn worker)."""
+    return jsonify(get_cache_stats())
+
+
+@app.route('/api/encoding-stats')
+def api_encoding_stats():
+    """Encode count, mean size and mean time per output encoding (per worker)."""
+    return jsonify(encoding.stats())
+
+
+@app.route('/metrics')
+def api_metrics():
+    """Prometheus text exposition, aggregated over all gunicorn workers."""
+    return Response(metrics.render_prometheus(metrics_exporter.collect()),
+                    mimetype='text/plain; version=0.0.4')
+
+
+def profiles_allowed():
+    """Captures are served only to requests carrying the profiling token."""
+    # Without a token (sample-rate profiling only) captures stay on disk:
+    # they hold code paths and arguments, and behind nginx every request
+    # looks local, so there is no safe way to serve them unauthenticated.
+    return profiler is not None and profiler.authorized(request.environ)
+
+
+@app.route('/api/profiles')
+def api_profiles():
+    """Recent profile captures, newest first."""
+    if not profiles_allowed():
+        return jsonify({"error": "Profiling is not enabled"}), 404
+    limit = request.args.get('limit', 50, type=int)
+    return jsonify({"profiles": profiles.list(limit)})
+
+
+@app.route('/api/profiles/<name>.<ext>')
+def api_profile_file(name, ext):
+    """One capture file: .pstats, .collapsed (flamegraph input) or .json."""
+    if not profiles_allowed():
+        return jsonify({"error": "Profiling is not enabled"}), 404
+    path = profiles.path(name, ext)
+    try:
+        if path is None:
+            raise FileNotFoundError(name)
+        return send_file(path, as_attachment=ext == 'pstats',
+                         mimetype='application/octet-stream' if ext == 'pstats'
+                         else 'application/json' if ext == 'json' else 'text/plain')
+    except OSError:
+        return jsonify({"error": f"Profile not found: {name}.{ext}"}), 404
 
 
 @app.route('/health')
@@ -137,6 +741,30 @@ def api_pixel_view():
     return jsonify(result)
 
 
+@app.route('/api/tile/<int:tile_x>/<int:tile_y>/<path:filename>')
+def api_tile(tile_x, tile_y, filename):
+    """
+    Serve a PIXEL_TILE_SIZE square tile of raw uint8 pixel values.
+
+    The body is row-major bytes; the tile and image sizes are sent as
+    ``X-Tile-*`` and ``X-Image-*`` headers.  Tiles are cacheable by URL
+    and revalidated by ETag.
+    """
+    tile = get_pixel_tile(filename, tile_x, tile_y)
+    if tile is None:
+        return jsonify({"error": f"Tile not found: {filename} ({tile_x}, {tile_y})"}), 404
+    resp = Response(tile['data'], mimetype='application/octet-stream')
+    resp.headers['X-Tile-Size'] = str(PIXEL_TILE_SIZE)
+    resp.headers['X-Tile-Width'] = str(tile['width'])
+    resp.headers['X-Tile-Height'] = str(tile['height'])
+    resp.headers['X-Image-Width'] = str(tile['image_width'])
+    resp.headers['X-Image-Height'] = str(tile['image_height'])
+    resp.set_etag(tile['etag'])
+    resp.cache_control.public = True
+    resp.cache_control.max_age = 7 * 24 * 3600
+    return resp.make_conditional(request)
+
+
 @app.route('/api/step-by-step', methods=['POST'])
 def api_step_by_step():
     """Return a comprehensive step-by-step breakdown of the spatial
@@ -145,11 +773,15 @@ def api_step_by_step():
     if not data or 'image1' not in data or 'image2' not in data:
         return jsonify({"error": "Provide 'image1' and 'image2' filenames"}), 400
 
+    cached = precomputed_response('step-by-step', (data['image1'], data['image2']))
+    if cached is not None:
+        return cached
+
     result = get_step_by_step_pipeline(data['image1'], data['image2'])
     if result is None:
         return jsonify({"error": "Failed to process images. Check filenames."}), 400
 
-    return jsonify(result)
+    return image_json(result)
 
 
 @app.route('/api/surface-plot', methods=['POST'])
@@ -163,12 +795,57 @@ def api_surface_plot():
     y = int(data.get('y', 0))
     size = int(data.get('size', 64))
 
+    if wants_async(data):
+        resp = submit_job(
+            'surface-plot', (data['filename'],), surface_plot_params(x, y, size),
+            lambda: _plot_body(generate_surface_plot(
+                data['filename'], region_x=x, region_y=y, region_size=size)))
+        if resp is None:
+            return jsonify({"error": "Failed to generate surface plot."}), 400
+        return resp
+
     result = generate_surface_plot(data['filename'], region_x=x, region_y=y,
                                    region_size=size)
     if result is None:
         return jsonify({"error": "Failed to generate surface plot."}), 400
 
-    return jsonify({"plot": result})
+    return image_json({"plot": result})
+
+
+@app.route('/api/heightmap/<path:filename>')
+def api_heightmap(filename):
+    """Serve a region's intensities as a binary heightmap for the 3-D viewer.
+
+    Query parameters ``x``, ``y`` and ``size`` select the square region
+    (the whole image without ``size``); ``max_side`` sets the level of
+    detail.  The body is row-major uint8; the sample grid and region are
+    described in ``X-Heightmap-*`` headers.
+    """
+    try:
+        x = int(request.args.get('x', 0))
+        y = int(request.args.get('y', 0))
+        size = request.args.get('size')
+        size = int(size) if size is not None else None
+        max_side = int(request.args.get('max_side', 256))
+    except ValueError:
+        return jsonify({"error": "x, y, size and max_side must be integers"}), 400
+
+    heightmap = get_heightmap(filename, region_x=x, region_y=y, region_size=size,
+                              max_side=max_side)
+    if heightmap is None:
+        return jsonify({"error": f"Image not found: {filename}"}), 404
+    resp = Response(heightmap['data'], mimetype='application/octet-stream')
+    resp.headers['X-Heightmap-Width'] = str(heightmap['width'])
+    resp.headers['X-Heightmap-Height'] = str(heightmap['height'])
+    resp.headers['X-Heightmap-Level'] = str(heightmap['level'])
+    resp.headers['X-Heightmap-Region'] = '{x},{y},{region_width},{region_height}'.format(
+        **heightmap)
+    resp.headers['X-Image-Width'] = str(heightmap['image_width'])
+    resp.headers['X-Image-Height'] = str(heightmap['image_height'])
+    resp.set_etag(heightmap['etag'])
+    resp.cache_control.public = True
+    resp.cache_control.max_age = 7 * 24 * 3600
+    return resp.make_conditional(request)
 
 
 @app.route('/api/pixel-arithmetic', methods=['POST'])
@@ -194,16 +871,40 @@ def api_pixel_arithmetic():
 @app.route('/api/bit-depth', methods=['POST'])
 def api_bit_depth():
     """Return base64 PNGs showing the same image at 8, 4, 2, and 1-bit
-    depth with corresponding histograms."""
+    depth (or the depths in 'bits') with corresponding histograms, one
+    PNG per depth or, with "layout": "composite", all in one PNG."""
     data = request.get_json()
     if not data or 'filename' not in data:
         return jsonify({"error": "Provide 'filename'"}), 400
 
-    result = generate_bit_depth_comparison(data['filename'])
+    error = invalid_renderer(data)
+    if error is not None:
+        return error
+
+    bits = data.get('bits', list(BIT_DEPTHS))
+    if (not isinstance(bits, list) or not 0 < len(bits) <= 8
+            or not all(isinstance(b, int) and not isinstance(b, bool) and 1 <= b <= 8
+                       for b in bits)
+            or len(set(bits)) != len(bits)):
+        return jsonify({"error": "'bits' must be a list of distinct integers 1-8"}), 400
+    layout = data.get('layout', 'panels')
+    if layout not in ('panels', 'composite'):
+        return jsonify({"error": "'layout' must be 'panels' or 'composite'"}), 400
+
+    # Precomputed artifacts are the default panels with the default renderer
+    if 'renderer' not in data and layout == 'panels' and tuple(bits) == BIT_DEPTHS:
+        cached = precomputed_response('bit-depth', (data['filename'],))
+        if cached is not None:
+            return cached
+
+    result = generate_bit_depth_comparison(data['filename'],
+                                           renderer=data.get('renderer'),
+                                           bit_depths=bits,
+                                           composite=layout == 'composite')
     if result is None:
         return jsonify({"error": "Failed to generate bit-depth comparison."}), 400
 
-    return jsonify({"images": result})
+    return image_json({"images": result})
 
 
 if __name__ == '__main__':
@@ -0,0 +1,306 @@
+"""
+Request metrics, pipeline-stage timings and the Prometheus exposition.
+
+Stage timers (:func:`stage`) wrap the steps of the image pipeline
+(``imread``, ``resize``, ``absdiff``, ``draw``, ``base64``, ...).  Each
+timing goes to the current request's log, reported as a
+``Server-Timing`` header, and to a per-stage latency histogram.
+
+Counters and histograms live in memory per process.  Every gunicorn
+worker periodically writes a snapshot to ``<metrics_dir>/<pid>.json``;
+``/metrics`` sums the snapshots of all workers, live or recycled, so
+counters stay monotonic across worker restarts.  Gauges (requests in
+flight) are summed over live workers only.  Snapshots of dead workers
+are folded into ``retired.json`` so the directory stays small.
+"""
+
+import contextvars
+import fcntl
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+SIZE_BUCKETS = tuple(1024 * 4 ** i for i in range(10))     # 1 KiB .. 256 MiB
+
+HELP = {
+    "dip_http_requests_total": ("counter", "Requests handled, by endpoint, method and status."),
+    "dip_http_request_duration_seconds": ("histogram", "Request latency by endpoint."),
+    "dip_http_response_bytes": ("histogram", "Response body size by endpoint."),
+    "dip_http_requests_in_flight": ("gauge", "Requests being handled, by endpoint."),
+    "dip_stage_duration_seconds": ("histogram", "Time spent in each pipeline stage."),
+    "dip_cache_hits_total": ("counter", "Cache hits, by cache."),
+    "dip_cache_misses_total": ("counter", "Cache misses, by cache."),
+    "dip_coalesced_requests_total": ("counter", "Requests served by an identical in-flight call."),
+    "dip_admission_admitted_total": ("counter", "Requests admitted, by cost class."),
+    "dip_admission_rejected_total": ("counter", "Requests shed with 503, by cost class."),
+    "dip_worker_boot_seconds": ("histogram", "Time from fork to a worker ready to serve."),
+}
+
+_log = contextvars.ContextVar('stage_log', default=None)
+
+
+def metrics_dir(cache_dir):
+    """Snapshot directory: DIP_METRICS_DIR, else ``<cache_dir>/metrics``."""
+    return Path(os.environ.get('DIP_METRICS_DIR') or Path(cache_dir) / "metrics")
+
+
+def _key(name, labels):
+    return name + "|" + ",".join(f"{k}={v}" for k, v in sorted(labels.items()))
+
+
+def _split(key):
+    name, _, labels = key.partition("|")
+    return name, dict(part.split("=", 1) for part in labels.split(",") if part)
+
+
+class Registry:
+    """In-memory counters, gauges and histograms of one process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}       # key -> [bucket counts..., +Inf count, sum]
+        self._buckets = {}         # histogram name -> bucket bounds
+        self._collectors = []
+
+    def inc(self, name, labels, amount=1):
+        key = _key(name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def add_gauge(self, name, labels, amount):
+        key = _key(name, labels)
+        with self._lock:
+            self.gauges[key] = self.gauges.get(key, 0) + amount
+
+    def observe(self, name, labels, value, buckets=LATENCY_BUCKETS):
+        key = _key(name, labels)
+        with self._lock:
+            self._buckets[name] = buckets
+            counts = self.histograms.get(key)
+            if counts is None:
+                counts = self.histograms[key] = [0] * (len(buckets) + 2)
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            else:
+                counts[len(buckets)] += 1
+            counts[-1] += value
+
+    def add_collector(self, collect):
+        """Register ``collect() -> {(name, labels_tuple): value}`` counters."""
+        self._collectors.append(collect)
+
+    def snapshot(self):
+        """JSON-serialisable state, including collector counters."""
+        counters = {}
+        for collect in self._collectors:
+            for (name, labels), value in collect().items():
+                counters[_key(name, dict(labels))] = value
+        with self._lock:
+            counters.update(self.counters)
+            return {
+                "counters": counters,
+                "gauges": dict(self.gauges),
+                "histograms": {k: list(v) for k, v in self.histograms.items()},
+                "buckets": {k: list(v) for k, v in self._buckets.items()},
+            }
+
+
+registry = Registry()
+
+
+@contextmanager
+def stage(name):
+    """Time a pipeline stage for Server-Timing and the stage histogram."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stages([(name, time.perf_counter() - started)])
+
+
+def record_stages(entries):
+    """Add ``(stage, seconds)`` entries to the request log and histogram."""
+    log = _log.get()
+    for name, seconds in entries:
+        registry.observe("dip_stage_duration_seconds", {"stage": name}, seconds)
+        if log is not None:
+            log.append((name, seconds))
+
+
+def start_log():
+    """Begin collecting this request's stage timings; returns the log list."""
+    entries = []
+    _log.set(entries)
+    return entries
+
+
+def call_timed(fn, *args, **kwargs):
+    """Run ``fn(*args, **kwargs)`` and return ``(result, stage_entries)``."""
+    entries = start_log()
+    return fn(*args, **kwargs), entries
+
+
+def server_timing(entries, total=None):
+    """Format stage entries (summed per stage, in first-seen order)."""
+    totals = {}
+    for name, seconds in entries:
+        totals[name] = totals.get(name, 0.0) + seconds
+    parts = [f"{name};dur={seconds * 1000:.2f}" for name, seconds in totals.items()]
+    if total is not None:
+        parts.append(f"total;dur={total * 1000:.2f}")
+    return ", ".join(parts)
+
+
+class MultiProcessExporter:
+    """
+    Per-pid snapshot files plus their aggregation.
+
+    Parameters
+    ----------
+    metrics_dir : Path
+        Directory shared by the workers (cleared by :meth:`reset` when
+        the gunicorn master starts).
+    interval : float
+        Minimum seconds between snapshot writes of one worker.
+    """
+
+    def __init__(self, metrics_dir, interval=1.0):
+        self.metrics_dir = Path(metrics_dir)
+        self.interval = interval
+        self._written = 0.0
+        self._lock = threading.Lock()
+
+    def reset(self):
+        """Remove snapshots from a previous run."""
+        if self.metrics_dir.is_dir():
+            for path in self.metrics_dir.glob("*.json"):
+                path.unlink(missing_ok=True)
+
+    def write(self, force=False):
+        """Write this process's snapshot if *interval* has passed."""
+        now = time.monotonic()
+        with self._lock:
+            if not force and now - self._written < self.interval:
+                return
+            self._written = now
+        try:
+            self.metrics_dir.mkdir(parents=True, exist_ok=True)
+            path = self.metrics_dir / f"{os.getpid()}.json"
+            tmp = path.with_name(f".{path.name}.{threading.get_ident()}")
+            tmp.write_text(json.dumps(registry.snapshot()))
+            os.replace(tmp, path)
+        except OSError:
+            pass
+
+    def _retire(self, dead):
+        """Fold the snapshots of dead workers into retired.json."""
+        lock_path = self.metrics_dir / ".retire.lock"
+        with open(lock_path, "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            retired_path = self.metrics_dir / "retired.json"
+            try:
+                retired = json.loads(retired_path.read_text())
+            except (OSError, ValueError):
+                retired = {"counters": {}, "gauges": {}, "histograms": {}, "buckets": {}}
+            for path in dead:
+                try:
+                    snap = json.loads(path.read_text())
+                except (OSError, ValueError):
+                    continue
+                snap["gauges"] = {}
+                _merge(retired, snap)
+                path.unlink(missing_ok=True)
+            tmp = retired_path.with_name(".retired.json.tmp")
+            tmp.write_text(json.dumps(retired))
+            os.replace(tmp, retired_path)
+
+    def collect(self):
+        """Aggregate the snapshots of every worker of this deployment."""
+        self.write(force=True)
+        total = {"counters": {}, "gauges": {}, "histograms": {}, "buckets": {}}
+        dead = [path for path in self.metrics_dir.glob("*.json")
+                if path.stem.isdigit() and not _alive(int(path.stem))]
+        if dead:
+            self._retire(dead)
+        # Shared lock: a concurrent retire must not move a snapshot mid-read
+        with open(self.metrics_dir / ".retire.lock", "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_SH)
+            for path in self.metrics_dir.glob("*.json"):
+                try:
+                    snap = json.loads(path.read_text())
+                except (OSError, ValueError):
+                    continue
+                _merge(total, snap)
+        return total
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _merge(into, snap):
+    for kind in ("counters", "gauges"):
+        for key, value in snap.get(kind, {}).items():
+            into[kind][key] = into[kind].get(key, 0) + value
+    for key, counts in snap.get("histograms", {}).items():
+        have = into["histograms"].get(key)
+        if have is None or len(have) != len(counts):
+            into["histograms"][key] = list(counts)
+        else:
+            into["histograms"][key] = [a + b for a, b in zip(have, counts)]
+    into["buckets"].update(snap.get("buckets", {}))
+
+
+def _labels(labels, extra=None):
+    items = sorted(labels.items()) + (list(extra.items()) if extra else [])
+    if not items:
+        return ""
+    body = ",".join('{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"'))
+                    for k, v in items)
+    return "{" + body + "}"
+
+
+def render_prometheus(state):
+    """Render aggregated state in the Prometheus text exposition format."""
+    series = {}
+    for kind in ("counters", "gauges"):
+        for key, value in state[kind].items():
+            name, labels = _split(key)
+            series.setdefault(name, []).append(f"{name}{_labels(labels)} {value}")
+    for key, counts in state["histograms"].items():
+        name, labels = _split(key)
+        buckets = state["buckets"].get(name, LATENCY_BUCKETS)
+        lines = series.setdefault(name, [])
+        cumulative = 0
+        for bound, count in zip(buckets, counts):
+            cumulative += count
+            lines.append(f"{name}_bucket{_labels(labels, {'le': repr(float(bound))})} "
+                         f"{cumulative}")
+        cumulative += counts[len(buckets)]
+        lines.append(f"{name}_bucket{_labels(labels, {'le': '+Inf'})} {cumulative}")
+        lines.append(f"{name}_sum{_labels(labels)} {counts[-1]}")
+        lines.append(f"{name}_count{_labels(labels)} {cumulative}")
+
+    out = []
+    for name in sorted(series):
+        kind, text = HELP.get(name, ("untyped", name))
+        out.append(f"# HELP {name} {text}")
+        out.append(f"# TYPE {name} {kind}")
+        out.extend(sorted(series[name]))
+    return "\n".join(out) + "\n"
@@ -0,0 +1,67 @@
+"""
+The matplotlib plotting stack, loaded only where plots are drawn.
+
+Importing pyplot and mplot3d takes a few hundred milliseconds, and the
+first figure drawn in a process pays again for font lookup, colormap
+and text layout caches.  Endpoints that never plot (images, tiles,
+pixel values, statistics) should pay for neither, so the plotting code
+imports ``plt`` from here, inside the functions that draw.
+
+Where plots are drawn, the cost is paid once and shared instead:
+
+* render-pool processes fork from a forkserver that preloads this module;
+* with ``preload_app`` the gunicorn master imports it and calls
+  :func:`warm` before forking, so every worker (including those started
+  when ``max_requests`` recycles one) starts with the stack loaded and
+  its caches filled, shared copy-on-write.
+"""
+
+import io
+import time
+
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt  # noqa: E402
+from mpl_toolkits.mplot3d import Axes3D  # noqa: E402,F401 -- registers '3d' projection
+
+import numpy as np  # noqa: E402
+
+
+# Colormaps the app draws with
+WARM_COLORMAPS = ('gray', 'hot', 'viridis', 'plasma', 'inferno', 'coolwarm')
+
+
+def warm():
+    """
+    Draw and save a throwaway figure; return the seconds it took.
+
+    It uses what the app's plots use -- 2-D and 3-D axes, titles in
+    regular and bold type, a legend, a colorbar, every colormap in
+    WARM_COLORMAPS and PNG output -- so font lookup, colormap and layout
+    caches are filled before the first request needs them.
+    """
+    started = time.perf_counter()
+    fig = plt.figure(figsize=(6, 4))
+    try:
+        fig.suptitle('warm-up', fontweight='bold')
+        data = np.linspace(0, 1, 64).reshape(8, 8)
+        for i, cmap in enumerate(WARM_COLORMAPS):
+            ax = fig.add_subplot(3, 3, i + 1)
+            im = ax.imshow(data, cmap=cmap)
+            ax.set_title(cmap, fontsize=9)
+        fig.colorbar(im, ax=ax)
+        ax = fig.add_subplot(3, 3, 7)
+        ax.plot(data[0], label='line')
+        ax.fill_between(np.arange(8), data[0], alpha=0.3)
+        ax.bar(np.arange(8), data[1])
+        ax.set_xlabel('Pixel Intensity')
+        ax.legend(fontsize=8)
+        ax.grid(True, alpha=0.3)
+        ax = fig.add_subplot(3, 3, 8, projection='3d')
+        X, Y = np.meshgrid(np.arange(8), np.arange(8))
+        ax.plot_surface(X, Y, data, cmap='viridis')
+        fig.tight_layout()
+        fig.savefig(io.BytesIO(), format='png', dpi=50)
+    finally:
+        plt.close(fig)
+    return time.perf_counter() - started
@@ -0,0 +1,284 @@
+"""
+Offline renderer for the curated content.
+
+For every entry in RECOMMENDED_PAIRS and every image in the catalog the
+comparison plot, histogram, step-by-step pipeline and bit-depth
+comparison are identical for every visitor.  This tool renders them once,
+in parallel across cores, into a directory of content-hashed files::
+
+    python -m app.precompute [--jobs N] [--out DIR] [--prune]
+
+Each artifact is written as the exact JSON body of its endpoint plus a
+precompressed ``.gz`` copy (and the PNGs it embeds, for direct linking).
+``manifest.json`` maps the endpoint's content-addressed request key to
+those files; the Flask app consults it before rendering anything, and
+nginx can serve the directory as-is with ``gzip_static``.
+"""
+
+import argparse
+import base64
+import gzip
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+from app import image_processor
+from app.image_processor import (
+    CACHE_DIR,
+    RECOMMENDED_PAIRS,
+    generate_bit_depth_comparison,
+    generate_comparison_plot,
+    generate_histogram,
+    get_available_images,
+    get_step_by_step_pipeline,
+    render_pool,
+    result_key,
+)
+
+
+PRECOMPUTED_DIR = Path(os.environ.get('DIP_PRECOMPUTED_DIR') or CACHE_DIR / "precomputed")
+MANIFEST_NAME = "manifest.json"
+MANIFEST_VERSION = 2
+
+# kind -> (renderer, key of the result in the response body or None when
+# the result *is* the body, "pair" or "image")
+ARTIFACTS = {
+    "comparison-plot": (generate_comparison_plot, "plot", "pair"),
+    "step-by-step": (get_step_by_step_pipeline, None, "pair"),
+    "histogram": (generate_histogram, "histogram", "image"),
+    "bit-depth": (generate_bit_depth_comparison, "images", "image"),
+}
+
+# Kinds drawn with the configured plot renderer (DIP_PLOT_RENDERER)
+RENDERED_KINDS = {"comparison-plot", "histogram", "bit-depth"}
+
+
+def artifact_key(kind, filenames):
+    """
+    The manifest key of an artifact, or None.
+
+    Kinds drawn by a plot renderer include the current default renderer,
+    so changing DIP_PLOT_RENDERER never serves artifacts drawn by the
+    other one.
+    """
+    params = (image_processor.PLOT_RENDERER,) if kind in RENDERED_KINDS else ()
+    key = result_key(kind, filenames, params)
+    return None if key is None else f"{kind}/{key}"
+
+
+def _content_name(data, suffix):
+    return f"{hashlib.sha256(data).hexdigest()[:20]}{suffix}"
+
+
+def _write(path, data):
+    """Atomically write *data* to *path* unless an identical file exists."""
+    if path.exists():
+        return
+    tmp = path.with_name(f".{path.name}.{os.getpid()}")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+
+
+def _collect_pngs(value, out):
+    """Gather every base64 PNG string nested in a response body."""
+    if isinstance(value, str):
+        if value.startswith('iVBORw0KGgo'):
+            out.append(value)
+    elif isinstance(value, dict):
+        for v in value.values():
+            _collect_pngs(v, out)
+    elif isinstance(value, list):
+        for v in value:
+            _collect_pngs(v, out)
+
+
+def _init_worker():
+    """Pool initializer: render inline, the precompute pool is the parallelism."""
+    render_pool.disable()
+
+
+def render_artifact(kind, filenames, out_dir):
+    """
+    Render one artifact and write its files into *out_dir*/*kind*.
+
+    Runs in a pool worker.  Returns ``(manifest_key, entry)`` or None when
+    the renderer fails.
+    """
+    renderer, field, _ = ARTIFACTS[kind]
+    key = artifact_key(kind, filenames)
+    if key is None:
+        return None
+    result = renderer(*filenames)
+    if result is None:
+        return None
+    body = result if field is None else {field: result}
+
+    target = Path(out_dir) / kind
+    target.mkdir(parents=True, exist_ok=True)
+    raw = json.dumps(body, separators=(',', ':')).encode()
+    json_name = _content_name(raw, ".json")
+    _write(target / json_name, raw)
+    _write(target / f"{json_name}.gz", gzip.compress(raw, compresslevel=9, mtime=0))
+
+    png_names = []
+    pngs = []
+    _collect_pngs(body, pngs)
+    for b64 in pngs:
+        png = base64.b64decode(b64)
+        name = _content_name(png, ".png")
+        _write(target / name, png)
+        png_names.append(f"{kind}/{name}")
+
+    return key, {
+        "json": f"{kind}/{json_name}",
+        "bytes": len(raw),
+        "pngs": png_names,
+        "inputs": list(filenames),
+    }
+
+
+def build_tasks():
+    """Return the list of ``(kind, filenames)`` to render."""
+    pairs = [(p["image1"], p["image2"]) for p in RECOMMENDED_PAIRS]
+    images = [(img["filename"],) for img in get_available_images()]
+    tasks = []
+    for kind, (_, _, arity) in ARTIFACTS.items():
+        for filenames in (pairs if arity == "pair" else images):
+            tasks.append((kind, filenames))
+    return tasks
+
+
+def write_manifest(out_dir, artifacts):
+    manifest = {"version": MANIFEST_VERSION, "generated_at": int(time.time()),
+                "artifacts": artifacts}
+    tmp = out_dir / f".{MANIFEST_NAME}.{os.getpid()}"
+    tmp.write_text(json.dumps(manifest, indent=1, sort_keys=True))
+    os.replace(tmp, out_dir / MANIFEST_NAME)
+
+
+def prune(out_dir, artifacts):
+    """Delete files no longer referenced by the manifest."""
+    keep = set()
+    for entry in artifacts.values():
+        keep.add(entry["json"])
+        keep.add(entry["json"] + ".gz")
+        keep.update(entry["pngs"])
+    removed = 0
+    for kind in ARTIFACTS:
+        for path in (out_dir / kind).glob("*"):
+            if f"{kind}/{path.name}" not in keep:
+                path.unlink()
+                removed += 1
+    return removed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m app.precompute",
+        description="Render curated plots and pipelines to static files.")
+    parser.add_argument("--out", type=Path, default=PRECOMPUTED_DIR,
+                        help=f"output directory (default: {PRECOMPUTED_DIR})")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1,
+                        help="parallel render processes (default: all cores)")
+    parser.add_argument("--prune", action="store_true",
+                        help="delete files not referenced by the new manifest")
+    args = parser.parse_args(argv)
+
+    out_dir = args.out
+    out_dir.mkdir(parents=True, exist_ok=True)
+    tasks = build_tasks()
+    print(f"Rendering {len(tasks)} artifacts with {args.jobs} processes into {out_dir}")
+
+    started = time.perf_counter()
+    artifacts = {}
+    failures = 0
+    with ProcessPoolExecutor(max_workers=args.jobs, initializer=_init_worker) as pool:
+        futures = {pool.submit(render_artifact, kind, filenames, str(out_dir)):
+                   (kind, filenames) for kind, filenames in tasks}
+        for future in as_completed(futures):
+            kind, filenames = futures[future]
+            try:
+                result = future.result()
+            except Exception as exc:      # one bad artifact must not lose the rest
+                print(f"  ERROR {kind} {' vs '.join(filenames)}: {exc!r}", file=sys.stderr)
+                result = None
+            if result is None:
+                failures += 1
+                print(f"  FAILED {kind} {' vs '.join(filenames)}", file=sys.stderr)
+                continue
+            artifacts[result[0]] = result[1]
+
+    write_manifest(out_dir, artifacts)
+    removed = prune(out_dir, artifacts) if args.prune else 0
+    print(f"Wrote {len(artifacts)} artifacts in {time.perf_counter() - started:.1f}s"
+          f" ({failures} failed, {removed} stale files removed)")
+    return 1 if failures else 0
+
+
+class PrecomputedStore:
+    """
+    Read side of the precomputed directory, used by the Flask app.
+
+    The manifest is reloaded whenever its mtime changes, so re-running the
+    precompute command takes effect without restarting workers.
+    """
+
+    def __init__(self, out_dir=PRECOMPUTED_DIR):
+        self.out_dir = Path(out_dir)
+        self._lock = threading.Lock()
+        self._stamp = None
+        self._artifacts = {}
+
+    def _refresh(self):
+        try:
+            stamp = (self.out_dir / MANIFEST_NAME).stat().st_mtime_ns
+        except OSError:
+            stamp = None
+        if stamp == self._stamp:
+            return
+        artifacts = {}
+        if stamp is not None:
+            try:
+                manifest = json.loads((self.out_dir / MANIFEST_NAME).read_text())
+                if manifest.get("version") == MANIFEST_VERSION:
+                    artifacts = manifest["artifacts"]
+            except (OSError, ValueError, KeyError):
+                artifacts = {}
+        self._artifacts, self._stamp = artifacts, stamp
+
+    def lookup(self, kind, filenames):
+        """
+        Return the relative path of the precomputed JSON body, or None.
+
+        The key is the same content-addressed key the result cache uses
+        (plus the plot renderer), so an artifact is never served for a
+        changed source image or renderer.
+        """
+        key = artifact_key(kind, filenames)
+        if key is None:
+            return None
+        with self._lock:
+            self._refresh()
+            entry = self._artifacts.get(key)
+        if entry is None or not (self.out_dir / entry["json"]).exists():
+            return None
+        return entry["json"]
+
+    def load(self, kind, filenames):
+        """Return the precomputed JSON body itself, parsed, or None."""
+        rel = self.lookup(kind, filenames)
+        if rel is None:
+            return None
+        try:
+            return json.loads((self.out_dir / rel).read_bytes())
+        except (OSError, ValueError):
+            return None
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,299 @@
+"""
+Opt-in profiling of single requests.
+
+A request is profiled when it carries the profiling token (header
+``X-Profile: <token>`` or query ``?profile=<token>``), or at random with
+probability ``sample_rate``.  The whole WSGI call is profiled, so the
+Flask hooks, the handler and everything it calls in ``image_processor``
+are covered; renders shipped to the render pool are profiled in their
+process and merged into the same capture.
+
+Each capture is saved under the profile directory as
+
+* ``<name>.pstats``    -- cProfile statistics (``python -m pstats``, snakeviz),
+* ``<name>.collapsed`` -- stacks sampled every few milliseconds, one
+  ``frame;frame;... count`` line per stack (flamegraph.pl, speedscope),
+* ``<name>.json``      -- method, path, status, duration and trigger.
+
+When neither a token nor a sample rate is configured the middleware is
+not installed at all, so unprofiled deployments pay nothing.
+"""
+
+import contextvars
+import cProfile
+import hmac
+import itertools
+import json
+import os
+import pstats
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from urllib.parse import parse_qsl, urlencode
+
+
+NAME_RE = re.compile(r'^[0-9]{8}-[0-9]{6}-[0-9]+-[0-9]+$')
+EXTENSIONS = ('pstats', 'collapsed', 'json')
+SAMPLE_INTERVAL = 0.005     # seconds between stack samples
+
+_active = contextvars.ContextVar('profile_capture', default=None)
+
+
+def _frame_name(frame):
+    code = frame.f_code
+    module = frame.f_globals.get('__name__', '?')
+    return f"{module}.{getattr(code, 'co_qualname', code.co_name)}"
+
+
+def _collapse(frame):
+    names = []
+    while frame is not None:
+        names.append(_frame_name(frame))
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class StackSampler:
+    """Samples the stack of one thread from a background thread."""
+
+    def __init__(self, thread_id, interval=SAMPLE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='stack-sampler',
+                                        daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.stacks[_collapse(frame)] += 1
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        return self.stacks
+
+
+class _StatsSnapshot:
+    """Picklable cProfile result that ``pstats.Stats`` accepts."""
+
+    def __init__(self, stats):
+        self.stats = stats
+
+    def create_stats(self):
+        pass
+
+
+class Capture:
+    """cProfile and stack samples of the calling thread, plus merged children."""
+
+    def __init__(self):
+        self.profiler = cProfile.Profile()
+        self.sampler = StackSampler(threading.get_ident())
+        self.children = []          # (stats snapshot, stacks) of render processes
+        self.stacks = Counter()
+        self.closed = False
+
+    def __enter__(self):
+        self.sampler.start()
+        self.profiler.enable()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.disable()
+        self.stacks = self.sampler.stop()
+        self.closed = True
+
+    def add_child(self, child):
+        if not self.closed:
+            self.children.append(child)
+
+    def stats(self):
+        """The combined ``pstats.Stats`` of this thread and its children."""
+        result = pstats.Stats(self.profiler)
+        for snapshot, _ in self.children:
+            result.add(_StatsSnapshot(snapshot))
+        return result
+
+    def collapsed(self):
+        """Collapsed-stack text; render-process stacks are prefixed ``render-process``."""
+        stacks = Counter(self.stacks)
+        for _, child_stacks in self.children:
+            for stack, count in child_stacks.items():
+                stacks["render-process;" + stack] += count
+        return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+
+def active():
+    """The capture of the current request, or None when not profiling."""
+    capture = _active.get()
+    if capture is None or capture.closed:
+        return None
+    return capture
+
+
+def call_profiled(fn, *args, **kwargs):
+    """
+    Run ``fn(*args, **kwargs)`` under a fresh capture.
+
+    Returns ``(result, child)``, where *child* is a picklable
+    ``(stats, stacks)`` pair for :meth:`Capture.add_child`; used in render
+    processes.
+    """
+    with Capture() as capture:
+        result = fn(*args, **kwargs)
+    capture.profiler.create_stats()
+    return result, (capture.profiler.stats, dict(capture.stacks))
+
+
+class ProfileStore:
+    """
+    Directory of saved captures, newest *keep* retained.
+
+    Parameters
+    ----------
+    profile_dir : Path
+        Directory shared by all workers.
+    keep : int
+        Captures kept; older ones are deleted when a new one is saved.
+    """
+
+    def __init__(self, profile_dir, keep=50):
+        self.profile_dir = Path(profile_dir)
+        self.keep = keep
+        self._seq = itertools.count()
+
+    def new_name(self):
+        return f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{next(self._seq)}"
+
+    def path(self, name, ext):
+        """Filesystem path of one capture file, or None if the name is invalid."""
+        if not NAME_RE.match(name) or ext not in EXTENSIONS:
+            return None
+        return self.profile_dir / f"{name}.{ext}"
+
+    def save(self, name, capture, meta):
+        """Write the three files of *capture*; returns False on error."""
+        try:
+            self.profile_dir.mkdir(parents=True, exist_ok=True)
+            capture.stats().dump_stats(self.path(name, 'pstats'))
+            self.path(name, 'collapsed').write_text(capture.collapsed())
+            # The metadata file goes last: list() only shows complete captures
+            self.path(name, 'json').write_text(json.dumps(meta))
+        except OSError:
+            return False
+        self._prune()
+        return True
+
+    def list(self, limit=50):
+        """Metadata of the most recent captures, newest first."""
+        captures = []
+        for path in sorted(self.profile_dir.glob("*.json"), reverse=True)[:limit]:
+            try:
+                captures.append(json.loads(path.read_text()))
+            except (OSError, ValueError):
+                continue
+        return captures
+
+    def _prune(self):
+        for path in sorted(self.profile_dir.glob("*.json"), reverse=True)[self.keep:]:
+            for ext in EXTENSIONS:
+                path.with_suffix(f".{ext}").unlink(missing_ok=True)
+
+
+class ProfilingMiddleware:
+    """
+    WSGI middleware that profiles requests chosen by token or sampling.
+
+    Parameters
+    ----------
+    wsgi_app : callable
+        The application to wrap (``app.wsgi_app``).
+    store : ProfileStore
+        Where captures are saved.
+    token : str or None
+        Secret that requests a capture; None disables the trigger.
+    sample_rate : float
+        Fraction of requests profiled at random (0 disables sampling).
+    skip_paths : tuple of str
+        Path prefixes never profiled (e.g. the capture listing itself).
+    """
+
+    def __init__(self, wsgi_app, store, token=None, sample_rate=0.0, skip_paths=()):
+        self.wsgi_app = wsgi_app
+        self.store = store
+        self.token = token
+        self.sample_rate = sample_rate
+        self.skip_paths = tuple(skip_paths)
+        # cProfile hooks one thread, but one capture at a time per process
+        # keeps the overhead bounded and the samples readable
+        self._busy = threading.Lock()
+
+    def authorized(self, environ):
+        """True if the request carries the profiling token."""
+        if not self.token:
+            return False
+        supplied = environ.get('HTTP_X_PROFILE')
+        if supplied is None:
+            supplied = dict(parse_qsl(environ.get('QUERY_STRING', ''))).get('profile')
+        return supplied is not None and hmac.compare_digest(supplied, self.token)
+
+    def _trigger(self, environ):
+        if environ.get('PATH_INFO', '').startswith(self.skip_paths):
+            return None
+        if self.authorized(environ):
+            return 'token'
+        if self.sample_rate > 0 and random.random() < self.sample_rate:
+            return 'sample'
+        return None
+
+    def __call__(self, environ, start_response):
+        trigger = self._trigger(environ)
+        if trigger is None or not self._busy.acquire(blocking=False):
+            return self.wsgi_app(environ, start_response)
+        try:
+            return self._profiled(trigger, environ, start_response)
+        finally:
+            self._busy.release()
+
+    def _profiled(self, trigger, environ, start_response):
+        name = self.store.new_name()
+        status = []
+
+        def start_profiled_response(code, headers, exc_info=None):
+            status.append(int(code.split(' ', 1)[0]))
+            return start_response(code, headers + [('X-Profile-Id', name)], exc_info)
+
+        started = time.perf_counter()
+        capture = Capture()
+        token = _active.set(capture)
+        try:
+            with capture:
+                result = self.wsgi_app(environ, start_profiled_response)
+        finally:
+            _active.reset(token)
+        query = [(k, v) for k, v in parse_qsl(environ.get('QUERY_STRING', ''))
+                 if k != 'profile']
+        self.store.save(name, capture, {
+            "name": name,
+            "method": environ.get('REQUEST_METHOD'),
+            "path": environ.get('PATH_INFO'),
+            "query": urlencode(query),
+            "status": status[0] if status else None,
+            "duration_ms": round((time.perf_counter() - started) * 1000, 2),
+            "trigger": trigger,
+            "pid": os.getpid(),
+            "samples": sum(capture.stacks.values()),
+            "render_processes": len(capture.children),
+        })
+        return result
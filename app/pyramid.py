@@ -0,0 +1,108 @@
+"""
+Multi-resolution image pyramids.
+
+Level 0 is the full-resolution image; every further level halves both
+sides (rounding up, like ``cv2.pyrDown``) using ``INTER_AREA`` averaging,
+down to the first level that fits in a single tile.  Tiles are addressed
+as in deep-zoom viewers: tile (x, y) of a level covers ``tile_size``
+square pixels starting at ``(x * tile_size, y * tile_size)``; tiles on
+the right and bottom edges are smaller.
+
+A viewer that shows an image at 200 px asks for the level closest to
+that size instead of the full-resolution PNG, and a zoomed-in viewer
+asks only for the tiles it displays.
+"""
+
+import cv2
+
+
+TILE_SIZE = 256
+
+
+def level_shapes(height, width, tile_size=TILE_SIZE):
+    """Return the ``(height, width)`` of every level, finest first."""
+    shapes = [(height, width)]
+    while max(shapes[-1]) > tile_size:
+        h, w = shapes[-1]
+        shapes.append(((h + 1) // 2, (w + 1) // 2))
+    return shapes
+
+
+def lod_level(width, height, max_side):
+    """
+    Return the coarsest-needed level for a *width* x *height* region.
+
+    That is the finest level at which the region spans at most
+    *max_side* samples per side (levels beyond the pyramid's last one
+    are possible; callers clamp).
+    """
+    level = 0
+    while max(width, height) > max_side << level:
+        level += 1
+    return level
+
+
+class ImagePyramid:
+    """
+    All levels of one grayscale image.
+
+    Level 0 is *img* itself (not copied); the coarser levels are built
+    once, at construction.
+    """
+
+    def __init__(self, img, tile_size=TILE_SIZE):
+        self.tile_size = tile_size
+        self.levels = [img]
+        for h, w in level_shapes(*img.shape[:2], tile_size)[1:]:
+            level = cv2.resize(self.levels[-1], (w, h), interpolation=cv2.INTER_AREA)
+            level.setflags(write=False)
+            self.levels.append(level)
+
+    @property
+    def nbytes(self):
+        """Memory owned by the pyramid (level 0 belongs to the caller)."""
+        return sum(level.nbytes for level in self.levels[1:])
+
+    def info(self):
+        """Describe every level: size and tile grid."""
+        ts = self.tile_size
+        return {
+            "tile_size": ts,
+            "width": self.levels[0].shape[1],
+            "height": self.levels[0].shape[0],
+            "levels": [
+                {
+                    "level": n,
+                    "width": level.shape[1],
+                    "height": level.shape[0],
+                    "tiles_x": -(-level.shape[1] // ts),
+                    "tiles_y": -(-level.shape[0] // ts),
+                }
+                for n, level in enumerate(self.levels)
+            ],
+        }
+
+    def level(self, n):
+        """Return level *n*, or None if it does not exist."""
+        if 0 <= n < len(self.levels):
+            return self.levels[n]
+        return None
+
+    def region(self, n, x0, y0, x1, y1):
+        """
+        Return the part of level *n* covering level-0 pixels [x0, x1) x [y0, y1).
+
+        Edges are rounded outwards, so the slice covers the whole region.
+        """
+        level = self.levels[n]
+        return level[y0 >> n:-(-y1 >> n), x0 >> n:-(-x1 >> n)]
+
+    def tile(self, n, x, y):
+        """Return tile (*x*, *y*) of level *n*, or None if out of range."""
+        level = self.level(n)
+        if level is None or x < 0 or y < 0:
+            return None
+        ts = self.tile_size
+        if x * ts >= level.shape[1] or y * ts >= level.shape[0]:
+            return None
+        return level[y * ts:(y + 1) * ts, x * ts:(x + 1) * ts]
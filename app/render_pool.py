@@ -0,0 +1,194 @@
+"""
+Process pool for CPU-bound matplotlib rendering.
+
+gthread workers share one GIL, so concurrent matplotlib renders inside a
+worker are effectively serialised.  Renders are therefore shipped to a
+small pool of worker processes.  Admission is bounded: at most
+``processes`` renders run at once, at most ``max_queue`` more wait for a
+slot, and a waiter gives up after ``queue_timeout`` seconds.  Anything
+beyond that is rejected immediately with :class:`RenderQueueFull`, which
+the Flask app turns into ``503`` with ``Retry-After`` instead of letting
+requests sit until the gunicorn timeout.
+
+The pool belongs to gunicorn workers.  Processes that render in bulk
+(``app.precompute`` workers, the benchmark) call :meth:`RenderPool.disable`
+and render inline instead; a pool that was started is shut down at exit.
+"""
+
+import atexit
+import multiprocessing
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+
+from app import encoding, metrics, profiling
+
+
+class RenderQueueFull(Exception):
+    """Raised when a render cannot be admitted; carries a Retry-After hint."""
+
+    def __init__(self, retry_after):
+        super().__init__(f"Render queue full, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+def _call_in_context(enc, profile, fn, *args, **kwargs):
+    """
+    Run *fn* in a render process under the caller's encoding.
+
+    Returns the result, the encode and stage logs, and (if *profile*) the
+    process's profile for the caller's capture.
+    """
+    if profile:
+        (result, encodes, stages, _), child = profiling.call_profiled(
+            _call_in_context, enc, False, fn, *args, **kwargs)
+        return result, encodes, stages, child
+    (result, encodes), stages = metrics.call_timed(encoding.call_logged, enc,
+                                                   fn, *args, **kwargs)
+    return result, encodes, stages, None
+
+
+class RenderPool:
+    """
+    Bounded front end to a ``ProcessPoolExecutor``.
+
+    Parameters
+    ----------
+    processes : int
+        Worker processes (0 runs every render inline in the caller).
+    max_queue : int
+        Renders allowed to wait for a free process.
+    queue_timeout : float
+        Seconds a render may wait for a process before it is rejected.
+    """
+
+    def __init__(self, processes, max_queue, queue_timeout):
+        self.processes = processes
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._slots = threading.BoundedSemaphore(max(processes, 1))
+        self._lock = threading.Lock()
+        self._executor = None
+        self._waiting = 0
+        self._running = 0
+        self._completed = 0
+        self._rejected = 0
+        self._waits = deque(maxlen=1024)        # seconds spent queued
+        self._service = deque(maxlen=256)       # seconds spent rendering
+        atexit.register(self.shutdown)
+
+    def shutdown(self):
+        """Stop the render processes; a later render starts a new pool."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def disable(self):
+        """Shut the pool down and render inline in the caller from now on."""
+        self.processes = 0
+        self.shutdown()
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                # forkserver: never fork the threaded gunicorn worker itself
+                ctx = multiprocessing.get_context('forkserver')
+                ctx.set_forkserver_preload(['app.image_processor', 'app.plotting'])
+                self._executor = ProcessPoolExecutor(self.processes, mp_context=ctx)
+            return self._executor
+
+    def _retry_after(self):
+        """Estimate when a slot frees up, in whole seconds."""
+        service = np.mean(self._service) if self._service else 2.0
+        backlog = (self._waiting + self._running) / max(self.processes, 1)
+        return max(1, int(np.ceil(service * max(backlog, 1))))
+
+    def _reject(self):
+        with self._lock:
+            self._rejected += 1
+            retry_after = self._retry_after()
+        raise RenderQueueFull(retry_after)
+
+    def run(self, fn, *args, **kwargs):
+        """
+        Run ``fn(*args, **kwargs)`` in a pool process and return its result.
+
+        *fn* must be a module-level (picklable) function.  It runs under
+        the caller's output encoding, and its encodes, stage timings and
+        (when the request is profiled) profile are reported to the caller.  Raises
+        :class:`RenderQueueFull` when the pool is saturated.
+        """
+        if self.processes <= 0:
+            return fn(*args, **kwargs)
+
+        queued_at = time.perf_counter()
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                if self._waiting >= self.max_queue:
+                    admitted = False
+                else:
+                    admitted = True
+                    self._waiting += 1
+            if not admitted:
+                self._reject()
+            try:
+                acquired = self._slots.acquire(timeout=self.queue_timeout)
+            finally:
+                with self._lock:
+                    self._waiting -= 1
+            if not acquired:
+                self._reject()
+
+        started = time.perf_counter()
+        with self._lock:
+            self._running += 1
+            self._waits.append(started - queued_at)
+        metrics.record_stages([("render-queue", started - queued_at)])
+        try:
+            capture = profiling.active()
+            result, encodes, stages, child = self._get_executor().submit(
+                _call_in_context, encoding.current(), capture is not None,
+                fn, *args, **kwargs).result()
+            encoding.record(encodes)
+            metrics.record_stages(stages)
+            if child is not None:
+                capture.add_child(child)
+            return result
+        except BrokenProcessPool:
+            # A render process died; start a fresh pool for later calls
+            with self._lock:
+                self._executor = None
+            raise
+        finally:
+            with self._lock:
+                self._running -= 1
+                self._completed += 1
+                self._service.append(time.perf_counter() - started)
+            self._slots.release()
+
+    def stats(self):
+        """Return queue depth, utilisation and wait-time figures."""
+        with self._lock:
+            waits = np.array(self._waits) * 1000 if self._waits else np.zeros(1)
+            return {
+                "processes": self.processes,
+                "max_queue": self.max_queue,
+                "queue_timeout_s": self.queue_timeout,
+                "running": self._running,
+                "queued": self._waiting,
+                "completed": self._completed,
+                "rejected": self._rejected,
+                "wait_ms": {
+                    "mean": round(float(waits.mean()), 2),
+                    "p50": round(float(np.percentile(waits, 50)), 2),
+                    "p95": round(float(np.percentile(waits, 95)), 2),
+                    "max": round(float(waits.max()), 2),
+                },
+                "render_ms_mean": round(float(np.mean(self._service)) * 1000, 2)
+                if self._service else 0.0,
+            }
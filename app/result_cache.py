@@ -0,0 +1,114 @@
+"""
+Content-addressed cache of computed results.
+
+Keys are built by the caller from the content hashes of the inputs and
+an algorithm version, so an entry can never be served for a changed
+source file: the new file simply produces a different key and the old
+entry ages out.  Results live in an in-memory LRU tier and, optionally,
+in an on-disk tier that survives worker recycling and is shared by all
+workers on the host.
+"""
+
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+
+from app.cache import LRUCache
+
+
+def make_key(*parts):
+    """Return a stable hex key for a tuple of str/int parts."""
+    return hashlib.sha256("|".join(str(p) for p in parts).encode()).hexdigest()
+
+
+class ResultCache:
+    """
+    Two-tier cache of JSON-serialisable results.
+
+    Parameters
+    ----------
+    memory_bytes : int
+        Budget of the in-memory tier (sized by serialised JSON length).
+    disk_dir : Path or None
+        Directory of the on-disk tier; None disables it.
+    disk_bytes : int
+        Budget of the on-disk tier.  The least recently written files are
+        pruned once it is exceeded.
+
+    Cached values are shared between callers and must not be mutated.
+    """
+
+    PRUNE_EVERY = 32    # puts between disk-usage scans
+
+    def __init__(self, memory_bytes, disk_dir=None, disk_bytes=0):
+        self.memory = LRUCache(memory_bytes)
+        self.disk_dir = Path(disk_dir) if disk_dir and disk_bytes > 0 else None
+        self.disk_bytes = disk_bytes
+        self._puts = 0
+        self._lock = threading.Lock()
+        self.disk_hits = 0
+
+    def _path(self, key):
+        return self.disk_dir / key[:2] / f"{key}.json"
+
+    def get(self, key):
+        """Return the cached value for *key*, or None."""
+        value = self.memory.get(key)
+        if value is not None or self.disk_dir is None:
+            return value
+        path = self._path(key)
+        try:
+            raw = path.read_bytes()
+            value = json.loads(raw)
+        except (OSError, ValueError):
+            return None
+        self.disk_hits += 1
+        self.memory.put(key, value, len(raw))
+        return value
+
+    def put(self, key, value):
+        """Store *value* in both tiers."""
+        raw = json.dumps(value, separators=(',', ':')).encode()
+        self.memory.put(key, value, len(raw))
+        if self.disk_dir is None:
+            return
+        path = self._path(key)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}")
+            tmp.write_bytes(raw)
+            os.replace(tmp, path)
+        except OSError:
+            return
+        with self._lock:
+            self._puts += 1
+            prune = self._puts % self.PRUNE_EVERY == 0
+        if prune:
+            self._prune()
+
+    def _prune(self):
+        """Delete the oldest disk entries until the tier is within budget."""
+        files = []
+        total = 0
+        for path in self.disk_dir.glob("*/*.json"):
+            try:
+                st = path.stat()
+            except OSError:
+                continue
+            files.append((st.st_mtime, st.st_size, path))
+            total += st.st_size
+        files.sort()
+        for _, size, path in files:
+            if total <= self.disk_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+
+    def stats(self):
+        """Return memory-tier counters plus disk hits."""
+        stats = self.memory.stats()
+        stats["disk_hits"] = self.disk_hits
+        stats["disk_enabled"] = self.disk_dir is not None
+        return stats
@@ -0,0 +1,211 @@
+"""
+Shared-memory store of decoded images.
+
+The gunicorn master decodes the whole dataset once into a single file
+under ``/dev/shm`` and publishes a JSON index mapping each filename to
+``(offset, shape, dtype)`` together with the source file's mtime and size.
+Workers memory-map that file read-only and hand out zero-copy NumPy views,
+so every worker (including ones recycled by ``max_requests``) shares the
+same physical pages and never pays the decode cost again.
+"""
+
+import fcntl
+import json
+import mmap
+import os
+import threading
+import uuid
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+
+INDEX_NAME = "index.json"
+LOCK_NAME = ".lock"
+ALIGNMENT = 64          # byte alignment of every image inside the data file
+FORMAT_VERSION = 1
+
+
+def default_store_dir():
+    """Return the default store directory (RAM-backed where available)."""
+    base = Path("/dev/shm") if Path("/dev/shm").is_dir() else Path("/tmp")
+    return base / "dip-practical"
+
+
+def _file_stamp(path):
+    st = path.stat()
+    return st.st_mtime_ns, st.st_size
+
+
+def _read_index(store_dir):
+    try:
+        with open(store_dir / INDEX_NAME) as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if index.get("version") != FORMAT_VERSION:
+        return None
+    return index
+
+
+def _index_is_current(index, images_dir, sources):
+    if index is None or not (Path(index["store_dir"]) / index["data"]).exists():
+        return False
+    if index.get("images_dir") != str(images_dir):
+        return False
+    if set(index["images"]) != {p.name for p in sources}:
+        return False
+    for p in sources:
+        entry = index["images"][p.name]
+        if (entry["mtime_ns"], entry["size"]) != _file_stamp(p):
+            return False
+    return True
+
+
+def build(images_dir, store_dir=None, force=False):
+    """
+    Decode every TIF in *images_dir* into the shared store.
+
+    Does nothing when the published index already matches every source
+    file, so restarting the master is cheap.  Returns the index dict.
+    """
+    images_dir = Path(images_dir)
+    store_dir = Path(store_dir or default_store_dir())
+    store_dir.mkdir(parents=True, exist_ok=True)
+    sources = sorted(p for p in images_dir.iterdir() if p.suffix.lower() == '.tif')
+
+    with open(store_dir / LOCK_NAME, "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+
+        old_index = _read_index(store_dir)
+        if not force and _index_is_current(old_index, images_dir, sources):
+            return old_index
+
+        entries = {}
+        data_name = f"images-{uuid.uuid4().hex[:12]}.bin"
+        data_path = store_dir / data_name
+        offset = 0
+        with open(data_path, "wb") as out:
+            for p in sources:
+                stamp = _file_stamp(p)
+                img = cv2.imread(str(p), cv2.IMREAD_GRAYSCALE)
+                if img is None:
+                    continue
+                img = np.ascontiguousarray(img)
+                pad = -offset % ALIGNMENT
+                out.write(b"\0" * pad)
+                offset += pad
+                out.write(img.tobytes())
+                entries[p.name] = {
+                    "offset": offset,
+                    "shape": list(img.shape),
+                    "dtype": str(img.dtype),
+                    "mtime_ns": stamp[0],
+                    "size": stamp[1],
+                }
+                offset += img.nbytes
+
+        index = {
+            "version": FORMAT_VERSION,
+            "images_dir": str(images_dir),
+            "store_dir": str(store_dir),
+            "data": data_name,
+            "total_bytes": offset,
+            "images": entries,
+        }
+        tmp = store_dir / f".{INDEX_NAME}.{os.getpid()}"
+        with open(tmp, "w") as f:
+            json.dump(index, f)
+        os.replace(tmp, store_dir / INDEX_NAME)
+
+        # Workers that still map an older data file keep it alive until
+        # they remap; unlinking only removes the name.
+        for stale in store_dir.glob("images-*.bin"):
+            if stale.name != data_name:
+                stale.unlink(missing_ok=True)
+        return index
+
+
+class SharedImageStore:
+    """
+    Read-only view of a store published by :func:`build`.
+
+    The data file is mapped lazily on first use and remapped whenever the
+    index file is replaced.
+    """
+
+    def __init__(self, store_dir=None):
+        self.store_dir = Path(store_dir or default_store_dir())
+        self._lock = threading.Lock()
+        self._index_stamp = None
+        self._images = {}
+        self._map = None
+        self._views = {}        # name -> array; stable identity per mapping
+
+    def _refresh(self):
+        """(Re)load the index and data mapping if the index changed."""
+        try:
+            stamp = _file_stamp(self.store_dir / INDEX_NAME)
+        except OSError:
+            stamp = None
+        if stamp == self._index_stamp:
+            return
+        index = _read_index(self.store_dir) if stamp else None
+        images, mapped = {}, None
+        if index is not None:
+            try:
+                with open(self.store_dir / index["data"], "rb") as f:
+                    if index["total_bytes"] > 0:
+                        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                images = index["images"]
+            except OSError:
+                images, mapped = {}, None
+        # The previous mapping is left to the garbage collector: arrays
+        # handed out earlier may still reference it.
+        self._images, self._map, self._index_stamp = images, mapped, stamp
+        self._views = {}
+
+    def get(self, name, stamp):
+        """
+        Return a read-only zero-copy view of *name*, or None.
+
+        *stamp* is the ``(mtime_ns, size)`` of the source file; entries
+        published for a different version of the file are ignored.
+        """
+        with self._lock:
+            entry = self._images.get(name)
+            if entry is None or (entry["mtime_ns"], entry["size"]) != tuple(stamp):
+                self._refresh()
+                entry = self._images.get(name)
+                if entry is None or (entry["mtime_ns"], entry["size"]) != tuple(stamp):
+                    return None
+            if self._map is None:
+                return None
+            # The same array object for every caller, so per-array caches
+            # (e.g. app/stats.py) keep working across requests
+            view = self._views.get(name)
+            if view is None:
+                shape = tuple(entry["shape"])
+                view = np.frombuffer(self._map, dtype=entry["dtype"],
+                                     count=int(np.prod(shape)),
+                                     offset=entry["offset"]).reshape(shape)
+                self._views[name] = view
+            return view
+
+    def names(self):
+        """Return the filenames currently published in the store."""
+        with self._lock:
+            self._refresh()
+            return sorted(self._images)
+
+
+if __name__ == '__main__':
+    from app.image_processor import build_shared_store
+
+    idx = build_shared_store(force=True)
+    if idx is None:
+        raise SystemExit("Shared store disabled (DIP_SHM_STORE=0), images missing "
+                         "or store directory not writable")
+    print(f"Published {len(idx['images'])} images "
+          f"({idx['total_bytes'] / 1024 / 1024:.1f} MB) to {idx['store_dir']}")
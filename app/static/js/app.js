@@ -33,6 +33,7 @@
     var pixelGridCenter = { x: 0, y: 0 };
     var pixelGridFilename = null;
     var lastDiffFilename = null;
+    var prefetchedSteps = null;     // step-by-step body fetched with the last pair
 
     // ========================================================================
     // Quiz Data (hardcoded)
@@ -146,10 +147,23 @@
         }
     }
 
+    // A busy server sheds renders with 503 + Retry-After; wait as asked
+    // (at most MAX_RETRY_WAIT seconds) and retry up to MAX_BUSY_RETRIES times
+    var MAX_BUSY_RETRIES = 3;
+    var MAX_RETRY_WAIT = 10;
+
     async function apiCall(url, options) {
         if (typeof options === 'undefined') options = {};
         try {
             var resp = await fetch(url, options);
+            for (var attempt = 0; resp.status === 503 && attempt < MAX_BUSY_RETRIES; attempt++) {
+                var wait = parseInt(resp.headers.get('Retry-After'), 10);
+                if (isNaN(wait) || wait < 0) break;
+                wait = Math.min(wait, MAX_RETRY_WAIT);
+                showToast('Server busy, retrying in ' + wait + 's...', wait * 1000);
+                await new Promise(function (resolve) { setTimeout(resolve, wait * 1000); });
+                resp = await fetch(url, options);
+            }
             if (!resp.ok) {
                 var err = await resp.json().catch(function () { return { error: 'Request failed' }; });
                 throw new Error(err.error || 'HTTP ' + resp.status);
@@ -161,6 +175,47 @@
         }
     }
 
+    /**
+     * POST a slow render as an asynchronous job and resolve with its result.
+     * The server answers 202 with a job id to poll, or the body itself
+     * when the result is already available.
+     */
+    async function apiJob(url, payload) {
+        payload.async = true;
+        payload.refs = true;
+        var data = await apiCall(url, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify(payload)
+        });
+        if (!data.status_url) return data;
+
+        var delay = 250;
+        while (data.state === 'queued' || data.state === 'running') {
+            await new Promise(function (resolve) { setTimeout(resolve, delay); });
+            delay = Math.min(delay * 1.5, 1500);
+            data = await apiCall(data.status_url);
+        }
+        if (data.state !== 'done') {
+            var msg = data.error || 'Job ' + data.state;
+            showToast('Error: ' + msg, 5000);
+            throw new Error(msg);
+        }
+        return await apiCall(data.result_url + '?refs=1');
+    }
+
+    var IMAGE_MIMETYPES = { png: 'image/png', webp: 'image/webp', jpeg: 'image/jpeg' };
+
+    /**
+     * Image src for an API image field: responses requested with refs hold
+     * immutable /api/blob/ URLs, other responses inline base64 in the
+     * response's top-level "format" (PNG when it has none).
+     */
+    function imageSrc(value, format) {
+        if (value.indexOf('/api/blob/') === 0) return value;
+        return 'data:' + (IMAGE_MIMETYPES[format] || 'image/png') + ';base64,' + value;
+    }
+
     function createEl(tag, className, textContent) {
         var el = document.createElement(tag);
         if (className) el.className = className;
@@ -467,13 +522,38 @@
         });
     }
 
-    async function loadGalleryImage(imgEl, filename) {
-        try {
-            var data = await apiCall('/api/image/' + encodeURIComponent(filename));
-            imgEl.src = 'data:image/png;base64,' + data.image;
-        } catch (e) {
-            imgEl.alt = 'Failed to load';
+    // Must match app/pyramid.py: each level halves the previous one (rounding
+    // up) until the level fits in one tile
+    var PYRAMID_TILE_SIZE = 256;
+
+    /** Coarsest pyramid level still at least targetW x targetH pixels. */
+    function pyramidLevelFor(img, targetW, targetH) {
+        var level = 0;
+        var w = img.width;
+        var h = img.height;
+        while (Math.max(w, h) > PYRAMID_TILE_SIZE
+               && Math.ceil(w / 2) >= targetW && Math.ceil(h / 2) >= targetH) {
+            w = Math.ceil(w / 2);
+            h = Math.ceil(h / 2);
+            level++;
+        }
+        return level;
+    }
+
+    function loadGalleryImage(imgEl, filename) {
+        // Binary endpoints: cached by the browser (and nginx) and revalidated via ETag
+        imgEl.onerror = function () { imgEl.alt = 'Failed to load'; };
+        var img = availableImages.find(function (i) { return i.filename === filename; });
+        if (!img || !img.width || !img.height) {
+            imgEl.src = '/api/image-bin/' + encodeURIComponent(filename);
+            return;
         }
+        // Thumbnails only need the pyramid level matching their display size
+        var dpr = window.devicePixelRatio || 1;
+        var boxW = (imgEl.parentNode && imgEl.parentNode.clientWidth) || 240;
+        var level = pyramidLevelFor(img, boxW * dpr, 140 * dpr);
+        imgEl.src = '/api/pyramid/' + level + '/' + encodeURIComponent(filename)
+            + (img.content_hash ? '?v=' + img.content_hash.slice(0, 12) : '');
     }
 
     async function loadHistogramForGallery(filename) {
@@ -486,11 +566,11 @@
             var data = await apiCall('/api/histogram', {
                 method: 'POST',
                 headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({ filename: filename })
+                body: JSON.stringify({ filename: filename, refs: true })
             });
             var histImg = document.getElementById('histogram-img');
             if (histImg) {
-                histImg.src = 'data:image/png;base64,' + data.histogram;
+                histImg.src = imageSrc(data.histogram, data.format);
             }
             container.scrollIntoView({ behavior: 'smooth', block: 'nearest' });
             showToast('Histogram generated');
@@ -557,21 +637,37 @@
         setLoading(resultContainer, true);
 
         try {
-            var data = await apiCall('/api/spatial-difference', {
+            // One round trip: the difference plus the step-by-step pipeline,
+            // computed server-side on the same decoded pair
+            var batch = await apiCall('/api/batch', {
                 method: 'POST',
                 headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({ image1: filename1, image2: filename2 })
+                body: JSON.stringify({
+                    image1: filename1,
+                    image2: filename2,
+                    operations: [{ op: 'spatial-difference' }, { op: 'step-by-step' }],
+                    refs: true
+                })
             });
+            if (batch.results[0].error) {
+                showToast('Error: ' + batch.results[0].error, 5000);
+                throw new Error(batch.results[0].error);
+            }
+            var data = batch.results[0].result;
+            prefetchedSteps = batch.results[1].result
+                ? { key: filename1 + '|' + filename2, data: batch.results[1].result,
+                    format: batch.format }
+                : null;
 
             // Display images
             var rImg1 = document.getElementById('result-img1');
             var rImg2 = document.getElementById('result-img2');
             var rDiff = document.getElementById('result-diff');
             var rDiffE = document.getElementById('result-diff-enhanced');
-            if (rImg1) rImg1.src = 'data:image/png;base64,' + data.image1;
-            if (rImg2) rImg2.src = 'data:image/png;base64,' + data.image2;
-            if (rDiff) rDiff.src = 'data:image/png;base64,' + data.difference;
-            if (rDiffE) rDiffE.src = 'data:image/png;base64,' + data.difference_enhanced;
+            if (rImg1) rImg1.src = imageSrc(data.image1, batch.format);
+            if (rImg2) rImg2.src = imageSrc(data.image2, batch.format);
+            if (rDiff) rDiff.src = imageSrc(data.difference, batch.format);
+            if (rDiffE) rDiffE.src = imageSrc(data.difference_enhanced, batch.format);
 
             // Store difference filename
             if (data.difference_filename) {
@@ -655,13 +751,9 @@
         setLoading(plotContainer, true);
 
         try {
-            var data = await apiCall('/api/comparison-plot', {
-                method: 'POST',
-                headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({ image1: img1, image2: img2 })
-            });
+            var data = await apiJob('/api/comparison-plot', { image1: img1, image2: img2 });
             var plotImg = document.getElementById('full-plot-img');
-            if (plotImg) plotImg.src = 'data:image/png;base64,' + data.plot;
+            if (plotImg) plotImg.src = imageSrc(data.plot, data.format);
             showToast('Matplotlib comparison plot generated');
         } finally {
             setLoading(plotContainer, false);
@@ -733,14 +825,14 @@
         };
 
         try {
-            var data = await apiCall('/api/matplotlib-demos');
+            var data = await apiCall('/api/matplotlib-demos?refs=1');
             container.textContent = '';
 
             Object.keys(data.demos).forEach(function (key) {
                 var div = createEl('div', 'demo-plot');
 
                 var img = document.createElement('img');
-                img.src = 'data:image/png;base64,' + data.demos[key];
+                img.src = imageSrc(data.demos[key], data.format);
                 img.alt = demoNames[key] || key;
                 div.appendChild(img);
 
@@ -763,6 +855,95 @@
     // 1. Pixel Grid Visualization (Canvas-based, 10x10)
     // ========================================================================
 
+    // Raw pixel values come from /api/tile as 64x64 uint8 tiles.  Each tile
+    // is fetched once (and cached by the browser); regions are cut out of
+    // the cached tiles locally.
+    var TILE_SIZE = 64;
+    var MAX_CACHED_TILES = 256;
+    var pixelTiles = {};          // 'filename|tx|ty' -> Promise of tile
+    var pixelTileCount = 0;
+
+    function fetchPixelTile(filename, tx, ty) {
+        var key = filename + '|' + tx + '|' + ty;
+        if (!pixelTiles[key]) {
+            if (pixelTileCount >= MAX_CACHED_TILES) {
+                pixelTiles = {};
+                pixelTileCount = 0;
+            }
+            var img = availableImages.find(function (i) { return i.filename === filename; });
+            var url = '/api/tile/' + tx + '/' + ty + '/' + encodeURIComponent(filename)
+                + (img && img.content_hash ? '?v=' + img.content_hash.slice(0, 12) : '');
+            var tile = fetch(url).then(function (resp) {
+                if (!resp.ok) throw new Error('HTTP ' + resp.status);
+                return resp.arrayBuffer().then(function (buf) {
+                    return {
+                        data: new Uint8Array(buf),
+                        width: parseInt(resp.headers.get('X-Tile-Width'), 10),
+                        imageWidth: parseInt(resp.headers.get('X-Image-Width'), 10),
+                        imageHeight: parseInt(resp.headers.get('X-Image-Height'), 10)
+                    };
+                });
+            });
+            tile.catch(function () {
+                if (pixelTiles[key] === tile) {
+                    delete pixelTiles[key];
+                    pixelTileCount--;
+                }
+            });
+            pixelTiles[key] = tile;
+            pixelTileCount++;
+        }
+        return pixelTiles[key];
+    }
+
+    /** Image size from the catalog listing, or from the first tile. */
+    async function getPixelImageSize(filename) {
+        var img = availableImages.find(function (i) { return i.filename === filename; });
+        if (img && img.width && img.height) return { width: img.width, height: img.height };
+        var tile = await fetchPixelTile(filename, 0, 0);
+        return { width: tile.imageWidth, height: tile.imageHeight };
+    }
+
+    /**
+     * Pixel values of columns [x0, x1) and rows [y0, y1) as a 2-D array,
+     * assembled from the tiles covering the region.
+     */
+    async function getPixelRegion(filename, x0, y0, x1, y1) {
+        var tiles = {};
+        var pending = [];
+        for (var ty = Math.floor(y0 / TILE_SIZE); ty <= Math.floor((y1 - 1) / TILE_SIZE); ty++) {
+            for (var tx = Math.floor(x0 / TILE_SIZE); tx <= Math.floor((x1 - 1) / TILE_SIZE); tx++) {
+                pending.push((function (tx, ty) {
+                    return fetchPixelTile(filename, tx, ty).then(function (tile) {
+                        tiles[tx + ',' + ty] = tile;
+                    });
+                })(tx, ty));
+            }
+        }
+        await Promise.all(pending);
+
+        var grid = [];
+        for (var y = y0; y < y1; y++) {
+            var row = [];
+            for (var x = x0; x < x1; x++) {
+                var tile = tiles[Math.floor(x / TILE_SIZE) + ',' + Math.floor(y / TILE_SIZE)];
+                row.push(tile.data[(y % TILE_SIZE) * tile.width + (x % TILE_SIZE)]);
+            }
+            grid.push(row);
+        }
+        return grid;
+    }
+
+    /** 10x10 window of the pixel grid with its top-left corner at (x, y). */
+    async function getPixelGridWindow(filename, x, y) {
+        var size = await getPixelImageSize(filename);
+        x = Math.max(0, Math.min(x, size.width - 10));
+        y = Math.max(0, Math.min(y, size.height - 10));
+        var grid = await getPixelRegion(filename, x, y,
+            Math.min(x + 10, size.width), Math.min(y + 10, size.height));
+        return { x: x, y: y, grid: grid };
+    }
+
     function initPixelGrid() {
         var container = document.getElementById('pixel-grid-canvas-container');
         if (!container) {
@@ -781,15 +962,9 @@
         pixelGridFilename = availableImages[0].filename;
         pixelGridCenter = { x: 0, y: 0 };
 
-        apiCall('/api/pixel-view', {
-            method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({ filename: pixelGridFilename, x: 0, y: 0, size: 10 })
-        }).then(function (data) {
-            if (data && data.pixel_grid) {
-                pixelGridData = data.pixel_grid.slice(0, 10).map(function (row) {
-                    return row.slice(0, 10);
-                });
+        getPixelGridWindow(pixelGridFilename, 0, 0).then(function (view) {
+            if (view.grid.length) {
+                pixelGridData = view.grid;
                 var container = document.getElementById('pixel-grid-canvas-container')
                     || document.getElementById('pixel-grid-container');
                 if (container) {
@@ -931,20 +1106,12 @@
             var newX = pixelGridCenter.x + col;
             var newY = pixelGridCenter.y + row;
 
-            showToast('Loading pixel region at (' + newX + ', ' + newY + ')...');
-
-            apiCall('/api/pixel-view', {
-                method: 'POST',
-                headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({ filename: pixelGridFilename, x: newX, y: newY, size: 10 })
-            }).then(function (data) {
-                if (data && data.pixel_grid) {
-                    pixelGridCenter = { x: newX, y: newY };
-                    pixelGridData = data.pixel_grid.slice(0, 10).map(function (row) {
-                        return row.slice(0, 10);
-                    });
+            getPixelGridWindow(pixelGridFilename, newX, newY).then(function (view) {
+                if (view.grid.length) {
+                    pixelGridCenter = { x: view.x, y: view.y };
+                    pixelGridData = view.grid;
                     renderPixelGridCanvas(container, pixelGridData);
-                    showToast('Pixel grid re-centered at (' + newX + ', ' + newY + ')');
+                    showToast('Pixel grid re-centered at (' + view.x + ', ' + view.y + ')');
                 }
             }).catch(function () {
                 showToast('Failed to load pixel data at that position');
@@ -1562,11 +1729,11 @@
             var data = await apiCall('/api/bit-depth', {
                 method: 'POST',
                 headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({ filename: filename })
+                body: JSON.stringify({ filename: filename, refs: true })
             });
 
             resultDiv.textContent = '';
-            var normalized = { filename: filename };
+            var normalized = { filename: filename, format: data.format };
             var imgs = data.images || data;
             if (imgs['8_bit']) normalized.bit_8 = imgs['8_bit'];
             if (imgs['4_bit']) normalized.bit_4 = imgs['4_bit'];
@@ -1611,7 +1778,7 @@
             var card = createEl('div', 'bit-depth-card');
 
             var imgEl = document.createElement('img');
-            imgEl.src = 'data:image/png;base64,' + data[bd.key];
+            imgEl.src = imageSrc(data[bd.key], data.format);
             imgEl.alt = bd.label;
             imgEl.className = 'bit-depth-img';
             card.appendChild(imgEl);
@@ -1664,18 +1831,25 @@
             }
 
             try {
-                var data = await apiCall('/api/step-by-step', {
-                    method: 'POST',
-                    headers: { 'Content-Type': 'application/json' },
-                    body: JSON.stringify({ image1: image1, image2: image2 })
-                });
+                var data, format;
+                if (prefetchedSteps && prefetchedSteps.key === image1 + '|' + image2) {
+                    data = prefetchedSteps.data;
+                    format = prefetchedSteps.format;
+                } else {
+                    data = await apiCall('/api/step-by-step', {
+                        method: 'POST',
+                        headers: { 'Content-Type': 'application/json' },
+                        body: JSON.stringify({ image1: image1, image2: image2, refs: true })
+                    });
+                    format = data.format;
+                }
 
                 resultDiv.textContent = '';
                 setLoading(resultDiv, false);
 
                 if (data.steps && data.steps.length > 0) {
                     var normalizedSteps = normalizeSteps(data.steps);
-                    renderStepByStep(resultDiv, normalizedSteps);
+                    renderStepByStep(resultDiv, normalizedSteps, format);
                 }
                 showToast('Step-by-step pipeline loaded');
             } catch (e) {
@@ -1744,7 +1918,7 @@
         });
     }
 
-    function renderStepByStep(container, steps) {
+    function renderStepByStep(container, steps, format) {
         var timeline = createEl('div', 'step-timeline');
         container.appendChild(timeline);
 
@@ -1838,7 +2012,7 @@
                 if (step.image) {
                     var imgSection = createEl('div', 'step-section');
                     var imgEl = document.createElement('img');
-                    imgEl.src = 'data:image/png;base64,' + step.image;
+                    imgEl.src = imageSrc(step.image, format);
                     imgEl.alt = step.title;
                     imgEl.className = 'step-image';
                     imgSection.appendChild(imgEl);
@@ -1871,6 +2045,124 @@
     // 6. Surface Plot
     // ========================================================================
 
+    // Interactive surfaces are drawn in the browser from /api/heightmap; the
+    // matplotlib render is kept as a fallback.
+    var SURFACE_DETAIL = 128;               // heightmap samples per side
+    var VIRIDIS_STOPS = [[68, 1, 84], [59, 82, 139], [33, 145, 140],
+                         [94, 201, 98], [253, 231, 37]];
+    var viridisColors = null;
+
+    function viridisLut() {
+        if (!viridisColors) {
+            viridisColors = [];
+            for (var v = 0; v < 256; v++) {
+                var t = v / 255 * (VIRIDIS_STOPS.length - 1);
+                var i = Math.min(Math.floor(t), VIRIDIS_STOPS.length - 2);
+                var f = t - i;
+                var a = VIRIDIS_STOPS[i];
+                var b = VIRIDIS_STOPS[i + 1];
+                viridisColors.push('rgb(' + Math.round(a[0] + (b[0] - a[0]) * f) + ','
+                    + Math.round(a[1] + (b[1] - a[1]) * f) + ','
+                    + Math.round(a[2] + (b[2] - a[2]) * f) + ')');
+            }
+        }
+        return viridisColors;
+    }
+
+    /** Fetch a region's heightmap; size null means the whole image. */
+    async function fetchHeightmap(filename, x, y, size, maxSide) {
+        var img = availableImages.find(function (i) { return i.filename === filename; });
+        var url = '/api/heightmap/' + encodeURIComponent(filename)
+            + '?x=' + x + '&y=' + y + (size ? '&size=' + size : '')
+            + '&max_side=' + maxSide
+            + (img && img.content_hash ? '&v=' + img.content_hash.slice(0, 12) : '');
+        var resp = await fetch(url);
+        if (!resp.ok) throw new Error('HTTP ' + resp.status);
+        var region = resp.headers.get('X-Heightmap-Region').split(',').map(Number);
+        return {
+            data: new Uint8Array(await resp.arrayBuffer()),
+            width: parseInt(resp.headers.get('X-Heightmap-Width'), 10),
+            height: parseInt(resp.headers.get('X-Heightmap-Height'), 10),
+            x: region[0], y: region[1], regionWidth: region[2], regionHeight: region[3],
+            imageWidth: parseInt(resp.headers.get('X-Image-Width'), 10),
+            imageHeight: parseInt(resp.headers.get('X-Image-Height'), 10)
+        };
+    }
+
+    /**
+     * Draw a heightmap as a shaded surface (orthographic view).  Cells are
+     * painted back to front in grid order, which is exact for a heightfield
+     * seen from above.
+     */
+    function drawSurface(canvas, hm, azimuth, elevation) {
+        var ctx = canvas.getContext('2d');
+        var W = hm.width;
+        var H = hm.height;
+        var colors = viridisLut();
+        ctx.fillStyle = '#ffffff';
+        ctx.fillRect(0, 0, canvas.width, canvas.height);
+        if (W < 2 || H < 2) return;
+
+        var aspect = hm.regionHeight / hm.regionWidth;
+        var sx = aspect > 1 ? 1 / aspect : 1;
+        var sy = aspect > 1 ? 1 : aspect;
+        var ca = Math.cos(azimuth);
+        var sa = Math.sin(azimuth);
+        var ce = Math.cos(elevation);
+        var se = Math.sin(elevation);
+        var scale = Math.min(canvas.width, canvas.height) * 0.62;
+        var cx = canvas.width / 2;
+        var cy = canvas.height / 2 + scale * 0.12 * ce;
+
+        var px = new Float32Array(W * H);
+        var py = new Float32Array(W * H);
+        for (var j = 0; j < H; j++) {
+            for (var i = 0; i < W; i++) {
+                var u = (i / (W - 1) - 0.5) * sx;
+                var v = (j / (H - 1) - 0.5) * sy;
+                var z = hm.data[j * W + i] / 255 * 0.35;
+                var k = j * W + i;
+                px[k] = cx + (u * ca - v * sa) * scale;
+                py[k] = cy + (u * sa + v * ca) * se * scale - z * ce * scale;
+            }
+        }
+
+        // Larger depth (u*sa + v*ca) is nearer the viewer: paint it last
+        var iStep = sa >= 0 ? 1 : -1;
+        var jStep = ca >= 0 ? 1 : -1;
+        ctx.lineWidth = 0.6;
+        for (var jj = 0; jj < H - 1; jj++) {
+            var r = jStep > 0 ? jj : H - 2 - jj;
+            for (var ii = 0; ii < W - 1; ii++) {
+                var c = iStep > 0 ? ii : W - 2 - ii;
+                var a = r * W + c;
+                var level = (hm.data[a] + hm.data[a + 1] + hm.data[a + W]
+                             + hm.data[a + W + 1]) >> 2;
+                ctx.beginPath();
+                ctx.moveTo(px[a], py[a]);
+                ctx.lineTo(px[a + 1], py[a + 1]);
+                ctx.lineTo(px[a + W + 1], py[a + W + 1]);
+                ctx.lineTo(px[a + W], py[a + W]);
+                ctx.closePath();
+                ctx.fillStyle = ctx.strokeStyle = colors[level];
+                ctx.fill();
+                ctx.stroke();
+            }
+        }
+    }
+
+    async function renderMatplotlibSurface(resultDiv, filename, x, y, size) {
+        var data = await apiJob('/api/surface-plot',
+            { filename: filename, x: x, y: y, size: size });
+        if (data.plot) {
+            var imgEl = document.createElement('img');
+            imgEl.src = imageSrc(data.plot, data.format);
+            imgEl.alt = '3D Surface Plot';
+            imgEl.className = 'surface-plot-img';
+            resultDiv.appendChild(imgEl);
+        }
+    }
+
     function initSurfacePlot() {
         var btn = document.getElementById('btn-surface-plot');
         if (!btn) return;
@@ -1893,33 +2185,112 @@
                 return;
             }
 
-            var x = 0;
-            var y = 0;
-            var size = 64;
-
-            try {
-                var data = await apiCall('/api/surface-plot', {
-                    method: 'POST',
-                    headers: { 'Content-Type': 'application/json' },
-                    body: JSON.stringify({ filename: filename, x: x, y: y, size: size })
-                });
+            var canvas = document.createElement('canvas');
+            if (!canvas.getContext) {
+                // No canvas: fall back to the server-rendered plot
+                try {
+                    await renderMatplotlibSurface(resultDiv, filename, 0, 0, 64);
+                    showToast('3D surface plot generated');
+                } catch (e) {
+                    resultDiv.appendChild(createEl('p', 'error-text',
+                        'Failed to generate surface plot.'));
+                } finally {
+                    setLoading(resultDiv, false);
+                }
+                return;
+            }
 
-                resultDiv.textContent = '';
+            var view = { azimuth: Math.PI / 4, elevation: 0.6, zoom: 0, cx: null, cy: null };
+            var hm = null;
+            var plotDesc = createEl('p', 'surface-plot-desc', '');
+            var controls = createEl('div', 'btn-group', null);
+            var zoomIn = createEl('button', 'btn btn-secondary', 'Zoom In');
+            var zoomOut = createEl('button', 'btn btn-secondary', 'Zoom Out');
+            var mplBtn = createEl('button', 'btn btn-secondary', 'Render with Matplotlib');
+            var mplDiv = createEl('div', 'surface-plot-fallback', null);
+            canvas.width = 720;
+            canvas.height = 480;
+            canvas.className = 'surface-plot-canvas';
+            controls.appendChild(zoomIn);
+            controls.appendChild(zoomOut);
+            controls.appendChild(mplBtn);
+
+            function regionSize() {
+                return Math.max(8, Math.round(Math.max(hm.imageWidth, hm.imageHeight)
+                                              / Math.pow(2, view.zoom)));
+            }
 
-                var plotDesc = createEl('p', 'surface-plot-desc',
-                    '3D surface plot showing pixel intensity values as elevation. ' +
-                    'Higher peaks correspond to brighter pixels. Region: (' + x + ',' + y + ') to (' + (x + size) + ',' + (y + size) + ').');
-                resultDiv.appendChild(plotDesc);
+            async function load() {
+                var size = hm ? regionSize() : null;
+                var x = hm ? Math.max(0, Math.round(view.cx - size / 2)) : 0;
+                var y = hm ? Math.max(0, Math.round(view.cy - size / 2)) : 0;
+                hm = await fetchHeightmap(filename, x, y, view.zoom ? size : null,
+                                          SURFACE_DETAIL);
+                if (view.cx === null) {
+                    view.cx = hm.imageWidth / 2;
+                    view.cy = hm.imageHeight / 2;
+                }
+                plotDesc.textContent = '3D surface of pixel intensity as elevation '
+                    + '(drag to rotate). Higher peaks correspond to brighter pixels. Region: ('
+                    + hm.x + ',' + hm.y + ') to (' + (hm.x + hm.regionWidth) + ','
+                    + (hm.y + hm.regionHeight) + '), ' + hm.width + '×' + hm.height
+                    + ' samples.';
+                zoomIn.disabled = regionSize() <= 8;
+                zoomOut.disabled = view.zoom === 0;
+                drawSurface(canvas, hm, view.azimuth, view.elevation);
+            }
 
-                if (data.plot) {
-                    var imgEl = document.createElement('img');
-                    imgEl.src = 'data:image/png;base64,' + data.plot;
-                    imgEl.alt = '3D Surface Plot';
-                    imgEl.className = 'surface-plot-img';
-                    resultDiv.appendChild(imgEl);
+            var drag = null;
+            var pending = false;
+            canvas.addEventListener('pointerdown', function (e) {
+                drag = { x: e.clientX, y: e.clientY };
+                canvas.setPointerCapture(e.pointerId);
+            });
+            canvas.addEventListener('pointerup', function () { drag = null; });
+            canvas.addEventListener('pointermove', function (e) {
+                if (!drag || !hm) return;
+                view.azimuth += (e.clientX - drag.x) * 0.01;
+                view.elevation = Math.min(1.5, Math.max(0.1,
+                    view.elevation + (e.clientY - drag.y) * 0.01));
+                drag = { x: e.clientX, y: e.clientY };
+                if (!pending) {
+                    pending = true;
+                    requestAnimationFrame(function () {
+                        pending = false;
+                        drawSurface(canvas, hm, view.azimuth, view.elevation);
+                    });
                 }
+            });
+            zoomIn.addEventListener('click', function () {
+                view.zoom++;
+                load().catch(function () { showToast('Failed to load heightmap'); });
+            });
+            zoomOut.addEventListener('click', function () {
+                view.zoom = Math.max(0, view.zoom - 1);
+                load().catch(function () { showToast('Failed to load heightmap'); });
+            });
+            mplBtn.addEventListener('click', async function () {
+                mplDiv.textContent = '';
+                setLoading(mplDiv, true);
+                try {
+                    await renderMatplotlibSurface(mplDiv, filename, hm.x, hm.y,
+                                                  Math.max(hm.regionWidth, hm.regionHeight));
+                } catch (e) {
+                    mplDiv.appendChild(createEl('p', 'error-text',
+                        'Failed to generate surface plot.'));
+                } finally {
+                    setLoading(mplDiv, false);
+                }
+            });
 
-                showToast('3D surface plot generated');
+            try {
+                await load();
+                resultDiv.textContent = '';
+                resultDiv.appendChild(plotDesc);
+                resultDiv.appendChild(canvas);
+                resultDiv.appendChild(controls);
+                resultDiv.appendChild(mplDiv);
+                showToast('3D surface ready');
             } catch (e) {
                 resultDiv.textContent = '';
                 var errMsg = createEl('p', 'error-text', 'Failed to generate surface plot.');
@@ -2260,17 +2631,16 @@
 
     async function fetchPixelView(filename, x, y, anchorEl) {
         try {
-            var data = await apiCall('/api/pixel-view', {
-                method: 'POST',
-                headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({ filename: filename, x: x, y: y, size: 9 })
-            });
-
-            if (data && (data.pixel_grid || data.grid)) {
-                showPixelInspectorPopup(data.pixel_grid || data.grid, x, y, anchorEl);
-            }
+            // Same clamping as /api/pixel-view with size 9
+            var size = await getPixelImageSize(filename);
+            x = Math.max(0, Math.min(x, size.width - 1));
+            y = Math.max(0, Math.min(y, size.height - 1));
+            var grid = await getPixelRegion(filename,
+                Math.max(0, x - 9), Math.max(0, y - 9),
+                Math.min(size.width, x + 10), Math.min(size.height, y + 10));
+            showPixelInspectorPopup(grid, x, y, anchorEl);
         } catch (e) {
-            // The toast from apiCall is sufficient
+            showToast('Error: ' + e.message, 5000);
         }
     }
 
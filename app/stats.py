@@ -0,0 +1,115 @@
+"""
+Histogram-derived statistics for uint8 images.
+
+For 8-bit data the 256-bin histogram is a complete summary: mean,
+standard deviation, min, max, the nonzero count and any percentile can
+be derived from it exactly.  One ``cv2.calcHist`` pass therefore replaces
+the separate full-array passes of ``np.mean``, ``np.std``, ``np.min``,
+``np.max`` and ``np.count_nonzero``.
+
+Results are cached per array identity (the cache holds only a weak
+reference to the array).  Arrays passed in must not be modified
+afterwards; images from ``load_image`` are read-only, and derived arrays
+should be made read-only before their statistics are taken.
+"""
+
+import threading
+import weakref
+
+import cv2
+import numpy as np
+
+from app import metrics
+
+
+_LEVELS = np.arange(256, dtype=np.float64)
+
+
+class ArrayStats:
+    """Statistics of one uint8 array, derived from its histogram."""
+
+    def __init__(self, hist):
+        self.hist = hist                                    # calcHist output (256, 1)
+        counts = hist.reshape(-1).astype(np.float64)
+        self.counts = counts
+        self.count = int(counts.sum())
+        present = np.flatnonzero(counts)
+        self.min = int(present[0]) if present.size else 0
+        self.max = int(present[-1]) if present.size else 0
+        self.nonzero = self.count - int(counts[0])
+        self.mean = float(counts @ _LEVELS / self.count) if self.count else 0.0
+        self.std = (float(np.sqrt(counts @ (_LEVELS - self.mean) ** 2 / self.count))
+                    if self.count else 0.0)
+        self._cumulative = np.cumsum(counts)
+
+    def _value_at(self, rank):
+        """Value of the element at *rank* (0-based) in sorted order."""
+        return int(np.searchsorted(self._cumulative, rank, side='right'))
+
+    def percentile(self, q):
+        """Same result as ``np.percentile(arr, q)`` (linear interpolation)."""
+        if not self.count:
+            return 0.0
+        pos = q / 100 * (self.count - 1)
+        lower = int(np.floor(pos))
+        lo = self._value_at(lower)
+        hi = self._value_at(min(lower + 1, self.count - 1))
+        return float(lo + (hi - lo) * (pos - lower))
+
+
+class StatsCache:
+    """Per-array-identity cache of :class:`ArrayStats`."""
+
+    def __init__(self):
+        self._entries = {}      # id(array) -> (weakref, ArrayStats)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, arr):
+        """Return the :class:`ArrayStats` of uint8 array *arr*."""
+        key = id(arr)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0]() is arr:
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+        with metrics.stage('histogram'):
+            result = ArrayStats(cv2.calcHist([arr], [0], None, [256], [0, 256]))
+        try:
+            ref = weakref.ref(arr, lambda _, key=key: self._discard(key))
+        except TypeError:
+            return result
+        with self._lock:
+            self._entries[key] = (ref, result)
+        return result
+
+    def _discard(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0]() is None:
+                del self._entries[key]
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits,
+                    "misses": self.misses}
+
+
+_cache = StatsCache()
+
+
+def array_stats(arr):
+    """Return the cached :class:`ArrayStats` of a uint8 array."""
+    return _cache.get(arr)
+
+
+def histogram(arr):
+    """Return the cached 256-bin ``cv2.calcHist`` histogram of *arr*."""
+    return _cache.get(arr).hist
+
+
+def cache_stats():
+    """Hit/miss counters of the statistics cache."""
+    return _cache.stats()
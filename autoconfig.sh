@@ -60,17 +60,26 @@ fi
 "${VENV_DIR}/bin/pip" install --quiet --upgrade pip
 "${VENV_DIR}/bin/pip" install --quiet -r requirements.txt
 
-# --- Gunicorn config for production ---
-cat > "${APP_DIR}/gunicorn.conf.py" << 'GUNICORN_EOF'
-bind = "127.0.0.1:8000"
-workers = 4
-worker_class = "sync"
-timeout = 120
-keepalive = 5
-accesslog = "/var/log/dip-practical/access.log"
-errorlog = "/var/log/dip-practical/error.log"
-loglevel = "info"
-GUNICORN_EOF
+# --- Precompute curated plots (served as static files) ---
+echo "[*] Precomputing curated plots..."
+# Renders inline in its own process pool; artifacts that fail are rendered
+# live on request instead, so they do not stop the deploy.
+sudo -u "${APP_USER}" "${VENV_DIR}/bin/python" -m app.precompute --prune \
+    || echo "[WARN] Some artifacts failed to precompute; they will be rendered on request."
+
+# --- Gunicorn config ---
+# The service runs the repository's gunicorn.conf.py unchanged: gthread
+# workers, and the server hooks that publish the shared image store,
+# preload the app and reset per-worker metrics.  Tune it through the DIP_*
+# environment variables in /etc/default/${APP_NAME}, not by rewriting the file.
+
+# --- App environment (operator overrides are kept) ---
+# nginx sends precomputed artifacts itself (deploy/nginx-site.conf
+# /_precomputed/ -> ${APP_DIR}/.cache/precomputed)
+ENV_FILE="/etc/default/${APP_NAME}"
+touch "${ENV_FILE}"
+grep -q '^DIP_PRECOMPUTED_ACCEL=' "${ENV_FILE}" \
+    || echo 'DIP_PRECOMPUTED_ACCEL=/_precomputed/' >> "${ENV_FILE}"
 
 # --- Systemd service ---
 echo "[*] Configuring systemd service..."
@@ -85,6 +94,7 @@ User=${APP_USER}
 Group=${APP_USER}
 WorkingDirectory=${APP_DIR}
 Environment=PATH=${VENV_DIR}/bin:/usr/local/bin:/usr/bin:/bin
+EnvironmentFile=-/etc/default/${APP_NAME}
 ExecStart=${VENV_DIR}/bin/gunicorn -c gunicorn.conf.py app.main:app
 Restart=always
 RestartSec=5
@@ -99,48 +109,10 @@ systemctl restart ${APP_NAME}
 
 # --- Nginx ---
 echo "[*] Configuring Nginx..."
-cat > /etc/nginx/sites-available/${APP_NAME} << 'NGINX_EOF'
-server {
-    listen 80;
-    server_name dip.dmj.one _;
-
-    # Trust Cloudflare proxy headers
-    set_real_ip_from 173.245.48.0/20;
-    set_real_ip_from 103.21.244.0/22;
-    set_real_ip_from 103.22.200.0/22;
-    set_real_ip_from 103.31.4.0/22;
-    set_real_ip_from 141.101.64.0/18;
-    set_real_ip_from 108.162.192.0/18;
-    set_real_ip_from 190.93.240.0/20;
-    set_real_ip_from 188.114.96.0/20;
-    set_real_ip_from 197.234.240.0/22;
-    set_real_ip_from 198.41.128.0/17;
-    set_real_ip_from 162.158.0.0/15;
-    set_real_ip_from 104.16.0.0/13;
-    set_real_ip_from 104.24.0.0/14;
-    set_real_ip_from 172.64.0.0/13;
-    set_real_ip_from 131.0.72.0/22;
-    real_ip_header CF-Connecting-IP;
-
-    client_max_body_size 10M;
-
-    location / {
-        proxy_pass http://127.0.0.1:8000;
-        proxy_set_header Host $host;
-        proxy_set_header X-Real-IP $remote_addr;
-        proxy_set_header X-Forwarded-For $proxy_add_x_forwarded_for;
-        proxy_set_header X-Forwarded-Proto $scheme;
-        proxy_read_timeout 120s;
-    }
-
-    # Static files served directly by nginx for performance
-    location /static/ {
-        alias /opt/dip-practical/app/static/;
-        expires 7d;
-        add_header Cache-Control "public, immutable";
-    }
-}
-NGINX_EOF
+# The repository's site config, the same one documented for manual setups:
+# precomputed files, edge caches, and /metrics restricted to localhost
+install -d -o www-data -g www-data /var/cache/nginx/dip
+install -m 644 "${APP_DIR}/deploy/nginx-site.conf" /etc/nginx/sites-available/${APP_NAME}
 
 ln -sf /etc/nginx/sites-available/${APP_NAME} /etc/nginx/sites-enabled/${APP_NAME}
 rm -f /etc/nginx/sites-enabled/default
@@ -164,6 +136,12 @@ sleep 3
 HEALTH=$(curl -sf http://localhost/health || echo "FAILED")
 if echo "${HEALTH}" | grep -q "healthy"; then
     echo "[OK] Application is healthy!"
+    # post_worker_init exports this: the gunicorn.conf.py hooks are running
+    if curl -sf http://127.0.0.1:8000/metrics | grep -q "^dip_worker_boot_seconds_count"; then
+        echo "[OK] gunicorn server hooks active (shared image store, metrics)"
+    else
+        echo "[WARN] dip_worker_boot_seconds missing: gunicorn.conf.py hooks did not run"
+    fi
 else
     echo "[WARN] Health check failed. Checking logs..."
     journalctl -u ${APP_NAME} --no-pager -n 20
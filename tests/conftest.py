@@ -0,0 +1,40 @@
+"""
+Test configuration.
+
+The app reads its settings from the environment when it is imported, so
+they are pinned here, before any test imports it: a throwaway cache
+directory, no /dev/shm store and inline rendering.
+"""
+
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+CACHE_DIR = Path(tempfile.mkdtemp(prefix="dip-tests-"))
+
+TEST_ENV = {
+    "DIP_CACHE_DIR": str(CACHE_DIR),
+    "DIP_SHM_STORE": "0",
+    "DIP_RENDER_PROCESSES": "0",
+}
+os.environ.update(TEST_ENV)
+sys.path.insert(0, str(ROOT))
+
+
+import pytest  # noqa: E402
+
+
+@pytest.fixture
+def client():
+    """Flask test client of the app."""
+    from app.main import app
+    return app.test_client()
+
+
+@pytest.fixture
+def filename():
+    """A dataset image."""
+    from app.image_processor import get_available_images
+    return get_available_images()[0]["filename"]
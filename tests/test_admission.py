@@ -0,0 +1,132 @@
+import threading
+import time
+
+import pytest
+
+from app import admission
+
+
+def test_parse_limits():
+    assert admission.parse_limits("2,1,10") == (2, 1, 10.0)
+    assert admission.parse_limits("off") is None
+    assert admission.parse_limits("") is None
+    with pytest.raises(ValueError):
+        admission.parse_limits("0,1,10")
+    with pytest.raises(ValueError):
+        admission.parse_limits("2,1")
+
+
+def test_over_queue_is_rejected_with_retry_after():
+    cost = admission.CostClass("render", limit=1, max_queue=0, deadline=5)
+    cost.acquire()
+    with pytest.raises(admission.Overloaded) as exc:
+        cost.acquire()
+    assert exc.value.cost_class == "render"
+    assert exc.value.retry_after >= 1
+    cost.release(0.1)
+    cost.acquire()
+    assert cost.stats()["admitted"] == 2
+    assert cost.stats()["rejected"] == 1
+
+
+def test_queued_request_waits_for_a_slot():
+    cost = admission.CostClass("render", limit=1, max_queue=1, deadline=5)
+    cost.acquire()
+    waited = []
+    waiter = threading.Thread(target=lambda: waited.append(cost.acquire()))
+    waiter.start()
+    while cost.stats()["queued"] == 0:
+        time.sleep(0.001)
+    cost.release(0.1)
+    waiter.join(timeout=5)
+    assert waited and waited[0] > 0
+    assert cost.stats()["running"] == 1
+
+
+def test_deadline_sheds_the_waiter():
+    cost = admission.CostClass("compute", limit=1, max_queue=1, deadline=0.05)
+    cost.acquire()
+    with pytest.raises(admission.Overloaded):
+        cost.acquire()
+    assert cost.stats()["queued"] == 0
+
+
+def test_check_workers():
+    classes = [admission.CostClass(name, *admission.parse_limits(limits))
+               for name, limits in admission.DEFAULT_LIMITS.items()]
+    assert admission.check_workers(classes, "gthread", 8) is None
+    assert "gthread" in admission.check_workers(classes, "sync", 1)
+    assert "none are left" in admission.check_workers(classes, "gthread", 6)
+    assert admission.check_workers([], "sync", 1) is None
+
+
+@pytest.mark.parametrize("body, cost", [
+    ({"async": True}, "cheap"),
+    ({"async": 1}, "render"),
+    ({"async": "true"}, "render"),
+    ({}, "render"),
+])
+def test_async_submissions_are_cheap(body, cost):
+    from app import main
+
+    with main.app.test_request_context("/api/comparison-plot", method="POST", json=body):
+        assert main.request_cost() == cost
+        assert main.wants_async(body) == (cost == "cheap")
+
+
+def test_full_class_answers_503_and_cheap_requests_still_run(client, filename, monkeypatch):
+    from app import main
+
+    render = admission.CostClass("render", limit=1, max_queue=0, deadline=1)
+    monkeypatch.setattr(main, "admission_control", admission.AdmissionController([render]))
+    render.acquire()                    # a render in progress
+    try:
+        resp = client.post("/api/histogram", json={"filename": filename})
+        assert resp.status_code == 503
+        assert int(resp.headers["Retry-After"]) >= 1
+        assert resp.get_json()["cost_class"] == "render"
+
+        resp = client.post("/api/pixel-view", json={"filename": filename, "x": 0, "y": 0, "size": 4})
+        assert resp.status_code == 200
+    finally:
+        render.release(0.1)
+    assert render.stats()["running"] == 0
+
+
+def test_cache_hits_need_no_slot(client, filename, monkeypatch):
+    from app import main
+
+    compute = admission.CostClass("compute", limit=1, max_queue=0, deadline=1)
+    monkeypatch.setattr(main, "admission_control", admission.AdmissionController([compute]))
+    body = {"image1": filename, "image2": filename}
+    assert client.post("/api/spatial-difference", json=body).status_code == 200
+    compute.acquire()                   # the class is saturated...
+    try:
+        # ...but the result is cached, so nothing is computed or shed
+        assert client.post("/api/spatial-difference", json=body).status_code == 200
+    finally:
+        compute.release(0.1)
+    assert compute.stats()["admitted"] == 2
+    assert compute.stats()["rejected"] == 0
+
+
+def test_identical_renders_share_one_slot(filename, monkeypatch):
+    from app import main
+
+    render = admission.CostClass("render", limit=1, max_queue=0, deadline=1)
+    monkeypatch.setattr(main, "admission_control", admission.AdmissionController([render]))
+    start = threading.Barrier(8)
+    statuses = []
+
+    def request():
+        client = main.app.test_client()
+        start.wait()
+        statuses.append(client.post("/api/histogram", json={"filename": filename}).status_code)
+
+    threads = [threading.Thread(target=request) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert statuses == [200] * 8
+    assert render.stats()["rejected"] == 0
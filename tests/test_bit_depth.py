@@ -0,0 +1,14 @@
+import pytest
+
+
+@pytest.mark.parametrize("bits", [[True], [1, True], [False], [0], [9], [2, 2], [], "8", [1.0]])
+def test_invalid_bits_are_rejected(client, filename, bits):
+    resp = client.post("/api/bit-depth", json={"filename": filename, "bits": bits})
+    assert resp.status_code == 400
+    assert "'bits'" in resp.get_json()["error"]
+
+
+def test_valid_bits(client, filename):
+    resp = client.post("/api/bit-depth", json={"filename": filename, "bits": [1, 8],
+                                              "renderer": "raster"})
+    assert resp.status_code == 200
@@ -0,0 +1,89 @@
+import base64
+
+import cv2
+import numpy as np
+import pytest
+
+from app.blob_store import URL_PREFIX, BlobStore, sniff_extension
+
+
+def b64_image(ext, side=32):
+    img = np.arange(side * side, dtype=np.uint8).reshape(side, side)
+    ok, buf = cv2.imencode(f".{ext}", img)
+    assert ok
+    return base64.b64encode(buf.tobytes()).decode("ascii")
+
+
+@pytest.mark.parametrize("ext", ["png", "jpg", "webp"])
+def test_sniff_extension(ext):
+    assert sniff_extension(b64_image(ext)) == ext
+
+
+@pytest.mark.parametrize("value", [
+    "",
+    "a short caption",
+    base64.b64encode(b"GIF89a" + bytes(100)).decode(),
+    "not base64 at all, but long enough to be looked at " * 2,
+])
+def test_sniff_rejects_non_images(value):
+    assert sniff_extension(value) is None
+
+
+def test_to_refs_round_trip(tmp_path):
+    store = BlobStore(tmp_path, max_bytes=1 << 20)
+    png, webp = b64_image("png"), b64_image("webp")
+    body = {
+        "image": png,
+        "results": [{"plot": webp, "title": "x" * 100}, {"plot": png}],
+        "stats": {"mean": 1.5, "count": 3, "ok": True, "none": None},
+    }
+    refs = store.to_refs(body)
+
+    assert refs["stats"] == body["stats"]
+    assert refs["results"][0]["title"] == "x" * 100
+    assert refs["image"] == refs["results"][1]["plot"]      # stored once
+    for url, original, ext in [(refs["image"], png, "png"),
+                               (refs["results"][0]["plot"], webp, "webp")]:
+        assert url.startswith(URL_PREFIX)
+        assert url.endswith(f".{ext}")
+        assert store.path(url[len(URL_PREFIX):]).read_bytes() == base64.b64decode(original)
+    assert body["image"] == png                             # input untouched
+    assert len(list(tmp_path.glob("*/*"))) == 2
+
+
+def test_refs_survive_a_deleted_blob(tmp_path):
+    store = BlobStore(tmp_path, max_bytes=1 << 20)
+    png = b64_image("png")
+    url = store.ref(png)
+    path = store.path(url[len(URL_PREFIX):])
+    path.unlink()
+    assert store.ref(png) == url
+    assert path.exists()
+
+
+def test_path_rejects_bad_names(tmp_path):
+    store = BlobStore(tmp_path, max_bytes=1 << 20)
+    assert store.path("../../etc/passwd") is None
+    assert store.path("0" * 64 + ".gif") is None
+    assert store.path("0" * 64 + ".png") == tmp_path / "00" / ("0" * 64 + ".png")
+
+
+def test_prune_keeps_the_store_within_budget(tmp_path):
+    store = BlobStore(tmp_path, max_bytes=3000)
+    store.PRUNE_EVERY = 1
+    for side in range(40, 60):
+        store.ref(b64_image("png", side))
+    assert sum(p.stat().st_size for p in tmp_path.glob("*/*")) <= 3000
+
+
+def test_blob_endpoint_serves_refs(client, filename):
+    url = client.get(f"/api/image/{filename}?refs=1").get_json()["image"]
+    inline = client.get(f"/api/image/{filename}").get_json()["image"]
+    resp = client.get(url)
+    assert resp.status_code == 200
+    assert resp.mimetype == "image/png"
+    assert resp.data == base64.b64decode(inline)
+    assert resp.cache_control.immutable
+    assert client.get(url, headers={"If-None-Match": resp.get_etag()[0]}).status_code == 304
+    assert client.get(URL_PREFIX + "0" * 64 + ".png").status_code == 404
+    assert client.get(URL_PREFIX + "nothex.png").status_code == 404
@@ -0,0 +1,84 @@
+import threading
+import time
+
+import pytest
+
+from app.cache import LRUCache, SingleFlight
+from app.result_cache import ResultCache, make_key
+
+
+def test_lru_evicts_least_recently_used_within_budget():
+    cache = LRUCache(10)
+    cache.put("a", b"xxxx")
+    cache.put("b", b"xxxx")
+    assert cache.get("a") == b"xxxx"          # "b" is now the oldest
+    cache.put("c", b"xxxx")
+    assert "b" not in cache
+    assert "a" in cache and "c" in cache
+    assert cache.stats()["bytes"] == 8
+    assert cache.stats()["evictions"] == 1
+
+
+def test_lru_never_stores_values_larger_than_the_budget():
+    cache = LRUCache(4)
+    cache.put("a", b"xx")
+    cache.put("a", b"xxxxxxxx")
+    assert "a" not in cache
+    assert cache.stats()["bytes"] == 0
+
+
+def test_single_flight_shares_one_computation():
+    flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        release.wait(5)
+        return "result"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(flight.do("k", compute)))
+               for _ in range(5)]
+    for t in threads:
+        t.start()
+    while flight.stats()["absorbed_total"] < 4:
+        time.sleep(0.001)
+    release.set()
+    for t in threads:
+        t.join()
+    assert results == ["result"] * 5
+    assert len(calls) == 1
+    assert flight.stats()["in_flight"] == 0
+
+
+def test_single_flight_shares_the_exception():
+    flight = SingleFlight()
+    with pytest.raises(ValueError):
+        flight.do("k", lambda: (_ for _ in ()).throw(ValueError("bad")))
+    # Nothing is kept: the next call computes again
+    assert flight.do("k", lambda: 1) == 1
+
+
+def test_result_cache_disk_tier_is_shared(tmp_path):
+    key = make_key("histogram", 3, "abc")
+    ResultCache(1024, tmp_path, 1 << 20).put(key, {"plot": "x"})
+    other = ResultCache(1024, tmp_path, 1 << 20)      # another worker
+    assert other.get(key) == {"plot": "x"}
+    assert other.stats()["disk_hits"] == 1
+    assert other.get(key) == {"plot": "x"}            # now from memory
+    assert other.stats()["disk_hits"] == 1
+
+
+def test_result_cache_prunes_the_disk_tier(tmp_path):
+    cache = ResultCache(0, tmp_path, 2000)
+    cache.PRUNE_EVERY = 1
+    for i in range(20):
+        cache.put(make_key(i), {"value": "x" * 200})
+    total = sum(p.stat().st_size for p in tmp_path.glob("*/*.json"))
+    assert total <= 2000
+
+
+def test_make_key_is_stable_and_distinct():
+    assert make_key("a", 1) == make_key("a", 1)
+    assert make_key("a", 1) != make_key("a", 2)
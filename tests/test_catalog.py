@@ -0,0 +1,160 @@
+import hashlib
+import os
+import struct
+
+import cv2
+import numpy as np
+import pytest
+
+from app.catalog import ImageCatalog, read_tiff_header
+from app.image_processor import IMAGES_DIR
+
+
+def write_big_endian_tiff(path, img):
+    """Write *img* (2-D uint8 or uint16) as an uncompressed Motorola-order TIFF."""
+    height, width = img.shape
+    data = img.astype(img.dtype.newbyteorder('>')).tobytes()
+    tags = [                        # (tag, type, value); 3 = SHORT, 4 = LONG
+        (256, 4, width),
+        (257, 4, height),
+        (258, 3, img.dtype.itemsize * 8),
+        (259, 3, 1),                # no compression
+        (262, 3, 1),                # black is zero
+        (273, 4, 0),                # strip offset, patched below
+        (277, 3, 1),
+        (278, 4, height),
+        (279, 4, len(data)),
+    ]
+    ifd_size = 2 + 12 * len(tags) + 4
+    data_offset = 8 + ifd_size
+    ifd = struct.pack('>H', len(tags))
+    for tag, ftype, value in tags:
+        value = data_offset if tag == 273 else value
+        packed = struct.pack('>H', value) + b'\0\0' if ftype == 3 else struct.pack('>I', value)
+        ifd += struct.pack('>HHI', tag, ftype, 1) + packed
+    with open(path, 'wb') as f:
+        f.write(b'MM' + struct.pack('>HI', 42, 8) + ifd + b'\0\0\0\0' + data)
+
+
+def gradient(dtype, shape=(37, 53)):
+    top = np.iinfo(dtype).max
+    return (np.arange(np.prod(shape)).reshape(shape) * top // (np.prod(shape) - 1)).astype(dtype)
+
+
+def assert_header_matches_opencv(path):
+    header = read_tiff_header(path)
+    img = cv2.imread(str(path), cv2.IMREAD_UNCHANGED)
+    assert img is not None
+    assert (header["height"], header["width"]) == img.shape[:2]
+    assert header["bit_depth"] == img.dtype.itemsize * 8
+    assert header["samples_per_pixel"] == (1 if img.ndim == 2 else img.shape[2])
+    return header, img
+
+
+@pytest.mark.parametrize("dtype", [np.uint8, np.uint16])
+def test_little_endian_header(tmp_path, dtype):
+    path = tmp_path / "le.tif"
+    cv2.imwrite(str(path), gradient(dtype))
+    assert path.read_bytes()[:2] == b'II'
+    assert_header_matches_opencv(path)
+
+
+@pytest.mark.parametrize("dtype", [np.uint8, np.uint16])
+def test_big_endian_header(tmp_path, dtype):
+    path = tmp_path / "be.tif"
+    write_big_endian_tiff(path, gradient(dtype))
+    header, img = assert_header_matches_opencv(path)
+    assert header["compression"] == "none"
+    np.testing.assert_array_equal(img, gradient(dtype))
+
+
+def test_dataset_headers():
+    for path in sorted(IMAGES_DIR.glob("*.tif")):
+        assert_header_matches_opencv(path)
+
+
+@pytest.mark.parametrize("content", [
+    b"",
+    b"II*\0",                               # header cut short
+    b"MM\0*\0\0\0\x08\0\x05",               # IFD cut short
+    b"II+\0\x08\0\0\0\x10\0\0\0\0\0\0\0",   # BigTIFF with no IFD
+    b"\x89PNG\r\n\x1a\n" + bytes(64),
+    b"II\x2b\x2b" + bytes(64),              # bad magic
+])
+def test_unreadable_headers(tmp_path, content):
+    path = tmp_path / "bad.tif"
+    path.write_bytes(content)
+    assert read_tiff_header(path) is None
+
+
+def test_truncated_pixels_keep_their_header(tmp_path):
+    # The header is read without decoding, so only the IFD has to be intact
+    path = tmp_path / "cut.tif"
+    write_big_endian_tiff(path, gradient(np.uint8, (200, 300)))
+    path.write_bytes(path.read_bytes()[:-1000])
+    header = read_tiff_header(path)
+    assert (header["width"], header["height"]) == (300, 200)
+
+
+@pytest.fixture
+def catalog(tmp_path):
+    images = tmp_path / "images"
+    images.mkdir()
+    cv2.imwrite(str(images / "a.tif"), gradient(np.uint8))
+    write_big_endian_tiff(images / "b.tif", gradient(np.uint16))
+    (images / "broken.tif").write_bytes(b"not a tiff")
+    return ImageCatalog(images, tmp_path / "catalog.json", refresh_interval=0)
+
+
+def test_entries_and_hashes(catalog):
+    entries = catalog.entries()
+    assert set(entries) == {"a.tif", "b.tif"}
+    for name, entry in entries.items():
+        path = catalog.images_dir / name
+        assert entry["sha256"] == hashlib.sha256(path.read_bytes()).hexdigest()
+        assert entry["size"] == path.stat().st_size
+    assert entries["b.tif"]["bit_depth"] == 16
+    assert catalog.get("broken.tif") is None
+    assert catalog.get("missing.tif") is None
+
+    # A new worker lists the dataset from the manifest
+    warm = ImageCatalog(catalog.images_dir, catalog.manifest_path)
+    assert warm.entries() == entries
+
+
+def test_unchanged_directory_keeps_the_same_entries(catalog):
+    entries = catalog.entries()
+    assert catalog.entries() is entries
+    assert catalog.get("a.tif") is entries["a.tif"]
+    assert catalog.entries() is entries
+
+    cv2.imwrite(str(catalog.images_dir / "c.tif"), gradient(np.uint8, (5, 5)))
+    changed = catalog.entries()
+    assert changed is not entries
+    assert set(changed) == {"a.tif", "b.tif", "c.tif"}
+
+
+def test_replaced_file_is_rehashed(catalog):
+    catalog.refresh_interval = 3600
+    old = catalog.get("a.tif")
+    path = catalog.images_dir / "a.tif"
+    cv2.imwrite(str(path), gradient(np.uint8, (9, 9)))
+    os.utime(path, ns=(old["mtime_ns"] + 10**9,) * 2)
+    new = catalog.get("a.tif")
+    assert new["sha256"] == hashlib.sha256(path.read_bytes()).hexdigest()
+    assert new["sha256"] != old["sha256"]
+
+
+def test_unknown_names_wait_for_the_next_refresh(catalog, monkeypatch):
+    catalog.refresh_interval = 3600
+    catalog.entries()
+    scans = []
+    monkeypatch.setattr(catalog, "_refresh", lambda: scans.append(1))
+    for _ in range(10):
+        assert catalog.get("broken.tif") is None
+        assert catalog.get("../catalog.json") is None
+    assert scans == []
+
+    catalog.refresh_interval = 0
+    catalog.get("broken.tif")
+    assert scans == [1]
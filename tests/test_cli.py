@@ -0,0 +1,36 @@
+"""The command-line tools run to completion and exit."""
+
+import json
+import os
+import subprocess
+import sys
+
+from conftest import ROOT
+
+CLI_TIMEOUT = 300
+
+
+def run_module(module, *args, **env):
+    return subprocess.run([sys.executable, "-m", module, *args], cwd=ROOT,
+                          capture_output=True, text=True, timeout=CLI_TIMEOUT,
+                          env=dict(os.environ, **env))
+
+
+def test_benchmark_exits(tmp_path):
+    out = tmp_path / "bench.json"
+    proc = run_module("app.benchmark", "--no-dataset", "--sizes", "256", "--repeat", "1",
+                      "--only", "histogram|comparison", "--out", str(out),
+                      DIP_RENDER_PROCESSES="2")
+    assert proc.returncode == 0, proc.stderr
+    cases = json.loads(out.read_text())["cases"]
+    assert any(name.startswith("generate_histogram") for name in cases)
+
+
+def test_loadtest_exits(tmp_path):
+    out = tmp_path / "load.json"
+    proc = run_module("app.loadtest", "--configs", "1x4:gthread", "--users", "2",
+                      "--duration", "2", "--warmup", "0", "--out", str(out))
+    assert proc.returncode == 0, proc.stderr
+    config, = json.loads(out.read_text())["configs"]
+    assert config["requests"] > 0
+    assert config["errors"] == 0
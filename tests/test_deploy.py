@@ -0,0 +1,72 @@
+"""The deploy script installs the repository's nginx and gunicorn configs."""
+
+import re
+
+from conftest import ROOT
+
+AUTOCONFIG = (ROOT / "autoconfig.sh").read_text()
+NGINX_SITE = (ROOT / "deploy" / "nginx-site.conf").read_text()
+
+
+def locations(conf):
+    """Map each ``location`` of an nginx config to its block body."""
+    return {match.group(1).strip(): match.group(2)
+            for match in re.finditer(r"location\s+([^{]+)\{([^}]*)\}", conf)}
+
+
+def test_autoconfig_installs_the_repository_configs():
+    assert "deploy/nginx-site.conf" in AUTOCONFIG
+    assert "NGINX_EOF" not in AUTOCONFIG
+    assert "GUNICORN_EOF" not in AUTOCONFIG
+    assert "-c gunicorn.conf.py" in AUTOCONFIG
+
+
+def test_metrics_are_local_only():
+    block = locations(NGINX_SITE)["= /metrics"]
+    assert "allow 127.0.0.1;" in block
+    assert "deny all;" in block
+
+
+def test_precomputed_files_are_served_by_nginx():
+    blocks = locations(NGINX_SITE)
+    for location in ("/precomputed/", "/_precomputed/"):
+        assert "alias /opt/dip-practical/.cache/precomputed/;" in blocks[location]
+    assert "internal;" in blocks["/_precomputed/"]
+    # The app hands precomputed responses to that internal location
+    assert "DIP_PRECOMPUTED_ACCEL=/_precomputed/" in AUTOCONFIG
+    assert "app.precompute" in AUTOCONFIG
+
+
+def edge_cached(path):
+    """The ``proxy_cache_valid`` of the regex/prefix location serving *path*."""
+    for location, block in locations(NGINX_SITE).items():
+        modifier, _, pattern = location.partition(" ")
+        if (modifier == "~" and re.search(pattern, path)) or \
+                (modifier == "^~" and path.startswith(pattern)):
+            if "proxy_cache dip_cache;" in block:
+                return re.search(r"proxy_cache_valid 200 (\S+);", block).group(1)
+    return None
+
+
+def test_pixel_tiles_are_edge_cached(client, filename):
+    assert edge_cached(f"/api/tile/0/0/{filename}") == "7d"
+    resp = client.get(f"/api/tile/0/0/{filename}")
+    assert resp.status_code == 200
+    assert resp.cache_control.public
+    assert resp.cache_control.max_age == 7 * 24 * 3600
+
+
+def test_pyramids_and_heightmaps_are_edge_cached(client, filename):
+    assert edge_cached(f"/api/pyramid/0/0/0/{filename}") == "7d"
+    assert edge_cached(f"/api/pyramid/1/{filename}") == "7d"
+    assert edge_cached(f"/api/heightmap/{filename}") == "7d"
+    assert edge_cached(f"/api/pyramid-info/{filename}") is None
+    for path in (f"/api/pyramid/0/0/0/{filename}", f"/api/heightmap/{filename}?size=32"):
+        resp = client.get(path)
+        assert resp.status_code == 200
+        assert resp.cache_control.public
+        assert resp.cache_control.max_age == 7 * 24 * 3600
+
+
+def test_blobs_are_edge_cached():
+    assert edge_cached("/api/blob/" + "0" * 64 + ".png") == "30d"
@@ -0,0 +1,90 @@
+import base64
+
+import cv2
+import numpy as np
+import pytest
+from werkzeug.datastructures import MIMEAccept
+
+from app import encoding
+
+
+@pytest.mark.parametrize("fmt, quality, expected", [
+    ("png", None, encoding.PNG),
+    ("jpg", None, encoding.Encoding("jpeg", 90)),
+    ("webp", None, encoding.Encoding("webp", None)),
+    ("webp", "preview", encoding.Encoding("webp", 75)),
+    ("webp", "lossless", encoding.Encoding("webp", None)),
+    ("jpeg", "60", encoding.Encoding("jpeg", 60)),
+    ("png", 9, encoding.Encoding("png", 9)),
+])
+def test_parse(fmt, quality, expected):
+    assert encoding.parse(fmt, quality) == expected
+
+
+@pytest.mark.parametrize("fmt, quality", [
+    ("gif", None), ("png", 10), ("jpeg", 0), ("jpeg", "lossless"), ("png", "preview"),
+])
+def test_parse_rejects_bad_input(fmt, quality):
+    with pytest.raises(ValueError):
+        encoding.parse(fmt, quality)
+
+
+def test_negotiate_needs_an_explicit_accept():
+    webp = MIMEAccept([("image/webp", 1), ("*/*", 0.8)])
+    assert encoding.negotiate(webp, ["webp"]) == encoding.Encoding("webp", None)
+    assert encoding.negotiate(MIMEAccept([("*/*", 1)]), ["webp"]) == encoding.PNG
+    assert encoding.negotiate(webp, []) == encoding.PNG
+
+
+@pytest.mark.parametrize("enc", [encoding.PNG, encoding.Encoding("webp", None),
+                                 encoding.Encoding("jpeg", 90)])
+def test_encode_array_round_trip_and_log(enc):
+    img = np.arange(64 * 64, dtype=np.uint8).reshape(64, 64)
+    log = encoding.start_log()
+    data = encoding.encode_array(img, encoding=enc)
+    decoded = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_GRAYSCALE)
+    assert decoded.shape == img.shape
+    if enc.lossless:
+        assert np.array_equal(decoded, img)
+    assert log == [(enc.token, len(data), log[0][2])]
+
+
+def test_result_keys_depend_on_the_encoding(filename):
+    from app.image_processor import result_key
+
+    png = result_key("histogram", (filename,))
+    token = encoding.use(encoding.Encoding("webp", None))
+    try:
+        webp = result_key("histogram", (filename,))
+    finally:
+        encoding.reset(token)
+    assert png != webp
+    assert result_key("histogram", (filename,)) == png
+
+
+def test_image_bin_negotiates_from_accept(client, filename):
+    resp = client.get(f"/api/image-bin/{filename}", headers={"Accept": "image/webp,*/*"})
+    assert resp.status_code == 200
+    assert resp.mimetype == "image/webp"
+    assert "Accept" in resp.headers["Vary"]
+    assert resp.headers["X-Encode-Format"] == "webp"
+
+    resp = client.get(f"/api/image-bin/{filename}?format=bogus")
+    assert resp.status_code == 400
+
+
+@pytest.mark.parametrize("fmt, magic", [("webp", b"RIFF"), ("jpeg", b"\xff\xd8\xff")])
+def test_json_images_name_their_format(client, filename, fmt, magic):
+    png = client.post("/api/histogram", json={"filename": filename}).get_json()
+    assert "format" not in png
+    assert base64.b64decode(png["histogram"]).startswith(b"\x89PNG")
+
+    body = client.post("/api/histogram", json={"filename": filename, "format": fmt}).get_json()
+    assert body["format"] == fmt
+    assert base64.b64decode(body["histogram"]).startswith(magic)
+
+    body = client.post("/api/batch", json={
+        "image1": filename, "image2": filename, "format": fmt,
+        "operations": [{"op": "spatial-difference"}]}).get_json()
+    assert body["format"] == fmt
+    assert base64.b64decode(body["results"][0]["result"]["difference"]).startswith(magic)
@@ -0,0 +1,144 @@
+"""
+The figure templates draw the same plots as building each figure anew.
+
+The references below are the original one-figure-per-request renderers
+(on ``Figure`` rather than pyplot); a template must produce an image of
+the same size with the same pixels, whatever shape of image it drew
+before.
+"""
+
+import base64
+import io
+
+import cv2
+import numpy as np
+import pytest
+
+from app import image_processor
+from app.figure_pool import BitDepthTemplate, ComparisonTemplate
+
+# Square, tall and wide images, then square again (a remembered layout)
+PAIRS = [
+    ("Fig0222(b)(cameraman).tif", "Fig0222(a)(face).tif"),
+    ("Fig0232(a)(partial_body_scan).tif", "Fig0229(a)(tungsten_filament_shaded).tif"),
+    ("Fig0230(a)(dental_xray).tif", "Fig0230(b)(dental_xray_mask).tif"),
+    ("Fig0222(b)(cameraman).tif", "Fig0222(a)(face).tif"),
+]
+
+
+def new_figure(figsize):
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=figsize)
+    FigureCanvasAgg(fig)
+    return fig
+
+
+def save(fig):
+    buf = io.BytesIO()
+    fig.savefig(buf, format='png', dpi=120, bbox_inches='tight',
+                facecolor='white', edgecolor='none')
+    return buf.getvalue()
+
+
+def reference_comparison(img1, img2, title1, title2):
+    diff = cv2.absdiff(img1, img2)
+    diff_enhanced = cv2.normalize(diff, None, 0, 255, cv2.NORM_MINMAX) if diff.max() > 0 else diff
+    fig = new_figure((18, 9))
+    axes = fig.subplots(2, 4)
+    fig.suptitle('Spatial Difference Analysis', fontsize=14, fontweight='bold', y=0.98)
+    for ax, img, title, cmap in zip(
+            axes[0], (img1, img2, diff, diff_enhanced),
+            (f'Image 1\n{title1}', f'Image 2\n{title2}',
+             'Absolute Difference\n|Image1 - Image2|', 'Enhanced Difference\n(Heatmap)'),
+            ('gray', 'gray', 'gray', 'hot')):
+        im = ax.imshow(img, cmap=cmap)
+        ax.set_title(title, fontsize=9)
+        ax.axis('off')
+    fig.colorbar(im, ax=axes[0, 3], fraction=0.046, pad=0.04)
+
+    hists = [cv2.calcHist([a], [0], None, [256], [0, 256]) for a in (img1, img2, diff)]
+    colors = ('#3498db', '#e74c3c', '#2ecc71')
+    for ax, hist, color, title in zip(axes[1], hists, colors,
+                                      ('Histogram - Image 1', 'Histogram - Image 2',
+                                       'Histogram - Difference')):
+        ax.plot(hist, color='#2c3e50', linewidth=1)
+        ax.fill_between(range(256), hist.flatten(), alpha=0.3, color=color)
+        ax.set_title(title, fontsize=9)
+        ax.set_xlim([0, 256])
+        ax.grid(True, alpha=0.3)
+    for hist, color, label in zip(hists, colors, ('Image 1', 'Image 2', 'Difference')):
+        axes[1, 3].plot(hist, color=color, linewidth=1, label=label, alpha=0.7)
+    axes[1, 3].set_title('Overlay Comparison', fontsize=9)
+    axes[1, 3].set_xlim([0, 256])
+    axes[1, 3].legend(fontsize=8)
+    axes[1, 3].grid(True, alpha=0.3)
+    fig.tight_layout()
+    return save(fig)
+
+
+def reference_bit_depth(bits, quantised):
+    fig = new_figure((10, 4))
+    axes = fig.subplots(1, 2)
+    axes[0].imshow(quantised, cmap='gray', vmin=0, vmax=255)
+    axes[0].set_title(f'{bits}-bit  ({2 ** bits} levels)', fontsize=11, fontweight='bold')
+    axes[0].axis('off')
+    hist = cv2.calcHist([quantised], [0], None, [256], [0, 256])
+    axes[1].bar(range(256), hist.flatten(), color='#3498db', width=1.0, edgecolor='none')
+    axes[1].set_xlim([0, 256])
+    axes[1].set_xlabel('Pixel Intensity')
+    axes[1].set_ylabel('Frequency')
+    axes[1].set_title(f'Histogram  ({bits}-bit)', fontsize=11)
+    axes[1].grid(True, alpha=0.3)
+    fig.tight_layout()
+    return save(fig)
+
+
+def assert_same_image(png, reference):
+    a = cv2.imdecode(np.frombuffer(png, np.uint8), cv2.IMREAD_COLOR)
+    b = cv2.imdecode(np.frombuffer(reference, np.uint8), cv2.IMREAD_COLOR)
+    assert a.shape == b.shape
+    assert np.abs(a.astype(np.int16) - b).mean() < 0.05
+
+
+def test_comparison_template_matches_the_reference():
+    template = ComparisonTemplate()
+    for filename1, filename2 in PAIRS:
+        img1 = image_processor.load_image(filename1)
+        img2 = image_processor.load_image(filename2)
+        if img2.shape != img1.shape:
+            img2 = cv2.resize(img2, img1.shape[::-1], interpolation=cv2.INTER_AREA)
+        diff = cv2.absdiff(img1, img2)
+        title1 = image_processor._parse_image_name(filename1)
+        title2 = image_processor._parse_image_name(filename2)
+        template.update(title1, title2, img1, img2, diff,
+                        cv2.normalize(diff, None, 0, 255, cv2.NORM_MINMAX),
+                        *(cv2.calcHist([a], [0], None, [256], [0, 256])
+                          for a in (img1, img2, diff)))
+        assert_same_image(template.render(),
+                          reference_comparison(img1, img2, title1, title2))
+    assert len(template._layouts) == 4      # three shapes and the initial one
+
+
+def test_comparison_plot_endpoint_matches_the_reference():
+    filename1, filename2 = PAIRS[1]
+    plot = image_processor._matplotlib_comparison_plot(filename1, filename2)
+    img1 = image_processor.load_image(filename1)
+    img2 = cv2.resize(image_processor.load_image(filename2), img1.shape[::-1],
+                      interpolation=cv2.INTER_AREA)
+    assert_same_image(base64.b64decode(plot), reference_comparison(
+        img1, img2, image_processor._parse_image_name(filename1),
+        image_processor._parse_image_name(filename2)))
+
+
+@pytest.mark.parametrize("bits", [8, 1])
+def test_bit_depth_template_matches_the_reference(bits):
+    template = BitDepthTemplate()
+    for filename in (PAIRS[0][0], PAIRS[1][0], PAIRS[2][0]):
+        img = image_processor.load_image(filename)
+        step = 256 >> bits
+        quantised = img if bits == 8 else cv2.normalize(
+            (img // step) * step, None, 0, 255, cv2.NORM_MINMAX).astype(np.uint8)
+        template.update(bits, quantised, cv2.calcHist([quantised], [0], None, [256], [0, 256]))
+        assert_same_image(template.render(), reference_bit_depth(bits, quantised))
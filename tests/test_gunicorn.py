@@ -0,0 +1,103 @@
+"""Boot gunicorn with the repository's gunicorn.conf.py, as deployments do."""
+
+import contextlib
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+
+import pytest
+
+from conftest import ROOT
+
+BOOT_TIMEOUT = 60
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@contextlib.contextmanager
+def serve(tmp_path, workers=2, **env):
+    """Run gunicorn on a free port; yield ``(base_url, error_log_path)``."""
+    port = _free_port()
+    log = tmp_path / "error.log"
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py",
+         "-w", str(workers), "-b", f"127.0.0.1:{port}",
+         "--access-logfile", "/dev/null", "--error-logfile", str(log),
+         "app.main:app"],
+        cwd=ROOT, env=dict(os.environ, DIP_CACHE_DIR=str(tmp_path / "cache"),
+                           DIP_SHM_DIR=str(tmp_path / "shm"), **env))
+    base = f"http://127.0.0.1:{port}"
+    try:
+        deadline = time.monotonic() + BOOT_TIMEOUT
+        while True:
+            assert proc.poll() is None, log.read_text()
+            try:
+                get(base + "/health")
+                break
+            except OSError:
+                if time.monotonic() > deadline:
+                    pytest.fail("gunicorn did not come up:\n" + log.read_text())
+                time.sleep(0.2)
+        yield base, log
+    finally:
+        proc.send_signal(signal.SIGTERM)
+        proc.wait(timeout=BOOT_TIMEOUT)
+
+
+def get(url):
+    with urllib.request.urlopen(url, timeout=BOOT_TIMEOUT) as resp:
+        return resp.read().decode()
+
+
+def post_json(url, body):
+    req = urllib.request.Request(url, json.dumps(body).encode(),
+                                 {"Content-Type": "application/json"})
+    with urllib.request.urlopen(req, timeout=BOOT_TIMEOUT) as resp:
+        return json.loads(resp.read())
+
+
+def metric(text, name):
+    """Sum of the samples of *name* in a Prometheus exposition."""
+    return sum(float(line.rsplit(" ", 1)[1]) for line in text.splitlines()
+               if line.startswith(name + " ") or line.startswith(name + "{"))
+
+
+def test_server_hooks_run(tmp_path):
+    # A snapshot left over from a previous run must not be summed in
+    stale = tmp_path / "cache" / "metrics"
+    stale.mkdir(parents=True)
+    (stale / "retired.json").write_text(json.dumps({
+        "counters": {"dip_http_requests_total|endpoint=health,method=GET,status=200": 1000},
+        "gauges": {}, "histograms": {}, "buckets": {}}))
+
+    with serve(tmp_path, workers=2, DIP_SHM_STORE="1") as (base, log):
+        get(base + "/api/images")
+        text = get(base + "/metrics")
+        assert metric(text, "dip_worker_boot_seconds_count") == 2
+        assert metric(text, "dip_http_requests_total") < 1000
+        assert "Shared image store" in log.read_text()
+        assert "gthread" in log.read_text()
+
+
+@pytest.mark.parametrize("preload", ["1", "0"])
+def test_render_pool_under_preload(tmp_path, preload):
+    # Workers forked from a master that imported matplotlib still start
+    # the forkserver render pool (with its own preload) and render in it
+    with serve(tmp_path, workers=1, DIP_PRELOAD=preload,
+               DIP_RENDER_PROCESSES="1") as (base, log):
+        filename = json.loads(get(base + "/api/images"))["images"][0]["filename"]
+        body = post_json(base + "/api/histogram", {"filename": filename})
+        assert body["histogram"]
+        assert json.loads(get(base + "/api/render-pool"))["completed"] == 1
+        boot_log = log.read_text()
+        assert ("Plotting stack warmed" in boot_log) == (preload == "1")
+        assert ("(preloaded)" if preload == "1" else "(imported)") in boot_log
@@ -0,0 +1,105 @@
+import json
+import threading
+import time
+
+from app.jobs import JobQueue
+
+
+def make_queue(job_dir, stale_after=300):
+    return JobQueue(job_dir, ttl=60, threads=2, stale_after=stale_after)
+
+
+def wait_for(queue, job_id, state, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = queue.status(job_id)
+        if job is not None and job["state"] == state:
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"job {job_id} never reached {state}: {queue.status(job_id)}")
+
+
+def test_submit_runs_and_keeps_the_result(tmp_path):
+    queue = make_queue(tmp_path)
+    assert queue.submit("a", "plot", lambda: {"plot": "x"})["state"] == "queued"
+    wait_for(queue, "a", "done")
+    assert json.loads(queue.result("a")) == {"plot": "x"}
+    # A live job is not started twice
+    assert queue.submit("a", "plot", lambda: {"plot": "y"})["state"] == "done"
+    assert json.loads(queue.result("a")) == {"plot": "x"}
+
+
+def test_failed_job_is_started_again(tmp_path):
+    queue = make_queue(tmp_path)
+    queue.submit("a", "plot", lambda: None)
+    assert "error" in wait_for(queue, "a", "failed")
+    queue.submit("a", "plot", lambda: {"plot": "x"})
+    wait_for(queue, "a", "done")
+
+
+def test_one_worker_takes_over_a_stale_job(tmp_path):
+    # Jobs left "running" by a worker that went away
+    old = time.time() - 1000
+    ids = [f"job{i}" for i in range(50)]
+    for job_id in ids:
+        (tmp_path / f"{job_id}.json").write_text(json.dumps(
+            {"id": job_id, "kind": "plot", "state": "running",
+             "created_at": old, "updated_at": old}))
+
+    runs = {job_id: [] for job_id in ids}
+    started = threading.Barrier(8)
+
+    def worker():
+        queue = make_queue(tmp_path)       # one JobQueue per gunicorn worker
+        started.wait()
+        for job_id in ids:
+            queue.submit(job_id, "plot",
+                         lambda job_id=job_id: runs[job_id].append(1) or {"plot": "x"})
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    for job_id in ids:
+        wait_for(make_queue(tmp_path), job_id, "done")
+    assert all(len(r) == 1 for r in runs.values())
+
+
+def test_heartbeat_keeps_a_long_job_live(tmp_path):
+    release = threading.Event()
+    runs = []
+
+    def slow():
+        runs.append(1)
+        release.wait(10)
+        return {"plot": "x"}
+
+    owner = make_queue(tmp_path, stale_after=0.2)
+    owner.submit("a", "plot", slow)
+    time.sleep(0.6)                          # three times stale_after
+    other = make_queue(tmp_path, stale_after=0.2)
+    assert other.submit("a", "plot", slow)["state"] == "running"
+    release.set()
+    wait_for(other, "a", "done")
+    assert len(runs) == 1
+
+
+def test_job_ids_match_the_render_keys(client, filename, monkeypatch):
+    from app import image_processor, main
+
+    keys = []
+    monkeypatch.setattr(image_processor._in_flight, "do",
+                        lambda key, compute, kind: keys.append(key))
+    image_processor.generate_surface_plot(filename, 3, 4, 32)
+    image_processor.generate_comparison_plot(filename, filename)
+    monkeypatch.setattr(main.jobs, "submit", lambda job_id, kind, compute: {
+        "id": job_id, "kind": kind, "state": "running",
+        "created_at": 0, "updated_at": 0})
+
+    resp = client.post("/api/surface-plot", json={
+        "filename": filename, "x": 3, "y": 4, "size": 32, "async": True})
+    assert resp.headers["Location"] == f"/api/jobs/{keys[0]}"
+    resp = client.post("/api/comparison-plot", json={
+        "image1": filename, "image2": filename, "async": True})
+    assert resp.headers["Location"] == f"/api/jobs/{keys[1]}"
@@ -0,0 +1,64 @@
+import json
+import os
+import subprocess
+import sys
+
+from conftest import ROOT
+
+MANIFEST_TIMEOUT = 300
+
+
+def run_precompute(out_dir, cache_dir, **env):
+    """Run ``python -m app.precompute`` as deployments do; return the process."""
+    return subprocess.run(
+        [sys.executable, "-m", "app.precompute", "--jobs", "2", "--out", str(out_dir)],
+        cwd=ROOT, capture_output=True, text=True, timeout=MANIFEST_TIMEOUT,
+        env=dict(os.environ, DIP_CACHE_DIR=str(cache_dir), **env))
+
+
+def test_precompute_writes_manifest(tmp_path):
+    # A configured render pool must not keep the precompute workers alive
+    proc = run_precompute(tmp_path / "out", tmp_path / "cache", DIP_RENDER_PROCESSES="2")
+    assert proc.returncode == 0, proc.stderr
+
+    manifest = json.loads((tmp_path / "out" / "manifest.json").read_text())
+    artifacts = manifest["artifacts"]
+    assert artifacts
+    for entry in artifacts.values():
+        assert (tmp_path / "out" / entry["json"]).exists()
+        assert (tmp_path / "out" / (entry["json"] + ".gz")).exists()
+
+
+def test_artifacts_are_keyed_by_renderer(tmp_path, monkeypatch):
+    from app import image_processor, precompute
+
+    filename = image_processor.get_available_images()[0]["filename"]
+    monkeypatch.setattr(image_processor, "PLOT_RENDERER", "raster")
+    key, entry = precompute.render_artifact("histogram", (filename,), str(tmp_path))
+    precompute.write_manifest(tmp_path, {key: entry})
+
+    store = precompute.PrecomputedStore(tmp_path)
+    assert store.lookup("histogram", (filename,)) == entry["json"]
+    assert store.load("histogram", (filename,))["histogram"]
+
+    pair = (filename, filename)
+    raster_pipeline = precompute.artifact_key("step-by-step", pair)
+    monkeypatch.setattr(image_processor, "PLOT_RENDERER", "matplotlib")
+    assert store.lookup("histogram", (filename,)) is None
+    # Kinds that draw no plot are shared by both renderers
+    assert precompute.artifact_key("step-by-step", pair) == raster_pipeline
+
+
+def test_precomputed_pngs_are_not_served_for_other_formats(client, tmp_path, monkeypatch):
+    from app import image_processor, main, precompute
+
+    filename = image_processor.get_available_images()[0]["filename"]
+    monkeypatch.setattr(image_processor, "PLOT_RENDERER", "raster")
+    key, entry = precompute.render_artifact("histogram", (filename,), str(tmp_path))
+    precompute.write_manifest(tmp_path, {key: entry})
+    monkeypatch.setattr(main, "precomputed", precompute.PrecomputedStore(tmp_path))
+
+    resp = client.post("/api/histogram", json={"filename": filename})
+    assert resp.data == (tmp_path / entry["json"]).read_bytes()
+    resp = client.post("/api/histogram", json={"filename": filename, "format": "webp"})
+    assert resp.get_json()["format"] == "webp"
@@ -0,0 +1,33 @@
+import pytest
+
+from app import main, profiling
+
+
+@pytest.fixture
+def profiler(monkeypatch):
+    """Install a profiler with the given token (sampling on, app unwrapped)."""
+    def install(token):
+        middleware = profiling.ProfilingMiddleware(None, main.profiles, token, 0.5)
+        monkeypatch.setattr(main, "profiler", middleware)
+        monkeypatch.setattr(main, "PROFILE_TOKEN", token)
+    return install
+
+
+def test_captures_need_profiling(client):
+    assert main.profiler is None
+    assert client.get("/api/profiles").status_code == 404
+
+
+def test_sampling_alone_serves_no_captures(client, profiler):
+    profiler(None)
+    assert client.get("/api/profiles").status_code == 404
+    assert client.get("/api/profiles?profile=").status_code == 404
+    assert client.get("/api/profiles/x.json").status_code == 404
+
+
+def test_captures_need_the_token(client, profiler):
+    profiler("s3cret")
+    assert client.get("/api/profiles").status_code == 404
+    assert client.get("/api/profiles", headers={"X-Profile": "wrong"}).status_code == 404
+    assert client.get("/api/profiles", headers={"X-Profile": "s3cret"}).status_code == 200
+    assert client.get("/api/profiles?profile=s3cret").status_code == 200
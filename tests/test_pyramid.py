@@ -0,0 +1,83 @@
+import cv2
+import numpy as np
+import pytest
+
+from app.pyramid import ImagePyramid, level_shapes, lod_level
+
+
+def test_level_shapes_halve_rounding_up_to_one_tile():
+    assert level_shapes(1000, 600, 256) == [(1000, 600), (500, 300), (250, 150)]
+    assert level_shapes(257, 3, 256) == [(257, 3), (129, 2)]
+    assert level_shapes(256, 256, 256) == [(256, 256)]
+
+
+def test_levels_match_pyrdown_sizes():
+    img = np.random.default_rng(0).integers(0, 256, (601, 333), dtype=np.uint8)
+    pyramid = ImagePyramid(img, tile_size=64)
+    assert pyramid.levels[0] is img
+    level = img
+    for n in range(1, len(pyramid.levels)):
+        level = cv2.pyrDown(level)
+        assert pyramid.level(n).shape == level.shape
+    assert len(pyramid.levels) == 5
+    assert max(pyramid.levels[-1].shape) <= 64
+    assert pyramid.nbytes == sum(lv.nbytes for lv in pyramid.levels[1:])
+
+
+@pytest.mark.parametrize("n, x, y, shape", [
+    (0, 0, 0, (64, 64)),
+    (0, 5, 0, (64, 13)),        # 333 = 5 * 64 + 13
+    (0, 0, 9, (25, 64)),        # 601 = 9 * 64 + 25
+    (0, 5, 9, (25, 13)),
+    (1, 2, 4, (45, 39)),        # level 1 is 301 x 167
+])
+def test_edge_tiles_are_cropped(n, x, y, shape):
+    img = np.random.default_rng(0).integers(0, 256, (601, 333), dtype=np.uint8)
+    pyramid = ImagePyramid(img, tile_size=64)
+    tile = pyramid.tile(n, x, y)
+    assert tile.shape == shape
+    np.testing.assert_array_equal(tile, pyramid.level(n)[y * 64:, x * 64:][:shape[0], :shape[1]])
+
+
+def test_info_counts_partial_tiles():
+    pyramid = ImagePyramid(np.zeros((601, 333), np.uint8), tile_size=64)
+    levels = pyramid.info()["levels"]
+    assert (levels[0]["tiles_x"], levels[0]["tiles_y"]) == (6, 10)
+    assert (levels[-1]["tiles_x"], levels[-1]["tiles_y"]) == (1, 1)
+
+
+@pytest.mark.parametrize("n, x, y", [(0, 6, 0), (0, 0, 10), (0, -1, 0), (5, 0, 0), (-1, 0, 0)])
+def test_tiles_out_of_range(n, x, y):
+    pyramid = ImagePyramid(np.zeros((601, 333), np.uint8), tile_size=64)
+    assert pyramid.tile(n, x, y) is None
+
+
+def test_region_rounds_outwards():
+    img = np.arange(100 * 100, dtype=np.uint8).reshape(100, 100)
+    pyramid = ImagePyramid(img, tile_size=16)
+    assert pyramid.region(0, 10, 20, 30, 50).shape == (30, 20)
+    # [5, 11) at level 1 covers samples 2..5
+    assert pyramid.region(1, 5, 5, 11, 11).shape == (4, 4)
+
+
+def test_lod_level():
+    assert lod_level(256, 100, 256) == 0
+    assert lod_level(257, 100, 256) == 1
+    assert lod_level(100, 1024, 256) == 2
+    assert lod_level(1025, 1025, 256) == 3
+
+
+def test_pyramid_endpoints(client, filename):
+    info = client.get(f"/api/pyramid-info/{filename}").get_json()
+    last = info["levels"][-1]
+    assert info["levels"][0]["width"] == info["width"]
+    assert (last["tiles_x"], last["tiles_y"]) == (1, 1)
+
+    resp = client.get(f"/api/pyramid/{last['level']}/0/0/{filename}")
+    assert resp.status_code == 200
+    tile = cv2.imdecode(np.frombuffer(resp.data, np.uint8), cv2.IMREAD_UNCHANGED)
+    assert tile.shape[:2] == (last["height"], last["width"])
+
+    assert client.get(f"/api/pyramid/{last['level'] + 1}/{filename}").status_code == 404
+    assert client.get(f"/api/pyramid/0/{info['levels'][0]['tiles_x']}/0/{filename}").status_code == 404
+    assert client.get("/api/pyramid/0/0/0/missing.tif").status_code == 404
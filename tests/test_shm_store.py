@@ -0,0 +1,32 @@
+import logging
+
+import cv2
+import numpy as np
+
+from app import image_processor
+from app.shm_store import SharedImageStore, build
+
+
+def test_store_round_trip(tmp_path):
+    images = tmp_path / "images"
+    images.mkdir()
+    img = np.arange(48 * 80, dtype=np.uint8).reshape(48, 80)
+    cv2.imwrite(str(images / "a.tif"), img)
+    index = build(images, tmp_path / "store")
+    assert set(index["images"]) == {"a.tif"}
+
+    stat = (images / "a.tif").stat()
+    view = SharedImageStore(tmp_path / "store").get("a.tif", (stat.st_mtime_ns, stat.st_size))
+    np.testing.assert_array_equal(view, img)
+    assert not view.flags.writeable
+    assert build(images, tmp_path / "store")["data"] == index["data"]   # still current
+
+
+def test_unwritable_store_does_not_stop_the_server(tmp_path, monkeypatch, caplog):
+    blocker = tmp_path / "not-a-dir"
+    blocker.write_text("")
+    monkeypatch.setattr(image_processor, "SHM_STORE_ENABLED", True)
+    monkeypatch.setattr(image_processor, "SHM_STORE_DIR", blocker / "store")
+    with caplog.at_level(logging.WARNING, logger="app.image_processor"):
+        assert image_processor.build_shared_store() is None
+    assert "Shared image store not built" in caplog.text
@@ -0,0 +1,88 @@
+import gc
+
+import cv2
+import numpy as np
+import pytest
+
+from app import stats
+from app.image_processor import IMAGES_DIR
+
+PERCENTILES = [0, 1, 5, 25, 33.3, 50, 75, 95, 99, 99.9, 100]
+
+
+def assert_matches_numpy(arr):
+    # Fresh ArrayStats, not the cache, so every array is really recomputed
+    result = stats.ArrayStats(cv2.calcHist([arr], [0], None, [256], [0, 256]))
+    assert result.count == arr.size
+    assert result.min == arr.min()
+    assert result.max == arr.max()
+    assert result.nonzero == np.count_nonzero(arr)
+    assert result.mean == pytest.approx(np.mean(arr), rel=1e-12, abs=1e-12)
+    assert result.std == pytest.approx(np.std(arr), rel=1e-9, abs=1e-9)
+    for q in PERCENTILES:
+        assert result.percentile(q) == pytest.approx(np.percentile(arr, q), abs=1e-9), q
+
+
+DATASET = sorted(IMAGES_DIR.glob("*.tif"))
+
+
+@pytest.mark.parametrize("path", DATASET, ids=[p.name for p in DATASET])
+def test_dataset_images(path):
+    img = cv2.imread(str(path), cv2.IMREAD_GRAYSCALE)
+    assert_matches_numpy(img)
+    # Derived arrays as the processor builds them: views and differences
+    assert_matches_numpy(img[::3, 1::2])
+    assert_matches_numpy(cv2.absdiff(img, np.ascontiguousarray(img[::-1])))
+
+
+@pytest.mark.parametrize("arr", [
+    np.zeros((17, 9), np.uint8),
+    np.full((17, 9), 255, np.uint8),
+    np.full((1, 1), 128, np.uint8),
+    np.array([[0, 255]], np.uint8),
+    np.random.default_rng(1).integers(0, 256, (301, 177), dtype=np.uint8),
+], ids=["zeros", "saturated", "one-pixel", "extremes", "random"])
+def test_edge_cases(arr):
+    assert_matches_numpy(arr)
+
+
+def test_uniform_image_has_no_spread():
+    result = stats.ArrayStats(cv2.calcHist([np.full((8, 8), 42, np.uint8)],
+                                           [0], None, [256], [0, 256]))
+    assert (result.min, result.max, result.mean, result.std) == (42, 42, 42.0, 0.0)
+    assert all(result.percentile(q) == 42.0 for q in PERCENTILES)
+
+
+def test_empty_histogram():
+    result = stats.ArrayStats(np.zeros((256, 1), np.float32))
+    assert (result.count, result.min, result.max, result.nonzero) == (0, 0, 0, 0)
+    assert (result.mean, result.std) == (0.0, 0.0)
+    assert result.percentile(50) == 0.0
+
+
+def test_cache_is_keyed_by_array_identity():
+    cache = stats.StatsCache()
+    arr = np.arange(256, dtype=np.uint8).reshape(16, 16)
+    first = cache.get(arr)
+    assert cache.get(arr) is first
+    copy = arr.copy()
+    assert cache.get(copy) is not first
+    assert cache.stats() == {"entries": 2, "hits": 1, "misses": 2}
+    del arr
+    gc.collect()
+    assert cache.stats()["entries"] == 1
+    assert cache.get(copy).mean == first.mean
+
+
+def test_spatial_difference_statistics():
+    from app.image_processor import ImagePair, _compute_spatial_difference
+    first, second = DATASET[0].name, DATASET[1].name
+    pair = ImagePair.load(first, second)
+    diff = pair.difference
+    result = _compute_spatial_difference(first, second, pair)["stats"]
+    assert result["mean_difference"] == pytest.approx(np.mean(diff), rel=1e-12)
+    assert result["std_difference"] == pytest.approx(np.std(diff), rel=1e-9)
+    assert result["nonzero_pixels"] == np.count_nonzero(diff)
+    assert (result["min_difference"], result["max_difference"]) == (diff.min(), diff.max())
+    for q in (50, 95, 99):
+        assert result["percentiles"][f"p{q}"] == pytest.approx(np.percentile(diff, q))